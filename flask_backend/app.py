@@ -1,8 +1,7 @@
 import os
 os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'  # Disable oneDNN to suppress TensorFlow messages
 
-from flask import Flask, request, jsonify, send_from_directory
-import tensorflow as tf
+from flask import Flask, Response, request, jsonify, send_from_directory
 import numpy as np
 import cv2
 from groq import Groq
@@ -11,6 +10,7 @@ from twilio.rest import Client
 import random
 from flask_cors import CORS
 from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 import jwt
@@ -19,16 +19,31 @@ from functools import wraps
 from bson import ObjectId
 import logging
 from dateutil.parser import parse
-from sklearn.linear_model import LogisticRegression
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
 import uuid
 import joblib
-import requests
-import math
-import smtplib
-import jwt
-from email.mime.text import MIMEText
+import threading
+import json
+from retraining import PredictiveRetrainer, label_changed
+from preprocessing import ImagePreprocessor
+from model_registry import ModelRegistry, ModelNotReady
+from rollups import QualityRollups, RESOLUTIONS
+from assignment import OfficerScheduler
+from comments import CommentStore
+from clustering import ClusteringEngine, sample_points
+from flow_jobs import FlowJobRunner, FlowJobError, DashboardCache, points_in_bbox
+from upvotes import UpvoteStore, ALREADY_UPVOTED, REPORT_NOT_FOUND
+from otp_store import create_otp_store, OtpRateLimited, OTP_VALID, OTP_LOCKED
+from ingestion import SensorIngestor, IngestBackpressure, parse_sensor_reading
+from sensors import generate_sensor_data
+from inference import BatchInferenceEngine, load_forward
+from notifications import NotificationOutbox
+from pagination import ListArgs, list_response
+from geocoding import create_geocoder
+from auth_cache import PrincipalCache
+from indexes import IndexManager
+from heatmap import HeatmapStore
+from leaderboard import Leaderboard
+from geo_index import NeighbourhoodSearch, geo_point, ensure_geo_indexes, migrate_geo_locations
 
 # Setup logging
 logging.basicConfig(level=logging.DEBUG)
@@ -79,11 +94,26 @@ try:
     water_quality_collection = db["WaterQualityPredictions"]
     comments_collection = db["report_comments"]
     flow_optimizations_collection = db["FlowOptimizations"]
+    flow_jobs_collection = db["FlowJobs"]
+    notification_outbox_collection = db["NotificationOutbox"]
+    geocode_cache_collection = db["GeocodeCache"]
+    rate_limits_collection = db["RateLimits"]
+    heatmap_tiles_collection = db["HeatmapTiles"]
+    leaderboard_collection = db["Leaderboard"]
+    pending_otps_collection = db["PendingOtps"]
+    report_upvotes_collection = db["ReportUpvotes"]
+    quality_rollups_collection = db["QualityRollups"]
     logger.info("MongoDB connection established")
 except Exception as e:
     logger.error(f"Failed to connect to MongoDB: {str(e)}")
     raise
 
+# Outbox for SMS/email; endpoints enqueue and background workers deliver
+notification_outbox = NotificationOutbox(notification_outbox_collection, client_twilio, twilio_phone)
+
+# Reverse geocoder with a Mongo-persisted cache
+reverse_geocoder = create_geocoder(geocode_cache_collection, rate_limits_collection)
+
 # Initialize Groq client
 try:
     groq_client = Groq(api_key=groq_api_key)
@@ -92,64 +122,66 @@ except Exception as e:
     logger.error(f"Failed to initialize Groq client: {str(e)}")
     raise
 
-# Load TensorFlow model
-model_path = "water_cnn_model.h5"
-if not os.path.exists(model_path):
-    logger.error(f"TensorFlow model file not found at {model_path}")
-    raise FileNotFoundError(f"Model file {model_path} is missing")
-try:
-    water_model = tf.keras.models.load_model(model_path)
-    logger.info("TensorFlow model loaded successfully")
-except Exception as e:
-    logger.error(f"Failed to load TensorFlow model: {str(e)}")
-    raise
-
-# Load water quality prediction model
+# Model loaders; heavy imports and file reads happen on background threads, not at import time
+inference_backend = os.getenv("INFERENCE_BACKEND", "keras")
+model_path = os.getenv("TFLITE_MODEL_PATH", "water_cnn_model.tflite") if inference_backend == "tflite" else "water_cnn_model.h5"
 quality_model_path = "water_quality_model.pkl"
-if not os.path.exists(quality_model_path):
-    logger.error(f"Water quality model file not found at {quality_model_path}")
-    raise FileNotFoundError(f"Model file {quality_model_path} is missing")
-try:
+
+def load_water_cnn():
+    if not os.path.exists(model_path):
+        logger.error(f"Image model file not found at {model_path}")
+        raise FileNotFoundError(f"Model file {model_path} is missing")
+    return load_forward(inference_backend, model_path)
+
+def load_water_quality_model():
+    if not os.path.exists(quality_model_path):
+        logger.error(f"Water quality model file not found at {quality_model_path}")
+        raise FileNotFoundError(f"Model file {quality_model_path} is missing")
     water_quality_model = joblib.load(quality_model_path)
     logger.info("Water quality model loaded successfully")
-except Exception as e:
-    logger.error(f"Failed to load water quality model: {str(e)}")
-    raise
+    return water_quality_model
 
-otp_cache = {}
+def load_predictive_model():
+    predictive_retrainer.train_once()
+    return predictive_retrainer
 
-# Train predictive model
-def train_predictive_model():
-    try:
-        reports = list(water_reports_collection.find({}, {"latitude": 1, "longitude": 1, "status": 1}))
-        if len(reports) < 2:
-            logger.warning("Insufficient reports for model training")
-            return None, None
-        X = [[r["latitude"], r["longitude"]] for r in reports]
-        y = [1 if r["status"] in ["leakage", "pollution", "scarcity"] else 0 for r in reports]
-        if len(set(y)) < 2:
-            logger.warning("Data contains only one class, cannot train model")
-            return None, None
-        scaler = StandardScaler()
-        X_scaled = scaler.fit_transform(X)
-        model = LogisticRegression()
-        model.fit(X_scaled, y)
-        logger.info("Predictive model trained successfully")
-        return model, scaler
-    except Exception as e:
-        logger.error(f"Error training predictive model: {str(e)}")
-        return None, None
+model_registry = ModelRegistry()
+model_registry.register("water_cnn", load_water_cnn, fork_safe=False)
+model_registry.register("water_quality", load_water_quality_model)
+model_registry.register("predictive_maintenance", load_predictive_model)
+
+# Micro-batching inference engine for image classification
+inference_engine = BatchInferenceEngine(lambda batch: model_registry.get("water_cnn")(batch))
+BULK_MAX_IMAGES = int(os.getenv("BULK_MAX_IMAGES", 50))
+image_preprocessor = ImagePreprocessor()
+
+# Predictive maintenance model, swapped atomically by the background retrainer
+predictive_model = None
+scaler = None
+predictive_model_lock = threading.Lock()
 
-# Retrain predictive model
-def retrain_predictive_model():
+def publish_predictive_model(model, model_scaler):
     global predictive_model, scaler
-    predictive_model, scaler = train_predictive_model() or (None, None)
-    if predictive_model:
-        logger.info("Predictive model retrained successfully")
-    else:
-        logger.warning("Predictive model retraining failed")
+    with predictive_model_lock:
+        predictive_model, scaler = model, model_scaler
+
+def get_predictive_model():
+    with predictive_model_lock:
+        return predictive_model, scaler
+
+predictive_retrainer = PredictiveRetrainer(water_reports_collection, publish_predictive_model)
+
+# Required indexes and hot query shapes, created at boot and audited with explain()
+index_manager = IndexManager()
 
-predictive_model, scaler = train_predictive_model() or (None, None)
+# Verified officers/users by token, so authenticated requests skip the Mongo lookup
+principal_cache = PrincipalCache()
+
+index_manager.index(officers_collection, [("email", 1)], unique=True)
+index_manager.index(users_collection, [("phone", 1)], unique=True)
+index_manager.index(users_collection, [("email", 1)])
+index_manager.query("officer_by_email", officers_collection, {"email": ""})
+index_manager.query("user_by_phone", users_collection, {"phone": ""})
 
 # Token verification decorators
 def token_required(f):
@@ -160,11 +192,14 @@ def token_required(f):
             logger.error("Token is missing")
             return jsonify({"error": "Token is missing!"}), 401
         try:
-            data = jwt.decode(token, app.config["SECRET_KEY"], algorithms=["HS256"])
-            current_officer = officers_collection.find_one({"email": data["email"]})
-            if not current_officer:
-                logger.error("Officer not found for token")
-                return jsonify({"error": "Invalid Token!"}), 401
+            current_officer = principal_cache.get(token)
+            if current_officer is None:
+                data = jwt.decode(token, app.config["SECRET_KEY"], algorithms=["HS256"])
+                current_officer = officers_collection.find_one({"email": data["email"]})
+                if not current_officer:
+                    logger.error("Officer not found for token")
+                    return jsonify({"error": "Invalid Token!"}), 401
+                principal_cache.put(token, "officer", data["email"], current_officer, data["exp"])
         except Exception as e:
             logger.error(f"Invalid Token: {str(e)}")
             return jsonify({"error": "Invalid Token!"}), 401
@@ -179,40 +214,39 @@ def user_token_required(f):
             logger.error("Token is missing")
             return jsonify({"error": "Token is missing!"}), 401
         try:
-            data = jwt.decode(token, app.config["SECRET_KEY"], algorithms=["HS256"])
-            current_user = users_collection.find_one({"phone": data["phone"]})
-            if not current_user:
-                logger.error("User not found for token")
-                return jsonify({"error": "Invalid Token!"}), 401
+            current_user = principal_cache.get(token)
+            if current_user is None:
+                data = jwt.decode(token, app.config["SECRET_KEY"], algorithms=["HS256"])
+                current_user = users_collection.find_one({"phone": data["phone"]})
+                if not current_user:
+                    logger.error("User not found for token")
+                    return jsonify({"error": "Invalid Token!"}), 401
+                principal_cache.put(token, "user", data["phone"], current_user, data["exp"])
         except Exception as e:
             logger.error(f"Invalid Token: {str(e)}")
             return jsonify({"error": "Invalid Token!"}), 401
         return f(current_user, *args, **kwargs)
     return decorated
 
-# Helper function to calculate distance between two coordinates (Haversine formula)
-def haversine_distance(lat1, lon1, lat2, lon2):
-    R = 6371  # Earth's radius in kilometers
-    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
-    c = 2 * math.asin(math.sqrt(a))
-    return R * c
-
-# Assign officer
-def assign_officer():
-    try:
-        officer = officers_collection.find_one({}, sort=[("assigned_reports", 1)])
-        if officer:
-            officers_collection.update_one({"_id": officer["_id"]}, {"$inc": {"assigned_reports": 1}})
-            logger.info(f"Officer assigned: {officer.get('name', 'Unknown')}")
-            return officer
-        logger.warning("No officers available")
-        return None
-    except Exception as e:
-        logger.error(f"Error assigning officer: {str(e)}")
-        return None
+# Multi-zoom heatmap buckets maintained on report insert and status change
+heatmap_store = HeatmapStore(heatmap_tiles_collection, water_reports_collection)
+
+# Materialized community leaderboard
+community_leaderboard = Leaderboard(leaderboard_collection, water_reports_collection)
+
+# Per-geocell hourly/daily sensor aggregates; neighbourhood averages and trends read these
+quality_rollups = QualityRollups(quality_rollups_collection, water_quality_collection)
+
+# 1 km neighbourhood lookups over recent reports
+report_neighbourhood = NeighbourhoodSearch(water_reports_collection, {"status": 1})
+
+# Least-loaded officer assignment on open workload
+officer_scheduler = OfficerScheduler(
+    officers_collection,
+    water_reports_collection,
+    on_change=lambda officer: principal_cache.invalidate("officer", officer.get("email"))
+)
+index_manager.query("least_loaded_officer", officers_collection, {}, sort=[("open_reports", 1)])
 
 # Initialize WaterReports schema
 def initialize_water_reports_schema():
@@ -229,6 +263,8 @@ def initialize_water_reports_schema():
             }
         )
         logger.info("WaterReports schema initialized with new fields")
+        migrate_geo_locations(water_reports_collection)
+        migrate_geo_locations(water_quality_collection)
     except Exception as e:
         logger.error(f"Error initializing WaterReports schema: {str(e)}")
 
@@ -248,38 +284,27 @@ def send_notification(report_id, status):
         if status.startswith("In-Progress"):
             message += f" Progress: {report.get('progress', 0)}%. Notes: {report.get('progress_notes', 'None')}."
 
-        try:
-            client_twilio.messages.create(
-                body=message[:1600],
-                from_=twilio_phone,
-                to=user["phone"]
-            )
-            logger.info(f"SMS sent to {user['phone']} for report {report_id}: {status}")
-        except Exception as e:
-            logger.error(f"Failed to send SMS to {user['phone']} for report {report_id}: {str(e)}")
-
-        try:
-            msg = MIMEText(message)
-            msg["Subject"] = "Water Issue Report Update"
-            msg["From"] = os.getenv("SMTP_EMAIL", "no-reply@watermonitoring.com")
-            msg["To"] = user["email"]
-            with smtplib.SMTP(os.getenv("SMTP_HOST", "smtp.gmail.com"), os.getenv("SMTP_PORT", 587)) as server:
-                server.starttls()
-                server.login(os.getenv("SMTP_EMAIL"), os.getenv("SMTP_PASSWORD"))
-                server.send_message(msg)
-            logger.info(f"Email sent to {user['email']} for report {report_id}: {status}")
-        except Exception as e:
-            logger.error(f"Failed to send email to {user['email']} for report {report_id}: {str(e)}")
+        dedupe_key = f"report:{report_id}:{status}"
+        notification_outbox.enqueue_sms(user["phone"], message, dedupe_key=dedupe_key)
+        notification_outbox.enqueue_email(user.get("email"), "Water Issue Report Update", message, dedupe_key=dedupe_key)
+        logger.info(f"Notifications queued for {user['phone']} for report {report_id}: {status}")
     except Exception as e:
         logger.error(f"Error in send_notification for report {report_id}: {str(e)}")
 
+index_manager.index(water_reports_collection, [("created_at", -1)])
+index_manager.query("recent_reports", water_reports_collection, {"created_at": {"$gte": datetime.datetime(2000, 1, 1)}})
+# Status changes that flip the training label stamp label_updated_at; the predictive retrainer refits when any report was relabelled
+index_manager.index(water_reports_collection, [("label_updated_at", 1)], sparse=True)
+index_manager.query("relabelled_reports", water_reports_collection, {"label_updated_at": {"$gt": datetime.datetime(2000, 1, 1)}})
+
 # Predictive maintenance endpoint
 @app.route("/predict_maintenance", methods=["GET"])
 @token_required
 def predict_maintenance(current_officer):
     logger.info("Received predict_maintenance request")
     try:
-        if not predictive_model or not scaler:
+        model, model_scaler = get_predictive_model()
+        if not model or not model_scaler:
             logger.error("Predictive model not trained")
             return jsonify({"error": "Predictive model not available"}), 503
         reports = list(water_reports_collection.find(
@@ -290,8 +315,8 @@ def predict_maintenance(current_officer):
             logger.info("No recent reports for prediction")
             return jsonify({"predictions": []})
         X = [[r["latitude"], r["longitude"]] for r in reports]
-        X_scaled = scaler.transform(X)
-        probs = predictive_model.predict_proba(X_scaled)[:, 1]
+        X_scaled = model_scaler.transform(X)
+        probs = model.predict_proba(X_scaled)[:, 1]
         predictions = []
         for i, prob in enumerate(probs):
             if prob > 0.7:
@@ -303,21 +328,46 @@ def predict_maintenance(current_officer):
                     "status": report["status"],
                     "risk_score": round(float(prob), 2)
                 })
-                try:
-                    client_twilio.messages.create(
-                        body=f"High-risk {report['status']} issue predicted at {report['address']}. Risk score: {round(prob, 2)}",
-                        from_=twilio_phone,
-                        to=current_officer["phone"]
-                    )
-                    logger.info(f"SMS sent to {current_officer['phone']} for {report['address']}")
-                except Exception as e:
-                    logger.error(f"Failed to send SMS to {current_officer['phone']}: {str(e)}")
+                notification_outbox.enqueue_sms(
+                    current_officer["phone"],
+                    f"High-risk {report['status']} issue predicted at {report['address']}. Risk score: {round(prob, 2)}"
+                )
         logger.info(f"Returning {len(predictions)} maintenance predictions")
         return jsonify({"predictions": predictions})
     except Exception as e:
         logger.error(f"Error in predict_maintenance: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+# Liveness and per-model readiness
+@app.route("/health", methods=["GET"])
+def health():
+    models = model_registry.status()
+    ready = all(m["status"] == "ready" for m in models.values())
+    return jsonify({"status": "ok" if ready else "loading", "models": models}), 200 if ready else 503
+
+# Principal cache statistics
+@app.route("/auth_cache/stats", methods=["GET"])
+@token_required
+def auth_cache_stats(current_officer):
+    logger.info("Received auth_cache_stats request")
+    return jsonify(principal_cache.stats())
+
+# Predictive model version endpoint
+@app.route("/predictive_model/info", methods=["GET"])
+def predictive_model_info():
+    logger.info("Received predictive_model_info request")
+    return jsonify(predictive_retrainer.info())
+
+# bbox query parameter as [min_lng, min_lat, max_lng, max_lat]; None when absent, [] when malformed
+def parse_bbox(value):
+    if not value:
+        return None
+    try:
+        bbox = [float(v) for v in value.split(",")]
+    except ValueError:
+        return []
+    return bbox if len(bbox) == 4 else []
+
 # Public heatmap data endpoint
 @app.route("/map_data", methods=["GET"])
 def get_map_data():
@@ -326,39 +376,23 @@ def get_map_data():
         status = request.args.get("status")
         start_date = request.args.get("start_date")
         end_date = request.args.get("end_date")
-        query = {}
-        if status:
-            query["status"] = status
-        if start_date and end_date:
-            query["created_at"] = {
-                "$gte": parse(start_date),
-                "$lte": parse(end_date)
-            }
-        pipeline = [
-            {"$match": query},
-            {
-                "$group": {
-                    "_id": {
-                        "latitude": "$latitude",
-                        "longitude": "$longitude",
-                        "status": "$status"
-                    },
-                    "count": {"$sum": 1}
-                }
-            },
-            {
-                "$project": {
-                    "latitude": "$_id.latitude",
-                    "longitude": "$_id.longitude",
-                    "status": "$_id.status",
-                    "count": 1,
-                    "_id": 0
-                }
-            }
-        ]
-        heatmap_data = list(water_reports_collection.aggregate(pipeline))
+        zoom = request.args.get("zoom", type=int)
+        bbox = parse_bbox(request.args.get("bbox"))
+        if bbox == []:
+            logger.error("Invalid bbox")
+            return jsonify({"error": "bbox must be min_lng,min_lat,max_lng,max_lat"}), 400
+        heatmap_data = heatmap_store.query(
+            zoom=zoom,
+            bbox=bbox,
+            status=status,
+            start=parse(start_date) if start_date and end_date else None,
+            end=parse(end_date) if start_date and end_date else None
+        )
         logger.info(f"Returning {len(heatmap_data)} heatmap data points")
-        return jsonify(heatmap_data)
+        response = jsonify(heatmap_data)
+        response.headers["Cache-Control"] = "no-cache"
+        response.add_etag()
+        return response.make_conditional(request)
     except Exception as e:
         logger.error(f"Error fetching map data: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -402,6 +436,122 @@ def chatbot():
         logger.error(f"Error in chatbot: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+# Decode an upload from memory into the model input and write the original to disk in the background
+def prepare_issue_image(image_file, out=None):
+    data = image_file.read()
+    image = image_preprocessor.decode(data, out)
+    report_id = str(ObjectId())
+    filename = f"{report_id}_water_issue.jpg"
+    saved = image_preprocessor.save_async(data, os.path.join(app.config["UPLOAD_FOLDER"], filename))
+    image_url = f"http://localhost:5000/uploads/{filename}"
+    return report_id, image_url, image, saved
+
+# Turn CNN output into a report, assign an officer and send notifications.
+# The upload write overlaps inference; it must finish before the report references the file,
+# and a failed write leaves the report without an image rather than pointing at a missing one.
+def submit_water_report(current_user, report_id, image_url, saved, preds, lat, lng, address):
+    try:
+        saved.result()
+    except OSError:
+        image_url = None
+    max_idx = np.argmax(preds)
+    categories = ['leakage', 'pollution', 'scarcity']
+    category = categories[max_idx] if preds[max_idx] >= 0.6 else "unknown"
+    confidence = float(preds[max_idx]) if preds[max_idx] >= 0.6 else 0.0
+    valid = confidence >= 0.6
+
+    # Check if the category is pollution
+    if category == "pollution":
+        logger.info(f"Pollution detected, reporting as 'others' and not submitting report")
+        return {
+            "prediction": "others",
+            "confidence": round(confidence, 2),
+            "valid": valid,
+            "latitude": lat,
+            "longitude": lng,
+            "address": address,
+            "message": "Pollution issues are reported as 'others' and not submitted."
+        }
+
+    assigned_officer_name = "No available officer"
+    officer_email = None
+    officer_phone = None
+    officer = officer_scheduler.assign(lat, lng)
+    if officer and "name" in officer:
+        assigned_officer_name = officer["name"]
+        officer_email = officer.get("email", "N/A")
+        officer_phone = officer.get("phone", "N/A")
+    report_data = {
+        "user_phone": current_user["phone"],
+        "latitude": float(lat),
+        "longitude": float(lng),
+        "location": geo_point(lat, lng),
+        "address": address,
+        "status": category,
+        "confidence": round(confidence, 2),
+        "assigned_officer": assigned_officer_name,
+        "officer_email": officer_email,
+        "officer_phone": officer_phone,
+        "image": image_url,
+        "created_at": datetime.datetime.utcnow(),
+        "resolved": False,
+        "upvotes": 0,
+        "comment_count": 0,
+        "status": "Pending",
+        "progress": 0,
+        "progress_notes": "",
+        "progress_image": None
+    }
+    water_reports_collection.insert_one(report_data)
+    report_neighbourhood.add(report_data)
+    heatmap_store.record(report_data)
+    community_leaderboard.record_report(current_user["phone"], current_user.get("name"))
+    # Send SMS to user to confirm report submission
+    user_phone = current_user.get("phone")
+    if user_phone:
+        notification_outbox.enqueue_sms(
+            user_phone,
+            f"Your water issue report (ID: {report_id}) for {category} at {address} has been submitted successfully.",
+            dedupe_key=f"report:{report_id}:submitted"
+        )
+    else:
+        logger.warning("No user phone number provided, skipping confirmation SMS")
+    # Send SMS to officer for valid reports
+    if valid and officer_phone and category != "unknown":
+        notification_outbox.enqueue_sms(
+            officer_phone,
+            f"New {category} issue reported at {address}. Please investigate. Report ID: {report_id}",
+            dedupe_key=f"report:{report_id}:assigned"
+        )
+    risk_score = 0.0
+    model, model_scaler = get_predictive_model()
+    if model and model_scaler:
+        X = [[float(lat), float(lng)]]
+        X_scaled = model_scaler.transform(X)
+        risk_score = model.predict_proba(X_scaled)[0, 1]
+        logger.info(f"Risk score calculated: {risk_score} for lat={lat}, lng={lng}")
+        if risk_score > 0.5 and officer_phone and category != "unknown":
+            notification_outbox.enqueue_sms(
+                officer_phone,
+                f"High-risk {category} issue reported at {address}. Risk score: {round(risk_score, 2)}. Report ID: {report_id}",
+                dedupe_key=f"report:{report_id}:high_risk"
+            )
+    else:
+        logger.warning("Predictive model not available, risk_score set to 0.0")
+    predictive_retrainer.notify()
+    logger.info(f"Prediction: {category}, Confidence: {confidence}, Risk Score: {risk_score}")
+    return {
+        "prediction": category,
+        "confidence": round(confidence, 2),
+        "valid": valid,
+        "latitude": lat,
+        "longitude": lng,
+        "address": address,
+        "assigned_officer": assigned_officer_name,
+        "risk_score": round(float(risk_score), 2),
+        "report_id": report_id
+    }
+
 # Predict water issue
 @app.route("/predict_water_issue", methods=["POST"])
 @user_token_required
@@ -418,123 +568,83 @@ def predict_water_issue(current_user):
         logger.error("Location data missing")
         return jsonify({"error": "Location data missing"}), 400
     try:
-        report_id = str(ObjectId())
-        filename = f"{report_id}_water_issue.jpg"
-        file_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-        image_file.save(file_path)
-        image_url = f"http://localhost:5000/uploads/{filename}"
-        img = tf.keras.preprocessing.image.load_img(file_path, target_size=(224, 224))
-        img_array = tf.keras.preprocessing.image.img_to_array(img)
-        img_array = np.expand_dims(img_array, axis=0) / 255.0
-        preds = water_model.predict(img_array)[0]
-        max_idx = np.argmax(preds)
-        categories = ['leakage', 'pollution', 'scarcity']
-        category = categories[max_idx] if preds[max_idx] >= 0.6 else "unknown"
-        confidence = float(preds[max_idx]) if preds[max_idx] >= 0.6 else 0.0
-        valid = confidence >= 0.6
-
-        # Check if the category is pollution
-        if category == "pollution":
-            logger.info(f"Pollution detected, reporting as 'others' and not submitting report")
-            return jsonify({
-                "prediction": "others",
-                "confidence": round(confidence, 2),
-                "valid": valid,
-                "latitude": lat,
-                "longitude": lng,
-                "address": address,
-                "message": "Pollution issues are reported as 'others' and not submitted."
-            }), 200
+        model_registry.get("water_cnn")
+        report_id, image_url, image, saved = prepare_issue_image(image_file)
+        preds = inference_engine.predict(image)
+        return jsonify(submit_water_report(current_user, report_id, image_url, saved, preds, lat, lng, address))
+    except ModelNotReady as e:
+        logger.error(str(e))
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        logger.error(f"Error in predict_water_issue: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
-        assigned_officer_name = "No available officer"
-        officer_email = None
-        officer_phone = None
-        officer = assign_officer()
-        if officer and "name" in officer:
-            assigned_officer_name = officer["name"]
-            officer_email = officer.get("email", "N/A")
-            officer_phone = officer.get("phone", "N/A")
-        report_data = {
-            "user_phone": current_user["phone"],
-            "latitude": float(lat),
-            "longitude": float(lng),
-            "address": address,
-            "status": category,
-            "confidence": round(confidence, 2),
-            "assigned_officer": assigned_officer_name,
-            "officer_email": officer_email,
-            "officer_phone": officer_phone,
-            "image": image_url,
-            "created_at": datetime.datetime.utcnow(),
-            "resolved": False,
-            "upvotes": 0,
-            "upvoted_by": [],
-            "status": "Pending",
-            "progress": 0,
-            "progress_notes": "",
-            "progress_image": None
-        }
-        water_reports_collection.insert_one(report_data)
-        # Send SMS to user to confirm report submission
-        user_phone = current_user.get("phone")
-        if user_phone:
+# Bulk upload of offline captures: files under "images", matching location list in "reports"
+@app.route("/predict_water_issue/bulk", methods=["POST"])
+@user_token_required
+def predict_water_issue_bulk(current_user):
+    logger.info("Received predict_water_issue_bulk request")
+    image_files = request.files.getlist("images")
+    if not image_files:
+        logger.error("No image files provided")
+        return jsonify({"error": "No image files provided"}), 400
+    if len(image_files) > BULK_MAX_IMAGES:
+        logger.error(f"Too many images in bulk request: {len(image_files)}")
+        return jsonify({"error": f"At most {BULK_MAX_IMAGES} images per request"}), 400
+    try:
+        locations = json.loads(request.form.get("reports", "[]"))
+    except ValueError:
+        logger.error("Invalid reports metadata")
+        return jsonify({"error": "reports must be a JSON list"}), 400
+    if not isinstance(locations, list) or len(locations) != len(image_files) or not all(isinstance(l, dict) for l in locations):
+        logger.error("Reports metadata does not match images")
+        return jsonify({"error": "reports must contain one entry per image"}), 400
+    try:
+        model_registry.get("water_cnn")
+    except ModelNotReady as e:
+        logger.error(str(e))
+        return jsonify({"error": str(e)}), 503
+    try:
+        results = [None] * len(image_files)
+        images = image_preprocessor.allocate(len(image_files))
+        pending = []
+        for i, (image_file, location) in enumerate(zip(image_files, locations)):
+            lat = location.get("latitude")
+            lng = location.get("longitude")
+            address = location.get("address")
+            if not lat or not lng or not address:
+                results[i] = {"error": "Location data missing"}
+                continue
             try:
-                client_twilio.messages.create(
-                    body=f"Your water issue report (ID: {report_id}) for {category} at {address} has been submitted successfully.",
-                    from_=twilio_phone,
-                    to=user_phone
-                )
-                logger.info(f"Confirmation SMS sent to user {user_phone} for report {report_id}")
+                report_id, image_url, image, saved = prepare_issue_image(image_file, images[i])
+                pending.append((i, report_id, image_url, saved, lat, lng, address, inference_engine.submit(image)))
             except Exception as e:
-                logger.error(f"Failed to send confirmation SMS to user {user_phone}: {str(e)}")
-        else:
-            logger.warning("No user phone number provided, skipping confirmation SMS")
-        # Send SMS to officer for valid reports
-        if valid and officer_phone and category != "unknown":
+                logger.error(f"Failed to prepare bulk image {i}: {str(e)}")
+                results[i] = {"error": str(e)}
+        for i, report_id, image_url, saved, lat, lng, address, future in pending:
             try:
-                client_twilio.messages.create(
-                    body=f"New {category} issue reported at {address}. Please investigate. Report ID: {report_id}",
-                    from_=twilio_phone,
-                    to=officer_phone
-                )
-                logger.info(f"SMS sent to {officer_phone} for report {report_id} at {address}")
+                results[i] = submit_water_report(current_user, report_id, image_url, saved, future.result(), lat, lng, address)
             except Exception as e:
-                logger.error(f"Failed to send SMS to {officer_phone}: {str(e)}")
-        risk_score = 0.0
-        if predictive_model and scaler:
-            X = [[float(lat), float(lng)]]
-            X_scaled = scaler.transform(X)
-            risk_score = predictive_model.predict_proba(X_scaled)[0, 1]
-            logger.info(f"Risk score calculated: {risk_score} for lat={lat}, lng={lng}")
-            if risk_score > 0.5 and officer_phone and category != "unknown":
-                try:
-                    client_twilio.messages.create(
-                        body=f"High-risk {category} issue reported at {address}. Risk score: {round(risk_score, 2)}. Report ID: {report_id}",
-                        from_=twilio_phone,
-                        to=officer_phone
-                    )
-                    logger.info(f"High-risk SMS sent to {officer_phone} for {address}")
-                except Exception as e:
-                    logger.error(f"Failed to send high-risk SMS to {officer_phone}: {str(e)}")
-        else:
-            logger.warning("Predictive model not available, risk_score set to 0.0")
-        retrain_predictive_model()
-        logger.info(f"Prediction: {category}, Confidence: {confidence}, Risk Score: {risk_score}")
-        return jsonify({
-            "prediction": category,
-            "confidence": round(confidence, 2),
-            "valid": valid,
-            "latitude": lat,
-            "longitude": lng,
-            "address": address,
-            "assigned_officer": assigned_officer_name,
-            "risk_score": round(float(risk_score), 2),
-            "report_id": report_id
-        })
+                logger.error(f"Failed to submit bulk report {report_id}: {str(e)}")
+                results[i] = {"error": str(e)}
+        logger.info(f"Processed bulk upload of {len(image_files)} images")
+        return jsonify({"results": results})
     except Exception as e:
-        logger.error(f"Error in predict_water_issue: {str(e)}")
+        logger.error(f"Error in predict_water_issue_bulk: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+index_manager.index(water_quality_collection, [("simulation_id", 1)])
+index_manager.index(water_quality_collection, [("created_at", -1)])
+index_manager.query("simulation_by_id", water_quality_collection, {"simulation_id": ""})
+
+# Score sensor readings with one predict_proba pass over the forest; labels come from its argmax
+def score_water_quality(water_quality_model, rows):
+    proba = water_quality_model.predict_proba(np.asarray(rows, dtype=np.float64))
+    best = proba.argmax(axis=1)
+    labels = water_quality_model.classes_[best]
+    confidences = proba[np.arange(len(best)), best]
+    return ["potable" if label == 1 else "contaminated" for label in labels], [float(c) for c in confidences]
+
 # Predict water quality
 @app.route("/predict_water_quality", methods=["POST"])
 @user_token_required
@@ -558,17 +668,7 @@ def predict_water_quality(current_user):
         except ValueError:
             logger.error("Invalid coordinate format")
             return jsonify({"error": "Coordinates must be numeric"}), 400
-        try:
-            response = requests.get(
-                f"https://nominatim.openstreetmap.org/reverse?lat={lat}&lon={lng}&format=json",
-                headers={"User-Agent": "WaterQualityApp/1.0"}
-            )
-            response.raise_for_status()
-            address_data = response.json()
-            address = address_data.get("display_name", "Unknown address")
-        except Exception as e:
-            logger.error(f"Failed to geocode coordinates: {str(e)}")
-            address = "Unknown address"
+        address = reverse_geocoder.reverse(lat, lng)
         if simulation_id:
             sim_data = water_quality_collection.find_one({"simulation_id": simulation_id})
             if not sim_data:
@@ -592,29 +692,12 @@ def predict_water_quality(current_user):
                     return jsonify({"error": "Parameters must be numeric"}), 400
             else:
                 recent_date = datetime.datetime.utcnow() - datetime.timedelta(days=30)
-                nearby_predictions = list(water_quality_collection.find(
-                    {
-                        "created_at": {"$gte": recent_date},
-                        "latitude": {"$exists": True},
-                        "longitude": {"$exists": True}
-                    },
-                    {"ph": 1, "turbidity": 1, "temperature": 1, "conductivity": 1, "latitude": 1, "longitude": 1}
-                ))
-                nearby_params = []
-                for pred in nearby_predictions:
-                    distance = haversine_distance(lat, lng, pred["latitude"], pred["longitude"])
-                    if distance <= 1:
-                        nearby_params.append({
-                            "ph": pred["ph"],
-                            "turbidity": pred["turbidity"],
-                            "temperature": pred["temperature"],
-                            "conductivity": pred["conductivity"]
-                        })
-                if nearby_params:
-                    ph = sum(p["ph"] for p in nearby_params) / len(nearby_params)
-                    turbidity = sum(p["turbidity"] for p in nearby_params) / len(nearby_params)
-                    temperature = sum(p["temperature"] for p in nearby_params) / len(nearby_params)
-                    conductivity = sum(p["conductivity"] for p in nearby_params) / len(nearby_params)
+                stats = quality_rollups.neighbourhood_stats(lat, lng, 1, since=recent_date)
+                if stats:
+                    ph = stats["ph"]["mean"]
+                    turbidity = stats["turbidity"]["mean"]
+                    temperature = stats["temperature"]["mean"]
+                    conductivity = stats["conductivity"]["mean"]
                 else:
                     ph = random.uniform(6.5, 8.5)
                     turbidity = random.uniform(0, 10)
@@ -623,27 +706,27 @@ def predict_water_quality(current_user):
         if not (0 <= ph <= 14 and 0 <= turbidity <= 100 and 0 <= temperature <= 100 and 0 <= conductivity <= 2000):
             logger.error("Parameters out of valid range")
             return jsonify({"error": "Parameters out of valid range"}), 400
-        input_data = np.array([[ph, turbidity, temperature, conductivity]])
-        prediction = water_quality_model.predict(input_data)[0]
-        confidence = float(water_quality_model.predict_proba(input_data)[0][prediction])
-        quality = "potable" if prediction == 1 else "contaminated"
+        try:
+            water_quality_model = model_registry.get("water_quality")
+        except ModelNotReady as e:
+            logger.error(str(e))
+            return jsonify({"error": str(e)}), 503
+        qualities, confidences = score_water_quality(water_quality_model, [[ph, turbidity, temperature, conductivity]])
+        quality = qualities[0]
+        confidence = confidences[0]
         assigned_officer_name = "No available officer"
         officer_phone = None
+        prediction_id = str(uuid.uuid4())
         if quality == "contaminated":
-            officer = assign_officer()
+            officer = officer_scheduler.assign(lat, lng, charge=False)
             if officer and "name" in officer:
                 assigned_officer_name = officer["name"]
                 officer_phone = officer.get("phone", "N/A")
-                try:
-                    client_twilio.messages.create(
-                        body=f"Contaminated water detected at {address}. Please investigate.",
-                        from_=twilio_phone,
-                        to=officer_phone
-                    )
-                    logger.info(f"SMS sent to {officer_phone} for contaminated water at {address}")
-                except Exception as e:
-                    logger.error(f"Failed to send SMS to {officer_phone}: {str(e)}")
-        prediction_id = str(uuid.uuid4())
+                notification_outbox.enqueue_sms(
+                    officer_phone,
+                    f"Contaminated water detected at {address}. Please investigate.",
+                    dedupe_key=f"quality:{prediction_id}:assigned"
+                )
         quality_data = {
             "prediction_id": prediction_id,
             "user_phone": current_user["phone"],
@@ -653,6 +736,7 @@ def predict_water_quality(current_user):
             "conductivity": conductivity,
             "latitude": lat,
             "longitude": lng,
+            "location": geo_point(lat, lng),
             "address": address,
             "quality": quality,
             "confidence": round(confidence, 2),
@@ -661,6 +745,7 @@ def predict_water_quality(current_user):
             "simulation_id": simulation_id if simulation_id else None
         }
         water_quality_collection.insert_one(quality_data)
+        quality_rollups.record([quality_data])
         logger.info(f"Water quality prediction: {quality}, Confidence: {confidence}")
         return jsonify({
             "prediction_id": prediction_id,
@@ -677,52 +762,197 @@ def predict_water_quality(current_user):
         logger.error(f"Error in predict_water_quality: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+QUALITY_BATCH_MAX_READINGS = int(os.getenv("QUALITY_BATCH_MAX_READINGS", 1000))
+QUALITY_BATCH_SYNC_GEOCODES = int(os.getenv("QUALITY_BATCH_SYNC_GEOCODES", 3))
+
+# Addresses for a scored batch, one lookup per geocoder cell rather than per reading. Cached cells
+# and the first QUALITY_BATCH_SYNC_GEOCODES misses resolve now; the rest are stored with a null
+# address and returned as pending cells {key: (lat, lng, [reading indexes])} for backfill.
+def resolve_batch_addresses(readings, valid):
+    addresses = {}
+    cells = {}
+    for i, lat, lng, _ in valid:
+        if readings[i].get("address"):
+            addresses[i] = readings[i]["address"]
+        else:
+            cells.setdefault(reverse_geocoder.cell_key(lat, lng), (lat, lng, []))[2].append(i)
+    pending_cells = {}
+    budget = QUALITY_BATCH_SYNC_GEOCODES
+    for key, (lat, lng, indexes) in cells.items():
+        address = reverse_geocoder.cached(lat, lng)
+        if address is None and budget > 0:
+            budget -= 1
+            address = reverse_geocoder.reverse(lat, lng)
+        if address is None:
+            pending_cells[key] = (lat, lng, indexes)
+        for i in indexes:
+            addresses[i] = address
+    return addresses, pending_cells
+
+# Geocode the remaining cells behind the rate limiter and fill in the stored predictions' addresses
+def backfill_quality_addresses(cells):
+    def run():
+        for lat, lng, prediction_ids in cells.values():
+            try:
+                address = reverse_geocoder.reverse(lat, lng)
+                water_quality_collection.update_many(
+                    {"prediction_id": {"$in": prediction_ids}, "address": None},
+                    {"$set": {"address": address}}
+                )
+            except Exception as e:
+                logger.error(f"Failed to backfill water quality addresses: {str(e)}")
+        logger.info(f"Backfilled addresses for {len(cells)} geocoder cells")
+    threading.Thread(target=run, name="quality-address-backfill", daemon=True).start()
+
+# Predict water quality for a batch of sensor gateway readings
+@app.route("/predict_water_quality/batch", methods=["POST"])
+@user_token_required
+def predict_water_quality_batch(current_user):
+    logger.info("Received predict_water_quality_batch request")
+    data = request.json or {}
+    readings = data.get("readings")
+    if not isinstance(readings, list) or not readings:
+        logger.error("No readings provided")
+        return jsonify({"error": "readings must be a non-empty list"}), 400
+    if len(readings) > QUALITY_BATCH_MAX_READINGS:
+        logger.error(f"Too many readings: {len(readings)}")
+        return jsonify({"error": f"At most {QUALITY_BATCH_MAX_READINGS} readings per request"}), 400
+    try:
+        water_quality_model = model_registry.get("water_quality")
+    except ModelNotReady as e:
+        logger.error(str(e))
+        return jsonify({"error": str(e)}), 503
+    try:
+        results = [None] * len(readings)
+        valid = []
+        for i, reading in enumerate(readings):
+            try:
+                valid.append((i, *parse_sensor_reading(reading)))
+            except ValueError as e:
+                results[i] = {"error": str(e)}
+        if valid:
+            qualities, confidences = score_water_quality(water_quality_model, [values for _, _, _, values in valid])
+            now = datetime.datetime.utcnow()
+            documents = []
+            officers_by_location = {}
+            addresses, pending_cells = resolve_batch_addresses(readings, valid)
+            for (i, lat, lng, values), quality, confidence in zip(valid, qualities, confidences):
+                address = addresses[i]
+                prediction_id = str(uuid.uuid4())
+                assigned_officer_name = "No available officer"
+                # One officer and one SMS per contaminated location, however many readings it sent
+                if quality == "contaminated":
+                    if (lat, lng) not in officers_by_location:
+                        officer = officer_scheduler.assign(lat, lng, charge=False)
+                        officers_by_location[(lat, lng)] = officer
+                        if officer and "name" in officer:
+                            notification_outbox.enqueue_sms(
+                                officer.get("phone", "N/A"),
+                                f"Contaminated water detected at {address or f'({lat:.4f}, {lng:.4f})'}. Please investigate.",
+                                dedupe_key=f"quality:{prediction_id}:assigned"
+                            )
+                    officer = officers_by_location[(lat, lng)]
+                    if officer and "name" in officer:
+                        assigned_officer_name = officer["name"]
+                ph, turbidity, temperature, conductivity = values
+                documents.append({
+                    "prediction_id": prediction_id,
+                    "user_phone": current_user["phone"],
+                    "ph": ph,
+                    "turbidity": turbidity,
+                    "temperature": temperature,
+                    "conductivity": conductivity,
+                    "latitude": lat,
+                    "longitude": lng,
+                    "location": geo_point(lat, lng),
+                    "address": address,
+                    "quality": quality,
+                    "confidence": round(confidence, 2),
+                    "assigned_officer": assigned_officer_name,
+                    "created_at": now,
+                    "simulation_id": None
+                })
+                results[i] = {
+                    "prediction_id": documents[-1]["prediction_id"],
+                    "quality": quality,
+                    "confidence": round(confidence, 2),
+                    "latitude": lat,
+                    "longitude": lng,
+                    "address": address,
+                    "assigned_officer": assigned_officer_name
+                }
+            try:
+                water_quality_collection.insert_many(documents, ordered=False)
+            except BulkWriteError as e:
+                # Coordinates and ranges are validated per reading above; anything the server still
+                # rejects is reported against its own reading while the rest of the batch stands
+                if e.details.get("writeConcernErrors"):
+                    raise
+                failed = {err["index"]: err.get("errmsg", "Failed to store reading") for err in e.details.get("writeErrors", [])}
+                for index, message in failed.items():
+                    logger.error(f"Failed to store water quality reading {valid[index][0]}: {message}")
+                    results[valid[index][0]] = {"error": "Failed to store reading"}
+                valid = [item for index, item in enumerate(valid) if index not in failed]
+                documents = [doc for index, doc in enumerate(documents) if index not in failed]
+            quality_rollups.record(documents)
+            if pending_cells:
+                prediction_ids = {i: doc["prediction_id"] for (i, _, _, _), doc in zip(valid, documents)}
+                backfill_quality_addresses({
+                    key: (lat, lng, [prediction_ids[i] for i in indexes if i in prediction_ids])
+                    for key, (lat, lng, indexes) in pending_cells.items()
+                })
+        logger.info(f"Scored {len(valid)}/{len(readings)} water quality readings")
+        return jsonify({"results": results, "scored": len(valid), "rejected": len(readings) - len(valid)})
+    except Exception as e:
+        logger.error(f"Error in predict_water_quality_batch: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+# Water quality averages and trend around a point, served from the rollups
+@app.route("/water_quality/trends", methods=["GET"])
+def water_quality_trends():
+    logger.info("Received water_quality_trends request")
+    try:
+        lat = request.args.get("latitude", type=float)
+        lng = request.args.get("longitude", type=float)
+        if lat is None or lng is None:
+            logger.error("Latitude and longitude are required")
+            return jsonify({"error": "Latitude and longitude are required"}), 400
+        radius_km = min(max(request.args.get("radius_km", 1, type=float), 0.1), 50)
+        resolution = request.args.get("resolution", "day")
+        if resolution not in RESOLUTIONS:
+            return jsonify({"error": f"resolution must be one of {list(RESOLUTIONS)}"}), 400
+        days = min(max(request.args.get("days", 30, type=int), 1), 365)
+        end = datetime.datetime.utcnow()
+        start = end - datetime.timedelta(days=days)
+        return jsonify({
+            "latitude": lat,
+            "longitude": lng,
+            "radius_km": radius_km,
+            "resolution": resolution,
+            "summary": quality_rollups.neighbourhood_stats(lat, lng, radius_km, since=start) or {"count": 0},
+            "series": quality_rollups.trend(lat, lng, radius_km, resolution, start, end)
+        })
+    except Exception as e:
+        logger.error(f"Error fetching water quality trends: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 # Community leaderboard
 @app.route("/community_leaderboard", methods=["GET"])
 def get_community_leaderboard():
     logger.info("Received get_community_leaderboard request")
     try:
-        pipeline = [
-            {
-                "$group": {
-                    "_id": "$user_phone",
-                    "total_upvotes": {"$sum": {"$ifNull": ["$upvotes", 0]}},
-                    "report_count": {"$sum": 1}
-                }
-            },
-            {
-                "$lookup": {
-                    "from": "Users",
-                    "localField": "_id",
-                    "foreignField": "phone",
-                    "as": "user"
-                }
-            },
-            {
-                "$unwind": {
-                    "path": "$user",
-                    "preserveNullAndEmptyArrays": True
-                }
-            },
-            {
-                "$project": {
-                    "user_phone": "$_id",
-                    "user_name": {"$ifNull": ["$user.name", "Unknown User"]},
-                    "total_upvotes": 1,
-                    "report_count": 1,
-                    "_id": 0
-                }
-            },
-            {"$sort": {"total_upvotes": -1, "report_count": -1}},
-            {"$limit": 10}
-        ]
-        leaderboard = list(water_reports_collection.aggregate(pipeline))
+        limit = max(1, min(request.args.get("limit", 10, type=int), 100))
+        offset = max(request.args.get("offset", 0, type=int), 0)
+        leaderboard = community_leaderboard.top(limit=limit, offset=offset)
         logger.info(f"Returning {len(leaderboard)} leaderboard entries")
         return jsonify(leaderboard)
     except Exception as e:
         logger.error(f"Error fetching community leaderboard: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+index_manager.index(water_quality_collection, [("prediction_id", 1)])
+index_manager.query("prediction_by_id", water_quality_collection, {"prediction_id": ""})
+
 # Water quality insights
 @app.route("/water_quality_insights", methods=["POST"])
 @user_token_required
@@ -769,6 +999,9 @@ def water_quality_insights(current_user):
         logger.error(f"Error in water_quality_insights: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+# Upvotes live in their own collection, unique per (report_id, user_phone)
+upvote_store = UpvoteStore(report_upvotes_collection, water_reports_collection)
+
 # Upvote a report
 @app.route("/upvote_report", methods=["POST"])
 @user_token_required
@@ -780,35 +1013,27 @@ def upvote_report(current_user):
         if not report_id:
             logger.error("Report ID is required")
             return jsonify({"error": "Report ID is required"}), 400
-        report = water_reports_collection.find_one({"_id": ObjectId(report_id)})
-        if not report:
+        status, report_owner = upvote_store.upvote(ObjectId(report_id), current_user["phone"])
+        if status == REPORT_NOT_FOUND:
             logger.error("Report not found")
             return jsonify({"error": "Report not found"}), 404
-        if current_user["phone"] in report.get("upvoted_by", []):
+        if status == ALREADY_UPVOTED:
             logger.error("User has already upvoted this report")
             return jsonify({"error": "You have already upvoted this report"}), 400
-        if "upvotes" not in report:
-            water_reports_collection.update_one(
-                {"_id": ObjectId(report_id)},
-                {"$set": {"upvotes": 0, "upvoted_by": []}}
-            )
-        result = water_reports_collection.update_one(
-            {"_id": ObjectId(report_id)},
-            {
-                "$inc": {"upvotes": 1},
-                "$push": {"upvoted_by": current_user["phone"]}
-            }
-        )
-        if result.modified_count > 0:
-            logger.info(f"Report {report_id} upvoted by {current_user['phone']}")
-            return jsonify({"message": "Report upvoted successfully"})
-        else:
-            logger.error("Failed to upvote report")
-            return jsonify({"error": "Failed to upvote report"}), 500
+        if report_owner:
+            community_leaderboard.record_upvote(report_owner)
+        logger.info(f"Report {report_id} upvoted by {current_user['phone']}")
+        return jsonify({"message": "Report upvoted successfully"})
     except Exception as e:
         logger.error(f"Error in upvote_report: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+# Comment threads; reports carry a comment_count and existence checks go through a known-id cache
+comment_store = CommentStore(comments_collection, water_reports_collection)
+COMMENT_FIELDS = ["_id", "user_phone", "user_name", "comment", "created_at"]
+index_manager.index(comments_collection, [("report_id", 1), ("created_at", 1), ("_id", 1)])
+index_manager.query("comments_by_report", comments_collection, {"report_id": ""}, sort=[("created_at", 1), ("_id", 1)])
+
 # Get comments for a report
 @app.route("/get_comments", methods=["GET"])
 def get_comments():
@@ -818,20 +1043,16 @@ def get_comments():
         if not report_id:
             logger.error("Report ID is required")
             return jsonify({"error": "Report ID is required"}), 400
-        report = water_reports_collection.find_one({"_id": ObjectId(report_id)})
-        if not report:
+        try:
+            list_args = ListArgs(request.args, COMMENT_FIELDS, COMMENT_FIELDS, default_order="created_at_asc")
+        except ValueError as e:
+            logger.error(f"Invalid list arguments: {str(e)}")
+            return jsonify({"error": str(e)}), 400
+        if not comment_store.report_exists(report_id):
             logger.error("Report not found")
             return jsonify({"error": "Report not found"}), 404
-        comments = list(comments_collection.find(
-            {"report_id": report_id},
-            {"_id": 1, "user_phone": 1, "user_name": 1, "comment": 1, "created_at": 1}
-        ))
-        for comment in comments:
-            comment["_id"] = str(comment["_id"])
-            if isinstance(comment["created_at"], datetime.datetime):
-                comment["created_at"] = comment["created_at"].isoformat()
-        logger.info(f"Returning {len(comments)} comments for report {report_id}")
-        return jsonify(comments)
+        logger.info(f"Returning comments for report {report_id}")
+        return list_response(comments_collection, {"report_id": report_id}, list_args)
     except Exception as e:
         logger.error(f"Error fetching comments: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -848,24 +1069,24 @@ def add_comment(current_user):
         if not report_id or not comment_text:
             logger.error("Report ID and comment are required")
             return jsonify({"error": "Report ID and comment are required"}), 400
-        report = water_reports_collection.find_one({"_id": ObjectId(report_id)})
-        if not report:
+        if not comment_store.add(report_id, current_user["phone"], current_user["name"], comment_text):
             logger.error("Report not found")
             return jsonify({"error": "Report not found"}), 404
-        comment_data = {
-            "report_id": report_id,
-            "user_phone": current_user["phone"],
-            "user_name": current_user["name"],
-            "comment": comment_text,
-            "created_at": datetime.datetime.utcnow()
-        }
-        comments_collection.insert_one(comment_data)
         logger.info(f"Comment added to report {report_id} by {current_user['phone']}")
         return jsonify({"message": "Comment added successfully"})
     except Exception as e:
         logger.error(f"Error adding comment: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+# Report fields exposed by the public list endpoints; upvoted_by is never returned
+REPORT_LIST_FIELDS = [
+    "user_phone", "latitude", "longitude", "address", "status", "confidence", "assigned_officer",
+    "officer_email", "officer_phone", "image", "created_at", "resolved", "resolved_image", "upvotes",
+    "comment_count", "progress", "progress_notes", "progress_image"
+]
+PUBLIC_REPORT_FIELDS = ["_id"] + REPORT_LIST_FIELDS
+COMMUNITY_REPORT_FIELDS = ["_id", "latitude", "longitude", "address", "status", "confidence", "image", "created_at", "upvotes", "comment_count"]
+
 # User reports
 @app.route("/user/reports", methods=["OPTIONS"])
 def user_reports_options():
@@ -875,21 +1096,22 @@ def user_reports_options():
     response.headers.add("Access-Control-Allow-Headers", "Content-Type,x-access-token")
     return response
 
+index_manager.index(water_reports_collection, [("resolved", 1), ("_id", 1)])
+index_manager.index(water_reports_collection, [("user_phone", 1)])
+index_manager.query("unresolved_reports", water_reports_collection, {"resolved": False}, sort=[("_id", 1)])
+index_manager.query("reports_by_user", water_reports_collection, {"user_phone": ""})
+
 # Community dashboard: Public reports for upvoting
 @app.route("/community_reports", methods=["GET"])
 def get_community_reports():
     logger.info("Received get_community_reports request")
     try:
-        reports = list(water_reports_collection.find(
-            {"resolved": False},
-            {"_id": 1, "latitude": 1, "longitude": 1, "address": 1, "status": 1, "confidence": 1, "image": 1, "created_at": 1, "upvotes": 1}
-        ))
-        for report in reports:
-            report["_id"] = str(report["_id"])
-            if isinstance(report["created_at"], datetime.datetime):
-                report["created_at"] = report["created_at"].isoformat()
-        logger.info(f"Returning {len(reports)} community reports")
-        return jsonify(reports)
+        list_args = ListArgs(request.args, PUBLIC_REPORT_FIELDS, COMMUNITY_REPORT_FIELDS)
+    except ValueError as e:
+        logger.error(f"Invalid community_reports arguments: {str(e)}")
+        return jsonify({"error": str(e)}), 400
+    try:
+        return list_response(water_reports_collection, {"resolved": False}, list_args)
     except Exception as e:
         logger.error(f"Error fetching community reports: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -913,6 +1135,10 @@ def get_user_reports(current_user):
         logger.error(f"Error fetching user reports: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+# Pending OTPs with expiry, per-phone send limits and attempt counters; the Mongo store is
+# shared by every worker, OTP_STORE=memory keeps them in-process for single-process runs
+otp_store = create_otp_store(pending_otps_collection)
+
 # User authentication
 @app.route("/user/send_otp", methods=["POST"])
 def send_otp():
@@ -926,8 +1152,13 @@ def send_otp():
         if users_collection.find_one({"phone": phone}):
             logger.error("Phone number already registered")
             return jsonify({"error": "Phone number already registered"}), 400
-        otp = str(random.randint(100000, 999999))
-        otp_cache[phone] = otp
+        try:
+            otp = otp_store.issue(phone)
+        except OtpRateLimited as e:
+            logger.warning(f"OTP rate limit hit for {phone}")
+            response = jsonify({"error": str(e)})
+            response.headers["Retry-After"] = str(int(e.retry_after) + 1)
+            return response, 429
         try:
             client_twilio.messages.create(
                 body=f"Your OTP for registration is: {otp}",
@@ -958,7 +1189,11 @@ def user_register():
         if not all([name, phone, email, address, aadhar, password, otp]):
             logger.error("All fields are required")
             return jsonify({"error": "All fields are required"}), 400
-        if otp_cache.get(phone) != otp:
+        otp_status = otp_store.verify(phone, str(otp))
+        if otp_status == OTP_LOCKED:
+            logger.error(f"Too many OTP attempts for {phone}")
+            return jsonify({"error": "Too many incorrect OTP attempts, request a new OTP"}), 429
+        if otp_status != OTP_VALID:
             logger.error("Invalid or expired OTP")
             return jsonify({"error": "Invalid or expired OTP"}), 400
         hashed_password = generate_password_hash(password)
@@ -972,7 +1207,7 @@ def user_register():
             "created_at": datetime.datetime.utcnow()
         }
         users_collection.insert_one(user)
-        del otp_cache[phone]
+        otp_store.consume(phone)
         logger.info(f"User registered: {email}")
         return jsonify({"message": "User registered successfully"})
     except Exception as e:
@@ -1018,8 +1253,11 @@ def register():
             "email": data["email"],
             "phone": data["phone"],
             "password": hashed_password,
-            "assigned_reports": 0
+            "assigned_reports": 0,
+            "open_reports": 0
         }
+        if data.get("latitude") is not None and data.get("longitude") is not None:
+            officer["location"] = geo_point(data["latitude"], data["longitude"])
         officers_collection.insert_one(officer)
         logger.info(f"Officer registered: {data['email']}")
         return jsonify({"message": "Registration successful"})
@@ -1051,6 +1289,10 @@ def login():
         logger.error(f"Error in officer login: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+index_manager.index(water_reports_collection, [("assigned_officer", 1), ("resolved", 1)])
+index_manager.query("reports_by_officer", water_reports_collection, {"assigned_officer": ""})
+index_manager.query("resolved_reports_by_officer", water_reports_collection, {"assigned_officer": "", "resolved": True})
+
 # Officer reports
 @app.route("/officer/reports", methods=["GET"])
 @token_required
@@ -1131,11 +1373,16 @@ def accept_report(current_officer):
         if not report:
             logger.error("Report not found or not assigned to officer")
             return jsonify({"error": "Report not found or not assigned to officer"}), 404
+        update_data = {"status": "Accepted", "updated_at": datetime.datetime.utcnow()}
+        if label_changed(report.get("status"), "Accepted"):
+            update_data["label_updated_at"] = update_data["updated_at"]
         result = water_reports_collection.update_one(
             {"_id": ObjectId(report_id)},
-            {"$set": {"status": "Accepted"}}
+            {"$set": update_data}
         )
         if result.modified_count > 0:
+            heatmap_store.change_status(report, report.get("status"), "Accepted")
+            predictive_retrainer.notify()
             send_notification(report_id, "Accepted")
             logger.info(f"Report {report_id} accepted by officer {current_officer['name']}")
             return jsonify({"message": "Report accepted successfully"})
@@ -1169,8 +1416,11 @@ def update_report_progress(current_officer):
         update_data = {
             "status": "In-Progress",
             "progress": int(progress) if progress else report.get("progress", 0),
-            "progress_notes": notes
+            "progress_notes": notes,
+            "updated_at": datetime.datetime.utcnow()
         }
+        if label_changed(report.get("status"), "In-Progress"):
+            update_data["label_updated_at"] = update_data["updated_at"]
         if progress_image:
             progress_filename = f"{report_id}_progress.jpg"
             progress_path = os.path.join(app.config["UPLOAD_FOLDER"], progress_filename)
@@ -1181,6 +1431,8 @@ def update_report_progress(current_officer):
             {"$set": update_data}
         )
         if result.modified_count > 0:
+            heatmap_store.change_status(report, report.get("status"), "In-Progress")
+            predictive_retrainer.notify()
             send_notification(report_id, f"In-Progress: {update_data['progress']}%")
             logger.info(f"Progress updated for report {report_id} by officer {current_officer['name']}")
             return jsonify({"message": "Progress updated successfully"})
@@ -1211,8 +1463,11 @@ def update_report_status(current_officer):
             return jsonify({"error": "Report not found or not assigned to officer"}), 404
         update_data = {
             "resolved": True,
-            "status": "Resolved"
+            "status": "Resolved",
+            "updated_at": datetime.datetime.utcnow()
         }
+        if label_changed(report.get("status"), "Resolved"):
+            update_data["label_updated_at"] = update_data["updated_at"]
         if resolved_image:
             resolved_filename = f"{report_id}_resolved.jpg"
             resolved_path = os.path.join(app.config["RESOLVED_FOLDER"], resolved_filename)
@@ -1223,6 +1478,10 @@ def update_report_status(current_officer):
             {"$set": update_data}
         )
         if result.modified_count > 0:
+            heatmap_store.change_status(report, report.get("status"), "Resolved")
+            predictive_retrainer.notify()
+            if not report.get("resolved"):
+                officer_scheduler.release(report)
             send_notification(report_id, "Resolved")
             logger.info(f"Report {report_id} marked as resolved by officer {current_officer['name']}")
             return jsonify({"message": "Report marked as resolved"})
@@ -1262,7 +1521,8 @@ def officer_profile(current_officer):
             "name": current_officer["name"],
             "email": current_officer["email"],
             "phone": current_officer["phone"],
-            "assigned_reports": current_officer["assigned_reports"]
+            "assigned_reports": current_officer["assigned_reports"],
+            "open_reports": current_officer.get("open_reports", 0)
         }
         resolved_count = water_reports_collection.count_documents({
             "assigned_officer": current_officer["name"],
@@ -1300,13 +1560,96 @@ def serve_resolved_image(filename):
 def get_reports():
     logger.info("Received get_reports request")
     try:
-        reports = list(water_reports_collection.find({}, {"_id": 0}))
-        logger.info(f"Returning {len(reports)} reports")
-        return jsonify(reports)
+        list_args = ListArgs(request.args, PUBLIC_REPORT_FIELDS, REPORT_LIST_FIELDS)
+    except ValueError as e:
+        logger.error(f"Invalid get_reports arguments: {str(e)}")
+        return jsonify({"error": str(e)}), 400
+    try:
+        return list_response(water_reports_collection, {}, list_args)
     except Exception as e:
         logger.error(f"Error fetching reports: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+# Score streamed readings inline only when asked to and the model is already loaded
+def score_streamed_readings(rows):
+    return score_water_quality(model_registry.get("water_quality", timeout=0), rows)
+
+sensor_ingestor = SensorIngestor(
+    water_quality_collection,
+    score=score_streamed_readings if os.getenv("INGEST_SCORE_READINGS", "false").lower() == "true" else None,
+    on_flush=quality_rollups.record
+)
+# A JSON batch is offered to the buffer whole, so it can never be larger than the buffer itself
+INGEST_MAX_BATCH_READINGS = min(int(os.getenv("INGEST_MAX_BATCH_READINGS", 5000)), sensor_ingestor.max_pending)
+
+def ingest_backpressure_response(e, accepted, rejected):
+    logger.warning(str(e))
+    response = jsonify({"error": "Ingestion is backed up, retry later", "accepted": accepted, "rejected": rejected})
+    response.headers["Retry-After"] = str(max(1, int(sensor_ingestor.flush_seconds)))
+    return response, 429
+
+# Continuous sensor ingestion: a JSON {"device_id", "readings": [...]} batch, or a chunked
+# application/x-ndjson stream with one reading per line
+@app.route("/iot/ingest", methods=["POST"])
+@user_token_required
+def iot_ingest(current_user):
+    device_id = request.args.get("device_id")
+    accepted = 0
+    errors = []
+    try:
+        if request.mimetype == "application/x-ndjson":
+            chunk = []
+            line_no = 0
+            for line in request.stream:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    chunk.append(json.loads(line))
+                except ValueError:
+                    chunk.append(None)
+                line_no += 1
+                if len(chunk) >= sensor_ingestor.batch_size:
+                    documents, chunk_errors = sensor_ingestor.build_documents(chunk, current_user["phone"], device_id)
+                    sensor_ingestor.offer(documents, len(chunk_errors))
+                    accepted += len(documents)
+                    errors.extend((line_no - len(chunk) + i, message) for i, message in chunk_errors)
+                    chunk = []
+            documents, chunk_errors = sensor_ingestor.build_documents(chunk, current_user["phone"], device_id)
+            sensor_ingestor.offer(documents, len(chunk_errors))
+            accepted += len(documents)
+            errors.extend((line_no - len(chunk) + i, message) for i, message in chunk_errors)
+        else:
+            data = request.json or {}
+            readings = data.get("readings")
+            if not isinstance(readings, list) or not readings:
+                logger.error("No readings provided")
+                return jsonify({"error": "readings must be a non-empty list"}), 400
+            if len(readings) > INGEST_MAX_BATCH_READINGS:
+                logger.error(f"Too many readings: {len(readings)}")
+                return jsonify({"error": f"At most {INGEST_MAX_BATCH_READINGS} readings per request; use application/x-ndjson for larger uploads"}), 400
+            documents, errors = sensor_ingestor.build_documents(readings, current_user["phone"], data.get("device_id") or device_id)
+            sensor_ingestor.offer(documents, len(errors))
+            accepted = len(documents)
+    except IngestBackpressure as e:
+        return ingest_backpressure_response(e, accepted, len(errors))
+    except Exception as e:
+        logger.error(f"Error in iot_ingest: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+    logger.info(f"Ingested {accepted} sensor readings, rejected {len(errors)}")
+    return jsonify({
+        "accepted": accepted,
+        "rejected": len(errors),
+        "errors": [{"index": index, "error": message} for index, message in errors[:100]]
+    }), 202
+
+# Ingestion buffer and flush statistics
+@app.route("/iot/ingest/stats", methods=["GET"])
+@token_required
+def iot_ingest_stats(current_officer):
+    logger.info("Received iot_ingest_stats request")
+    return jsonify(sensor_ingestor.stats())
+
 # Simulate IoT data
 @app.route("/simulate_iot_data", methods=["POST"])
 @user_token_required
@@ -1325,25 +1668,15 @@ def simulate_iot_data(current_user):
         except ValueError:
             logger.error("Invalid coordinate format")
             return jsonify({"error": "Coordinates must be numeric"}), 400
-        try:
-            response = requests.get(
-                f"https://nominatim.openstreetmap.org/reverse?lat={lat}&lon={lng}&format=json",
-                headers={"User-Agent": "WaterQualityApp/1.0"}
-            )
-            response.raise_for_status()
-            address_data = response.json()
-            address = address_data.get("display_name", "Unknown address")
-            logger.info(f"Geocoded address: {address} for lat={lat}, lng={lng}")
-        except Exception as e:
-            logger.error(f"Failed to geocode coordinates: {str(e)}")
-            address = "Unknown address"
-        sensor_data = generate_sensor_data(lat, lng)
+        address = reverse_geocoder.reverse(lat, lng)
+        sensor_data = neighbourhood_sensor_data(lat, lng)
         simulation_id = str(uuid.uuid4())
         simulation_data = {
             "simulation_id": simulation_id,
             "user_phone": current_user["phone"],
             "latitude": lat,
             "longitude": lng,
+            "location": geo_point(lat, lng),
             "address": address,
             "ph": sensor_data["ph"],
             "turbidity": sensor_data["turbidity"],
@@ -1353,6 +1686,7 @@ def simulate_iot_data(current_user):
             "source": "simulated_iot"
         }
         water_quality_collection.insert_one(simulation_data)
+        quality_rollups.record([simulation_data])
         logger.info(f"Simulated IoT data for {address}: {sensor_data}")
         return jsonify({
             "simulation_id": simulation_id,
@@ -1365,128 +1699,41 @@ def simulate_iot_data(current_user):
         logger.error(f"Error in simulate_iot_data: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
-def generate_sensor_data(lat, lng):
+# Simulated reading that follows the neighbourhood's recent rollup means and pollution reports
+def neighbourhood_sensor_data(lat, lng):
     try:
         recent_date = datetime.datetime.utcnow() - datetime.timedelta(days=30)
-        nearby_predictions = list(water_quality_collection.find(
-            {
-                "created_at": {"$gte": recent_date},
-                "latitude": {"$exists": True},
-                "longitude": {"$exists": True}
-            },
-            {"ph": 1, "turbidity": 1, "temperature": 1, "conductivity": 1, "latitude": 1, "longitude": 1}
-        ))
-        nearby_params = []
-        for pred in nearby_predictions:
-            distance = haversine_distance(lat, lng, pred["latitude"], pred["longitude"])
-            if distance <= 1:
-                nearby_params.append({
-                    "ph": pred["ph"],
-                    "turbidity": pred["turbidity"],
-                    "temperature": pred["temperature"],
-                    "conductivity": pred["conductivity"]
-                })
-        nearby_issues = list(water_reports_collection.find(
-            {
-                "created_at": {"$gte": recent_date},
-                "latitude": {"$exists": True},
-                "longitude": {"$exists": True}
-            },
-            {"status": 1, "latitude": 1, "longitude": 1}
-        ))
-        has_pollution = any(
-            issue["status"] == "pollution" and
-            haversine_distance(lat, lng, issue["latitude"], issue["longitude"]) <= 1
-            for issue in nearby_issues
-        )
-        ph = random.uniform(6.5, 8.5)
-        turbidity = random.uniform(0, 10)
-        temperature = random.uniform(15, 30)
-        conductivity = random.uniform(100, 1000)
-        if nearby_params:
-            avg_ph = sum(p["ph"] for p in nearby_params) / len(nearby_params)
-            avg_turbidity = sum(p["turbidity"] for p in nearby_params) / len(nearby_params)
-            avg_temperature = sum(p["temperature"] for p in nearby_params) / len(nearby_params)
-            avg_conductivity = sum(p["conductivity"] for p in nearby_params) / len(nearby_params)
-            ph = random.uniform(max(0, avg_ph - 0.5), min(14, avg_ph + 0.5))
-            turbidity = random.uniform(max(0, avg_turbidity - 2), avg_turbidity + 2)
-            temperature = random.uniform(max(0, avg_temperature - 5), avg_temperature + 5)
-            conductivity = random.uniform(max(0, avg_conductivity - 100), avg_conductivity + 100)
-        if has_pollution:
-            ph = random.uniform(5.5, 7.0)
-            turbidity = random.uniform(10, 50)
-            conductivity = random.uniform(500, 1500)
-        ph = max(0, min(14, ph))
-        turbidity = max(0, min(100, turbidity))
-        temperature = max(0, min(100, temperature))
-        conductivity = max(0, min(2000, conductivity))
-        return {
-            "ph": round(ph, 2),
-            "turbidity": round(turbidity, 2),
-            "temperature": round(temperature, 2),
-            "conductivity": round(conductivity, 2)
-        }
+        stats = quality_rollups.neighbourhood_stats(lat, lng, 1, since=recent_date)
+        has_pollution = report_neighbourhood.exists_within(lat, lng, 1, since=recent_date, match={"status": "pollution"})
     except Exception as e:
-        logger.error(f"Error generating sensor data: {str(e)}")
-        return {
-            "ph": round(random.uniform(6.5, 8.5), 2),
-            "turbidity": round(random.uniform(0, 10), 2),
-            "temperature": round(random.uniform(15, 30), 2),
-            "conductivity": round(random.uniform(100, 1000), 2)
-        }
+        logger.error(f"Error loading neighbourhood for sensor simulation: {str(e)}")
+        stats, has_pollution = None, False
+    return generate_sensor_data(stats, has_pollution)
 
-# Train clustering model for flow optimization
-def train_clustering_model(reports):
-    try:
-        if len(reports) < 3:
-            logger.warning("Insufficient reports for clustering")
-            return None, None
-        X = []
-        for report in reports:
-            severity = 0.8 if report["status"] == "scarcity" else 0.6 if report["status"] == "leakage" else 0.2
-            X.append([report["latitude"], report["longitude"], severity])
-        X = np.array(X)
-        scaler = StandardScaler()
-        X_scaled = scaler.fit_transform(X)
-        kmeans = KMeans(n_clusters=min(3, len(X)), random_state=42)
-        kmeans.fit(X_scaled)
-        logger.info("Clustering model trained successfully")
-        return kmeans, scaler
-    except Exception as e:
-        logger.error(f"Error training clustering model: {str(e)}")
-        return None, None
+# Clustering engine for flow optimization
+clustering_engine = ClusteringEngine()
+index_manager.index(flow_optimizations_collection, [("created_at", -1)])
+index_manager.query("latest_flow_centres", flow_optimizations_collection, {}, sort=[("created_at", -1)])
 
-# Generate flow recommendations based on clusters
-def generate_recommendations(kmeans, scaler, reports):
+# Turn cluster summaries into recommendations; only the cluster centres are geocoded
+def generate_recommendations(clusters):
     try:
-        X = [[r["latitude"], r["longitude"], 0.8 if r["status"] == "scarcity" else 0.6 if r["status"] == "leakage" else 0.2] for r in reports]
-        X_scaled = scaler.transform(X)
-        labels = kmeans.predict(X_scaled)
         recommendations = []
-        for cluster_id in range(kmeans.n_clusters):
-            cluster_reports = [r for i, r in enumerate(reports) if labels[i] == cluster_id]
-            if not cluster_reports:
-                continue
-            cluster_center = scaler.inverse_transform(kmeans.cluster_centers_)[cluster_id][:2]
-            scarcity_count = sum(1 for r in cluster_reports if r["status"] == "scarcity")
-            leakage_count = sum(1 for r in cluster_reports if r["status"] == "leakage")
+        for cluster in clusters:
+            center = cluster["center"]
+            scarcity_count = cluster["scarcity_count"]
+            leakage_count = cluster["leakage_count"]
             if scarcity_count > leakage_count:
-                recommendation = f"Redirect {min(20, scarcity_count * 5)}% water flow to area near ({cluster_center[0]:.4f}, {cluster_center[1]:.4f}) due to high scarcity."
+                recommendation = f"Redirect {min(20, scarcity_count * 5)}% water flow to area near ({center['latitude']:.4f}, {center['longitude']:.4f}) due to high scarcity."
             else:
-                recommendation = f"Repair leaks near ({cluster_center[0]:.4f}, {cluster_center[1]:.4f}) to reduce {min(20, leakage_count * 5)}% water loss."
-            try:
-                response = requests.get(
-                    f"https://nominatim.openstreetmap.org/reverse?lat={cluster_center[0]}&lon={cluster_center[1]}&format=json",
-                    headers={"User-Agent": "WaterQualityApp/1.0"}
-                )
-                response.raise_for_status()
-                address = response.json().get("display_name", "Unknown address")
-            except Exception as e:
-                logger.error(f"Failed to geocode cluster center: {str(e)}")
-                address = "Unknown address"
+                recommendation = f"Repair leaks near ({center['latitude']:.4f}, {center['longitude']:.4f}) to reduce {min(20, leakage_count * 5)}% water loss."
+            address = reverse_geocoder.reverse(center["latitude"], center["longitude"])
             recommendations.append({
-                "cluster_id": int(cluster_id),
-                "center": {"latitude": float(cluster_center[0]), "longitude": float(cluster_center[1])},
+                "cluster_id": cluster["cluster_id"],
+                "center": center,
+                "severity": cluster["severity"],
+                "size": cluster["size"],
+                "bbox": cluster["bbox"],
                 "address": address,
                 "scarcity_count": scarcity_count,
                 "leakage_count": leakage_count,
@@ -1497,117 +1744,332 @@ def generate_recommendations(kmeans, scaler, reports):
         logger.error(f"Error generating recommendations: {str(e)}")
         return []
 
-# Optimize water flow
+index_manager.index(water_reports_collection, [("status", 1), ("created_at", -1)])
+index_manager.query(
+    "recent_flow_reports",
+    water_reports_collection,
+    {"created_at": {"$gte": datetime.datetime(2000, 1, 1)}, "status": {"$in": ["scarcity", "leakage"]}}
+)
+
+FLOW_MAX_POINTS = int(os.getenv("FLOW_MAX_POINTS", 5000))
+
+# Cluster reports and build recommendations; runs on the flow job pool, never on a request thread.
+# The labelled, downsampled points are stored with the result so the dashboard never reclusters or rescans reports.
+def compute_flow_recommendations(reports):
+    # The latest run's centres warm-start k-means, so a small change in reports converges quickly
+    previous = flow_optimizations_collection.find_one({}, {"recommendations.center": 1}, sort=[("created_at", -1)])
+    previous_centers = [rec["center"] for rec in (previous or {}).get("recommendations", [])]
+    try:
+        clusters, labels = clustering_engine.cluster(reports, previous_centers or None, with_labels=True)
+    except Exception as e:
+        logger.error(f"Error clustering flow reports: {str(e)}")
+        raise FlowJobError("Failed to train clustering model")
+    recommendations = generate_recommendations(clusters)
+    if not recommendations:
+        raise FlowJobError("No actionable recommendations generated")
+    return {
+        "recommendations": recommendations,
+        "points": sample_points(reports, labels, FLOW_MAX_POINTS),
+        "point_count": len(reports)
+    }
+
+def send_flow_recommendations(officer, recommendations):
+    sms_body = "Water flow optimization recommendations:\n" + "\n".join(
+        [f"- {r['recommendation']} ({r['address']})" for r in recommendations]
+    )
+    notification_outbox.enqueue_sms(officer["phone"], sms_body)
+
+flow_jobs = FlowJobRunner(
+    flow_jobs_collection,
+    flow_optimizations_collection,
+    water_reports_collection,
+    compute_flow_recommendations,
+    on_complete=send_flow_recommendations
+)
+FLOW_SYNC_WAIT_SECONDS = float(os.getenv("FLOW_SYNC_WAIT_SECONDS", 3))
+
+def flow_job_links(job):
+    job["status_url"] = f"/optimize_flow/jobs/{job['job_id']}"
+    job["events_url"] = f"/optimize_flow/jobs/{job['job_id']}/events"
+    return job
+
+# Start a flow optimization job
+@app.route("/optimize_flow/jobs", methods=["POST"])
+@token_required
+def create_flow_job(current_officer):
+    logger.info("Received create_flow_job request")
+    try:
+        job = flow_jobs.submit(current_officer)
+        return jsonify(flow_job_links(job)), 200 if job["status"] == "completed" else 202
+    except FlowJobError as e:
+        logger.warning(str(e))
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in create_flow_job: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+# Poll a flow optimization job
+@app.route("/optimize_flow/jobs/<job_id>", methods=["GET"])
+@token_required
+def get_flow_job(current_officer, job_id):
+    job = flow_jobs.get(job_id, current_officer["email"])
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(flow_job_links(job))
+
+# Server-sent events for a flow optimization job
+@app.route("/optimize_flow/jobs/<job_id>/events", methods=["GET"])
+@token_required
+def flow_job_events(current_officer, job_id):
+    if not flow_jobs.get(job_id, current_officer["email"]):
+        return jsonify({"error": "Job not found"}), 404
+    response = Response(flow_jobs.events(job_id), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+# Optimize water flow; kept for existing clients, it submits a job and waits briefly (FLOW_SYNC_WAIT_SECONDS)
+# for a fast or cached run, otherwise answers 202 with the job's status_url
 @app.route("/optimize_flow", methods=["POST"])
 @token_required
 def optimize_flow(current_officer):
     logger.info("Received optimize_flow request")
     try:
-        recent_date = datetime.datetime.utcnow() - datetime.timedelta(days=30)
-        reports = list(water_reports_collection.find(
-            {"created_at": {"$gte": recent_date}, "status": {"$in": ["scarcity", "leakage"]}},
-            {"latitude": 1, "longitude": 1, "status": 1, "address": 1}
-        ))
-        if len(reports) < 3:
-            logger.warning("Insufficient reports for flow optimization")
-            return jsonify({"error": "Insufficient reports for optimization (need at least 3)"}), 400
-        
-        kmeans, scaler = train_clustering_model(reports)
-        if not kmeans or not scaler:
-            logger.error("Failed to train clustering model")
-            return jsonify({"error": "Failed to train clustering model"}), 500
-        
-        recommendations = generate_recommendations(kmeans, scaler, reports)
-        if not recommendations:
-            logger.warning("No recommendations generated")
-            return jsonify({"error": "No actionable recommendations generated"}), 400
-        
-        optimization_id = str(uuid.uuid4())
-        optimization_data = {
-            "optimization_id": optimization_id,
-            "officer_email": current_officer["email"],
-            "recommendations": recommendations,
-            "created_at": datetime.datetime.utcnow()
-        }
-        flow_optimizations_collection.insert_one(optimization_data)
-
-        sms_body = "Water flow optimization recommendations:\n" + "\n".join(
-            [f"- {r['recommendation']} ({r['address']})" for r in recommendations]
+        job = flow_jobs.submit(current_officer)
+        if job["status"] != "completed":
+            job = flow_jobs.wait(job["job_id"], FLOW_SYNC_WAIT_SECONDS)
+        if job["status"] == "failed":
+            return jsonify({"error": job["error"]}), 500
+        if job["status"] != "completed":
+            return jsonify(flow_job_links(job)), 202
+        optimization = flow_optimizations_collection.find_one(
+            {"optimization_id": job["optimization_id"]},
+            {"_id": 0, "optimization_id": 1, "recommendations": 1}
         )
-        try:
-            client_twilio.messages.create(
-                body=sms_body[:1600],
-                from_=twilio_phone,
-                to=current_officer["phone"]
-            )
-            logger.info(f"SMS sent to {current_officer['phone']} with optimization recommendations")
-        except Exception as e:
-            logger.error(f"Failed to send SMS to {current_officer['phone']}: {str(e)}")
-
-        logger.info(f"Flow optimization completed: {optimization_id}")
+        logger.info(f"Flow optimization completed: {job['optimization_id']}")
         return jsonify({
-            "optimization_id": optimization_id,
-            "recommendations": recommendations
+            "optimization_id": optimization["optimization_id"],
+            "recommendations": optimization["recommendations"],
+            "cached": job["cached"]
         })
-
+    except FlowJobError as e:
+        logger.warning(str(e))
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"Error in optimize_flow: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 
-# Flow dashboard data
+index_manager.index(flow_optimizations_collection, [("officer_email", 1), ("created_at", -1)])
+index_manager.query("latest_optimization", flow_optimizations_collection, {"officer_email": ""}, sort=[("created_at", -1)])
+index_manager.index(flow_optimizations_collection, [("optimization_id", 1)])
+index_manager.query("optimization_by_id", flow_optimizations_collection, {"optimization_id": ""})
+
+flow_dashboard_cache = DashboardCache()
+
+# The officer's latest optimization as (optimization_id, has_points); legacy documents stored before
+# points were persisted render from live reports, so they must not be cached or given an ETag
+def latest_flow_optimization(officer_email):
+    latest = flow_optimizations_collection.find_one(
+        {"officer_email": officer_email},
+        {"_id": 0, "optimization_id": 1, "point_count": 1},
+        sort=[("created_at", -1)]
+    )
+    if not latest:
+        return None, False
+    return latest["optimization_id"], "point_count" in latest
+
+# Optimizations stored before points were persisted: rebuild unlabelled points from the reports
+def legacy_flow_points():
+    recent_date = datetime.datetime.utcnow() - datetime.timedelta(days=30)
+    return [
+        {
+            "latitude": r["latitude"],
+            "longitude": r["longitude"],
+            "status": r["status"],
+            "address": r.get("address"),
+            "cluster_id": None
+        } for r in water_reports_collection.find(
+            {"created_at": {"$gte": recent_date}, "status": {"$in": ["scarcity", "leakage"]}},
+            {"_id": 0, "latitude": 1, "longitude": 1, "status": 1, "address": 1}
+        )
+    ]
+
+def render_flow_dashboard(optimization_id, bbox):
+    optimization = flow_optimizations_collection.find_one(
+        {"optimization_id": optimization_id},
+        {"_id": 0, "optimization_id": 1, "recommendations": 1, "points": 1, "point_count": 1, "created_at": 1}
+    )
+    clusters = [
+        {
+            "cluster_id": rec["cluster_id"],
+            "center": rec["center"],
+            "address": rec["address"],
+            "size": rec.get("size", rec["scarcity_count"] + rec["leakage_count"]),
+            "bbox": rec.get("bbox"),
+            "scarcity_count": rec["scarcity_count"],
+            "leakage_count": rec["leakage_count"],
+            "recommendation": rec["recommendation"]
+        } for rec in optimization["recommendations"]
+    ]
+    points = optimization.get("points")
+    if points is None:
+        points = legacy_flow_points()
+    points = points_in_bbox(points, bbox)
+    created_at = optimization["created_at"]
+    return app.json.dumps({
+        "clusters": clusters,
+        "points": points,
+        "point_count": optimization.get("point_count", len(points)),
+        "optimization_id": optimization["optimization_id"],
+        "created_at": created_at.isoformat() if isinstance(created_at, datetime.datetime) else created_at
+    })
+
+# Flow dashboard data: one indexed lookup of the latest optimization_id, then either a 304,
+# a cached body, or a render from that single stored document
 @app.route("/flow_dashboard", methods=["GET"])
 @token_required
 def flow_dashboard(current_officer):
     logger.info("Received flow_dashboard request")
     try:
-        optimizations = list(flow_optimizations_collection.find(
-            {"officer_email": current_officer["email"]},
-            {"_id": 0, "optimization_id": 1, "recommendations": 1, "created_at": 1}
-        ).sort("created_at", -1).limit(1))
-        if not optimizations:
+        bbox = parse_bbox(request.args.get("bbox"))
+        if bbox == []:
+            logger.error("Invalid bbox")
+            return jsonify({"error": "bbox must be min_lng,min_lat,max_lng,max_lat"}), 400
+        optimization_id, has_points = latest_flow_optimization(current_officer["email"])
+        if not optimization_id:
             logger.info("No optimization data available")
             return jsonify({"clusters": [], "recommendations": []})
-        recent_date = datetime.datetime.utcnow() - datetime.timedelta(days=30)
-        reports = list(water_reports_collection.find(
-            {"created_at": {"$gte": recent_date}, "status": {"$in": ["scarcity", "leakage"]}},
-            {"latitude": 1, "longitude": 1, "status": 1, "address": 1}
-        ))
-        latest_optimization = optimizations[0]
-        clusters = []
-        for rec in latest_optimization["recommendations"]:
-            clusters.append({
-                "cluster_id": rec["cluster_id"],
-                "center": rec["center"],
-                "address": rec["address"],
-                "scarcity_count": rec["scarcity_count"],
-                "leakage_count": rec["leakage_count"],
-                "recommendation": rec["recommendation"]
-            })
-        points = [
-            {
-                "latitude": r["latitude"],
-                "longitude": r["longitude"],
-                "status": r["status"],
-                "address": r["address"]
-            } for r in reports
-        ]
-        logger.info(f"Returning flow dashboard data with {len(clusters)} clusters")
+        if not has_points:
+            response = Response(render_flow_dashboard(optimization_id, bbox), mimetype="application/json")
+            response.headers["Cache-Control"] = "no-store"
+            logger.info(f"Returning legacy flow dashboard data for optimization {optimization_id}")
+            return response
+        key = (current_officer["email"], optimization_id, tuple(bbox) if bbox else None)
+        etag = DashboardCache.etag(*key)
+        if etag in request.if_none_match:
+            response = Response(status=304)
+        else:
+            body = flow_dashboard_cache.get(key)
+            if body is None:
+                body = render_flow_dashboard(optimization_id, bbox)
+                flow_dashboard_cache.put(key, body)
+            response = Response(body, mimetype="application/json")
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "private, no-cache"
+        logger.info(f"Returning flow dashboard data for optimization {optimization_id}")
+        return response
+    except Exception as e:
+        logger.error(f"Error in flow_dashboard: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+# Flow dashboard cache statistics
+@app.route("/flow_dashboard/cache_stats", methods=["GET"])
+@token_required
+def flow_dashboard_cache_stats(current_officer):
+    logger.info("Received flow_dashboard_cache_stats request")
+    return jsonify(flow_dashboard_cache.stats())
+
+# Stored dashboard points as NDJSON, one point per line, optionally limited to a bbox or cluster
+@app.route("/flow_dashboard/points", methods=["GET"])
+@token_required
+def flow_dashboard_points(current_officer):
+    logger.info("Received flow_dashboard_points request")
+    try:
+        bbox = parse_bbox(request.args.get("bbox"))
+        if bbox == []:
+            logger.error("Invalid bbox")
+            return jsonify({"error": "bbox must be min_lng,min_lat,max_lng,max_lat"}), 400
+        cluster_id = request.args.get("cluster_id", type=int)
+        optimization_id = request.args.get("optimization_id") or latest_flow_optimization(current_officer["email"])[0]
+        optimization = optimization_id and flow_optimizations_collection.find_one(
+            {"optimization_id": optimization_id, "officer_email": current_officer["email"]},
+            {"_id": 0, "points": 1}
+        )
+        if not optimization:
+            return jsonify({"error": "Optimization not found"}), 404
+        points = optimization.get("points")
+        if points is None:
+            points = legacy_flow_points()
+        points = points_in_bbox(points, bbox)
+        if cluster_id is not None:
+            points = [p for p in points if p["cluster_id"] == cluster_id]
+
+        def stream():
+            for point in points:
+                yield app.json.dumps(point) + "\n"
+        response = Response(stream(), mimetype="application/x-ndjson")
+        response.headers["X-Optimization-Id"] = optimization_id
+        return response
+    except Exception as e:
+        logger.error(f"Error in flow_dashboard_points: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+# Query plan audit: reports registered query shapes that fall back to collection scans
+@app.route("/debug/query_plans", methods=["GET"])
+@token_required
+def debug_query_plans(current_officer):
+    logger.info("Received debug_query_plans request")
+    try:
+        plans = index_manager.audit()
         return jsonify({
-            "clusters": clusters,
-            "points": points,
-            "optimization_id": latest_optimization["optimization_id"],
-            "created_at": latest_optimization["created_at"].isoformat() if isinstance(latest_optimization["created_at"], datetime.datetime) else latest_optimization["created_at"]
+            "collection_scans": [p["query"] for p in plans if p.get("collection_scan")],
+            "plans": plans
         })
     except Exception as e:
-        logger.error(f"Error in flow_dashboard: {str(e)}")
+        logger.error(f"Error auditing query plans: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.cli.command("audit-indexes")
+def audit_indexes_command():
+    ensure_all_indexes()
+    plans = index_manager.audit()
+    for plan in plans:
+        status = "COLLSCAN" if plan.get("collection_scan") else ("ERROR" if "error" in plan else "ok")
+        print(f"{status:>8}  {plan['collection']}.{plan['query']}  {' > '.join(plan.get('stages', []))}")
+    if any(plan.get("collection_scan") for plan in plans):
+        raise SystemExit(1)
+
+# Every index the app relies on: the index_manager registry plus those owned by each store.
+# Queries registered with index_manager may depend on any of them, so the audit creates them all.
+def ensure_all_indexes():
+    index_manager.ensure_indexes()
+    ensure_geo_indexes(water_reports_collection, water_quality_collection)
+    notification_outbox.ensure_indexes()
+    reverse_geocoder.ensure_indexes()
+    heatmap_store.ensure_indexes()
+    community_leaderboard.ensure_indexes()
+    quality_rollups.ensure_indexes()
+    officer_scheduler.ensure_indexes()
+    otp_store.ensure_indexes()
+    upvote_store.ensure_indexes()
+    flow_jobs.ensure_indexes()
+
+# One-time schema, index and rebuild work; runs once in the server parent before workers fork
+def prepare_database():
+    initialize_water_reports_schema()
+    ensure_all_indexes()
+    heatmap_store.rebuild_if_empty()
+    quality_rollups.rebuild_if_empty()
+    officer_scheduler.migrate()
+    upvote_store.migrate()
+    comment_store.migrate_counts()
+    flow_jobs.recover()
+
+# Per-process threads; under gunicorn each worker calls this from post_fork
+def start_background_services():
+    model_registry.start()
+    predictive_retrainer.start()
+    notification_outbox.start()
+    community_leaderboard.start()
+    sensor_ingestor.start()
+
 # Main entry point
 if __name__ == "__main__":
     try:
-        initialize_water_reports_schema()
-        logger.info("Starting Flask application")
+        prepare_database()
+        start_background_services()
+        logger.info("Starting Flask development server; use gunicorn -c gunicorn.conf.py in production")
         app.run(debug=False, host="0.0.0.0", port=5000)
     except Exception as e:
         logger.error(f"Failed to start Flask application: {str(e)}", exc_info=True)
@@ -0,0 +1,94 @@
+import logging
+import os
+
+from pymongo import ReturnDocument
+
+from geo import EARTH_RADIUS_KM
+
+logger = logging.getLogger(__name__)
+
+
+# Atomic officer assignment on open workload. open_reports goes up when a report is assigned and
+# down when it is resolved; assigned_reports stays a lifetime count for the profile page.
+class OfficerScheduler:
+    def __init__(self, collection, reports_collection, on_change=None, nearby_radius_km=None):
+        self.collection = collection
+        self.reports_collection = reports_collection
+        self.on_change = on_change
+        self.nearby_radius_km = nearby_radius_km if nearby_radius_km is not None else float(os.getenv("ASSIGN_NEARBY_RADIUS_KM", 0))
+
+    def ensure_indexes(self):
+        self.collection.create_index([("open_reports", 1)])
+        self.collection.create_index([("location", "2dsphere")])
+
+    # Backfill open_reports from unresolved reports for officers created before the field existed
+    def migrate(self):
+        missing = list(self.collection.find({"open_reports": {"$exists": False}}, {"name": 1}))
+        if not missing:
+            return
+        counts = {
+            row["_id"]: row["count"]
+            for row in self.reports_collection.aggregate([
+                {"$match": {"resolved": {"$ne": True}, "assigned_officer": {"$in": [officer.get("name") for officer in missing]}}},
+                {"$group": {"_id": "$assigned_officer", "count": {"$sum": 1}}}
+            ])
+        }
+        for officer in missing:
+            self.collection.update_one(
+                {"_id": officer["_id"], "open_reports": {"$exists": False}},
+                {"$set": {"open_reports": counts.get(officer.get("name"), 0)}}
+            )
+        logger.info(f"Backfilled open_reports for {len(missing)} officers")
+
+    def _claim(self, filter, charge):
+        return self.collection.find_one_and_update(
+            filter,
+            {"$inc": {"open_reports": 1, "assigned_reports": 1} if charge else {"assigned_reports": 1}},
+            sort=[("open_reports", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    # Pick and charge the least-loaded officer in one find_one_and_update, so concurrent
+    # submissions can never read the same count. With ASSIGN_NEARBY_RADIUS_KM set, officers
+    # with a location inside that radius are tried first. charge=False is for alerts that never
+    # become a report (water quality): the officer is still picked by open workload, but nothing
+    # would ever release the slot, so open_reports is left alone.
+    def assign(self, lat=None, lng=None, charge=True):
+        try:
+            officer = None
+            if self.nearby_radius_km and lat is not None and lng is not None:
+                officer = self._claim({
+                    "location": {"$geoWithin": {"$centerSphere": [[float(lng), float(lat)], self.nearby_radius_km / EARTH_RADIUS_KM]}}
+                }, charge)
+            if officer is None:
+                officer = self._claim({}, charge)
+            if officer is None:
+                logger.warning("No officers available")
+                return None
+            if self.on_change:
+                self.on_change(officer)
+            logger.info(f"Officer assigned: {officer.get('name', 'Unknown')} ({officer.get('open_reports')} open)")
+            return officer
+        except Exception as e:
+            logger.error(f"Error assigning officer: {str(e)}")
+            return None
+
+    # Return a report's slot to its officer once it is resolved
+    def release(self, report):
+        if report.get("officer_email"):
+            filter = {"email": report["officer_email"]}
+        elif report.get("assigned_officer"):
+            filter = {"name": report["assigned_officer"]}
+        else:
+            return
+        try:
+            filter["open_reports"] = {"$gt": 0}
+            officer = self.collection.find_one_and_update(
+                filter,
+                {"$inc": {"open_reports": -1}},
+                return_document=ReturnDocument.AFTER
+            )
+            if officer and self.on_change:
+                self.on_change(officer)
+        except Exception as e:
+            logger.error(f"Error releasing officer workload: {str(e)}")
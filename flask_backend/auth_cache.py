@@ -0,0 +1,78 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+logger = logging.getLogger(__name__)
+
+
+# Bounded TTL cache of verified principals keyed on the raw JWT
+class PrincipalCache:
+    def __init__(self, max_entries=None, ttl_seconds=None):
+        self.max_entries = max_entries or int(os.getenv("AUTH_CACHE_MAX_ENTRIES", 10000))
+        self.ttl_seconds = ttl_seconds or float(os.getenv("AUTH_CACHE_TTL_SECONDS", 60))
+        self._entries = OrderedDict()
+        self._tokens_by_identity = defaultdict(set)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, token):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            principal, identity, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._remove(token, identity)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return dict(principal)
+
+    # Cache until the TTL or the token's own exp claim, whichever comes first
+    def put(self, token, kind, key, principal, token_exp):
+        expires_at = time.monotonic() + min(self.ttl_seconds, token_exp - time.time())
+        identity = (kind, key)
+        with self._lock:
+            if token in self._entries:
+                self._remove(token, self._entries[token][1])
+            self._entries[token] = (principal, identity, expires_at)
+            self._tokens_by_identity[identity].add(token)
+            while len(self._entries) > self.max_entries:
+                oldest, (_, oldest_identity, _) = next(iter(self._entries.items()))
+                self._remove(oldest, oldest_identity)
+
+    # Drop every cached token for a principal whose record changed
+    def invalidate(self, kind, key):
+        with self._lock:
+            tokens = self._tokens_by_identity.pop((kind, key), set())
+            for token in tokens:
+                self._entries.pop(token, None)
+            if tokens:
+                self.invalidations += 1
+
+    def _remove(self, token, identity):
+        self._entries.pop(token, None)
+        tokens = self._tokens_by_identity.get(identity)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_identity[identity]
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0
+            }
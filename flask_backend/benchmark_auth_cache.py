@@ -0,0 +1,64 @@
+import datetime
+import os
+import statistics
+import time
+
+import jwt
+from pymongo import MongoClient
+
+from auth_cache import PrincipalCache
+
+# Per-request cost of token_required's principal lookup with and without PrincipalCache,
+# against a throwaway database on the local MongoDB
+SECRET_KEY = os.getenv("SECRET_KEY", "your_secret_key")
+REQUESTS = int(os.getenv("BENCH_REQUESTS", 2000))
+
+
+def resolve_uncached(token, officers):
+    data = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+    return officers.find_one({"email": data["email"]})
+
+
+def resolve_cached(token, officers, cache):
+    officer = cache.get(token)
+    if officer is None:
+        data = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+        officer = officers.find_one({"email": data["email"]})
+        cache.put(token, "officer", data["email"], officer, data["exp"])
+    return officer
+
+
+def measure(fn):
+    samples = []
+    for _ in range(REQUESTS):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return statistics.mean(samples), samples[len(samples) // 2], samples[int(len(samples) * 0.99)]
+
+
+if __name__ == "__main__":
+    client = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017/"), serverSelectionTimeoutMS=5000)
+    db = client["WaterIssuesBenchmark"]
+    officers = db["Officers"]
+    officers.delete_many({})
+    officers.insert_one({"name": "Bench Officer", "email": "bench@example.com", "phone": "+10000000000", "assigned_reports": 0})
+    officers.create_index("email")
+    token = jwt.encode(
+        {"email": "bench@example.com", "exp": datetime.datetime.utcnow() + datetime.timedelta(hours=1)},
+        SECRET_KEY,
+        algorithm="HS256"
+    )
+    cache = PrincipalCache()
+    try:
+        print(f"{'mode':>10} {'mean (us)':>10} {'p50 (us)':>10} {'p99 (us)':>10}")
+        for mode, fn in (
+            ("uncached", lambda: resolve_uncached(token, officers)),
+            ("cached", lambda: resolve_cached(token, officers, cache))
+        ):
+            mean, p50, p99 = measure(fn)
+            print(f"{mode:>10} {mean:>10.1f} {p50:>10.1f} {p99:>10.1f}")
+        print(cache.stats())
+    finally:
+        client.drop_database("WaterIssuesBenchmark")
@@ -0,0 +1,62 @@
+import os
+import time
+
+import numpy as np
+from sklearn.cluster import KMeans
+from sklearn.preprocessing import StandardScaler
+
+from clustering import ClusteringEngine
+
+# Flow clustering cost across report volumes: the old StandardScaler + KMeans(k=3) path with
+# per-cluster list comprehensions against ClusteringEngine, cold and warm-started
+VOLUMES = [int(n) for n in os.getenv("BENCH_VOLUMES", "1000,10000,100000,300000").split(",")]
+HOTSPOTS = int(os.getenv("BENCH_HOTSPOTS", 8))
+
+
+def synthetic_reports(n, seed=0):
+    rng = np.random.default_rng(seed)
+    centres = rng.uniform([12.85, 77.45], [13.10, 77.75], size=(HOTSPOTS, 2))
+    which = rng.integers(0, HOTSPOTS, n)
+    points = centres[which] + rng.normal(0, 0.01, size=(n, 2))
+    statuses = np.where(rng.random(n) < np.linspace(0.2, 0.8, HOTSPOTS)[which], "scarcity", "leakage")
+    return [{"latitude": float(lat), "longitude": float(lng), "status": str(status)} for (lat, lng), status in zip(points, statuses)]
+
+
+# The previous train_clustering_model + generate_recommendations, without geocoding
+def legacy(reports):
+    X = np.array([[r["latitude"], r["longitude"], 0.8 if r["status"] == "scarcity" else 0.6 if r["status"] == "leakage" else 0.2] for r in reports])
+    scaler = StandardScaler()
+    kmeans = KMeans(n_clusters=min(3, len(X)), random_state=42).fit(scaler.fit_transform(X))
+    X = [[r["latitude"], r["longitude"], 0.8 if r["status"] == "scarcity" else 0.6 if r["status"] == "leakage" else 0.2] for r in reports]
+    labels = kmeans.predict(scaler.transform(X))
+    clusters = []
+    for cluster_id in range(kmeans.n_clusters):
+        cluster_reports = [r for i, r in enumerate(reports) if labels[i] == cluster_id]
+        clusters.append((
+            sum(1 for r in cluster_reports if r["status"] == "scarcity"),
+            sum(1 for r in cluster_reports if r["status"] == "leakage")
+        ))
+    return clusters
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - started, result
+
+
+if __name__ == "__main__":
+    engine = ClusteringEngine()
+    print(f"{HOTSPOTS} synthetic hotspots")
+    print(f"{'reports':>8} {'legacy (s)':>11} {'engine (s)':>11} {'warm (s)':>9} {'k':>3} {'dbscan (s)':>11} {'k':>4}")
+    for n in VOLUMES:
+        reports = synthetic_reports(n)
+        legacy_seconds, _ = timed(lambda: legacy(reports))
+        cold_seconds, clusters = timed(lambda: engine.cluster(reports))
+        # A later run over slightly different reports, seeded with this run's centres
+        previous = [c["center"] for c in clusters]
+        changed = reports[: int(n * 0.95)] + synthetic_reports(n - int(n * 0.95), seed=1)
+        warm_seconds, _ = timed(lambda: engine.cluster(changed, previous))
+        dbscan = ClusteringEngine(mode="dbscan")
+        dbscan_seconds, dense = timed(lambda: dbscan.cluster(reports)) if n <= 100000 else (float("nan"), [])
+        print(f"{n:>8} {legacy_seconds:>11.2f} {cold_seconds:>11.2f} {warm_seconds:>9.2f} {len(clusters):>3} {dbscan_seconds:>11.2f} {len(dense):>4}")
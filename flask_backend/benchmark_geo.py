@@ -0,0 +1,107 @@
+import math
+import time
+
+import numpy as np
+
+from geo import haversine_many, haversine_matrix, masked_stats, neighbourhood_stats, sensor_columns
+
+# Compare the per-document haversine loops with the vectorized geo module. The end-to-end numpy
+# time (neighbourhood_stats) includes converting the documents to columns, which any caller
+# holding documents pays too; the columns and stats columns split that time up.
+np.random.seed(42)
+CENTER = (12.9716, 77.5946)
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    R = 6371
+    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
+    c = 2 * math.asin(math.sqrt(a))
+    return R * c
+
+
+def loop_averages(docs, lat, lng):
+    nearby_params = []
+    for pred in docs:
+        if haversine_distance(lat, lng, pred["latitude"], pred["longitude"]) <= 1:
+            nearby_params.append({
+                "ph": pred["ph"],
+                "turbidity": pred["turbidity"],
+                "temperature": pred["temperature"],
+                "conductivity": pred["conductivity"]
+            })
+    if not nearby_params:
+        return None
+    return [
+        sum(p["ph"] for p in nearby_params) / len(nearby_params),
+        sum(p["turbidity"] for p in nearby_params) / len(nearby_params),
+        sum(p["temperature"] for p in nearby_params) / len(nearby_params),
+        sum(p["conductivity"] for p in nearby_params) / len(nearby_params)
+    ]
+
+
+def make_docs(n):
+    lats = CENTER[0] + np.random.uniform(-0.1, 0.1, n)
+    lngs = CENTER[1] + np.random.uniform(-0.1, 0.1, n)
+    values = np.column_stack((
+        np.random.uniform(6.5, 8.5, n),
+        np.random.uniform(0, 10, n),
+        np.random.uniform(15, 30, n),
+        np.random.uniform(100, 1000, n)
+    ))
+    docs = [
+        {"latitude": lat, "longitude": lng, "ph": v[0], "turbidity": v[1], "temperature": v[2], "conductivity": v[3]}
+        for lat, lng, v in zip(lats.tolist(), lngs.tolist(), values.tolist())
+    ]
+    return docs
+
+
+def timed(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+# Every pairwise distance between two point sets, one haversine_distance call per pair
+def loop_matrix(lats1, lngs1, lats2, lngs2):
+    return [[haversine_distance(a, b, c, d) for c, d in zip(lats2, lngs2)] for a, b in zip(lats1, lngs1)]
+
+
+def bench_neighbourhood():
+    print(f"{'points':>10} {'loop (s)':>10} {'columns (s)':>12} {'stats (s)':>10} {'numpy (s)':>10} {'speedup':>8}")
+    for n in (10_000, 100_000, 1_000_000):
+        docs = make_docs(n)
+        repeat = 1 if n >= 1_000_000 else 3
+        loop_time, expected = timed(lambda: loop_averages(docs, *CENTER), repeat=repeat)
+        columns_time, (lats, lngs, values) = timed(lambda: sensor_columns(docs), repeat=repeat)
+        stats_time, _ = timed(lambda: masked_stats(values, haversine_many(CENTER[0], CENTER[1], lats, lngs) <= 1), repeat=repeat)
+        numpy_time, stats = timed(lambda: neighbourhood_stats(docs, *CENTER), repeat=repeat)
+        means = [stats[field]["mean"] for field in ("ph", "turbidity", "temperature", "conductivity")]
+        assert np.allclose(means, expected), "vectorized averages differ from the loop"
+        print(f"{n:>10} {loop_time:>10.4f} {columns_time:>12.4f} {stats_time:>10.4f} {numpy_time:>10.4f} {loop_time / numpy_time:>7.1f}x")
+
+
+def bench_matrix():
+    print(f"{'N x M':>14} {'loop (s)':>10} {'matrix (s)':>11} {'rows (s)':>10} {'speedup':>8}")
+    for n, m in ((1_000, 50), (10_000, 50), (10_000, 500)):
+        lats1 = CENTER[0] + np.random.uniform(-0.1, 0.1, n)
+        lngs1 = CENTER[1] + np.random.uniform(-0.1, 0.1, n)
+        lats2 = CENTER[0] + np.random.uniform(-0.1, 0.1, m)
+        lngs2 = CENTER[1] + np.random.uniform(-0.1, 0.1, m)
+        loop_time, expected = timed(lambda: loop_matrix(lats1.tolist(), lngs1.tolist(), lats2.tolist(), lngs2.tolist()), repeat=1)
+        matrix_time, matrix = timed(lambda: haversine_matrix(lats1, lngs1, lats2, lngs2))
+        # One haversine_many call per row: what a caller without the N x M helper would write
+        rows_time, _ = timed(lambda: [haversine_many(lat, lng, lats2, lngs2) for lat, lng in zip(lats1, lngs1)])
+        assert np.allclose(matrix, expected), "distance matrix differs from the loop"
+        print(f"{f'{n} x {m}':>14} {loop_time:>10.4f} {matrix_time:>11.4f} {rows_time:>10.4f} {loop_time / matrix_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    bench_neighbourhood()
+    print()
+    bench_matrix()
@@ -0,0 +1,89 @@
+import glob
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+# Accuracy parity, latency and peak RSS of the keras and tflite inference backends on the
+# images in uploads/. Each backend runs in its own interpreter so RSS is not shared.
+IMAGE_DIR = os.getenv("BENCH_IMAGE_DIR", "uploads")
+KERAS_MODEL = os.getenv("BENCH_KERAS_MODEL", "water_cnn_model.h5")
+TFLITE_MODELS = os.getenv("BENCH_TFLITE_MODELS", "water_cnn_model.tflite").split(",")
+BATCH_SIZE = int(os.getenv("BENCH_BATCH_SIZE", 8))
+REPEATS = int(os.getenv("BENCH_REPEATS", 3))
+
+
+def load_images():
+    from convert_model import load_image
+    paths = sorted(glob.glob(os.path.join(IMAGE_DIR, "*.jpg")))
+    return np.stack([load_image(path) for path in paths])
+
+
+# Runs inside the child process: load one backend, predict every image, report timings
+def run_backend(backend, model_path, out_path):
+    from inference import load_forward
+    images = load_images()
+    started = time.perf_counter()
+    forward = load_forward(backend, model_path)
+    load_seconds = time.perf_counter() - started
+    single = []
+    for image in images:
+        t = time.perf_counter()
+        forward(image[np.newaxis])
+        single.append((time.perf_counter() - t) * 1000)
+    batched = []
+    for _ in range(REPEATS):
+        for i in range(0, len(images), BATCH_SIZE):
+            t = time.perf_counter()
+            forward(images[i:i + BATCH_SIZE])
+            batched.append((time.perf_counter() - t) * 1000 / len(images[i:i + BATCH_SIZE]))
+    preds = np.concatenate([forward(images[i:i + BATCH_SIZE]) for i in range(0, len(images), BATCH_SIZE)])
+    np.save(out_path, preds)
+    single.sort()
+    print(json.dumps({
+        "load_seconds": load_seconds,
+        "single_p50_ms": single[len(single) // 2],
+        "single_p99_ms": single[int(len(single) * 0.99)],
+        "batched_per_image_ms": float(np.mean(batched)),
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "tensorflow_imported": "tensorflow" in sys.modules
+    }))
+
+
+def spawn(backend, model_path, out_path):
+    result = subprocess.run(
+        [sys.executable, __file__, backend, model_path, out_path],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"{backend} {model_path} failed: {result.stderr.strip()[-500:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4:
+        run_backend(*sys.argv[1:])
+        sys.exit(0)
+    runs = [("keras", KERAS_MODEL)] + [("tflite", path) for path in TFLITE_MODELS if os.path.exists(path)]
+    results = {}
+    for backend, model_path in runs:
+        out_path = f".bench_{backend}_{os.path.basename(model_path)}.npy"
+        results[model_path] = (spawn(backend, model_path, out_path), np.load(out_path))
+        os.remove(out_path)
+    reference = results[KERAS_MODEL][1]
+    print(f"{len(reference)} images from {IMAGE_DIR}")
+    print(f"{'model':>32} {'load (s)':>9} {'p50 (ms)':>9} {'p99 (ms)':>9} {'batch/img':>10} {'RSS (MB)':>9} {'top1 agree':>11} {'max |dp|':>9} {'tf':>4}")
+    for model_path, (stats, preds) in results.items():
+        agree = float(np.mean(preds.argmax(axis=1) == reference.argmax(axis=1)))
+        drift = float(np.max(np.abs(preds - reference)))
+        print(
+            f"{os.path.basename(model_path):>32} {stats['load_seconds']:>9.2f} {stats['single_p50_ms']:>9.1f} "
+            f"{stats['single_p99_ms']:>9.1f} {stats['batched_per_image_ms']:>10.1f} {stats['max_rss_mb']:>9.0f} "
+            f"{agree:>11.2%} {drift:>9.4f} {'yes' if stats['tensorflow_imported'] else 'no':>4}"
+        )
@@ -0,0 +1,62 @@
+import glob
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from inference import IMAGE_SIZE
+from preprocessing import ImagePreprocessor
+
+# Per-upload cost of the old save-then-reload path against ImagePreprocessor,
+# on the images in uploads/ (set BENCH_IMAGE_DIR to try larger phone photos)
+IMAGE_DIR = os.getenv("BENCH_IMAGE_DIR", "uploads")
+REPEATS = int(os.getenv("BENCH_REPEATS", 3))
+
+
+# The path predict_water_issue used before: write to disk, reopen, full-resolution decode, resize
+def disk_roundtrip(data, file_path):
+    with open(file_path, "wb") as f:
+        f.write(data)
+    with Image.open(file_path) as img:
+        img = img.convert("RGB").resize(IMAGE_SIZE, Image.NEAREST)
+        return np.asarray(img, dtype=np.float32) / 255.0
+
+
+def measure(fn, uploads):
+    samples = []
+    for _ in range(REPEATS):
+        for i, data in enumerate(uploads):
+            start = time.perf_counter()
+            fn(i, data)
+            samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.mean(samples), samples[len(samples) // 2], samples[int(len(samples) * 0.99)]
+
+
+if __name__ == "__main__":
+    paths = sorted(glob.glob(os.path.join(IMAGE_DIR, "*.jpg")))
+    uploads = []
+    for path in paths:
+        with open(path, "rb") as f:
+            uploads.append(f.read())
+    preprocessor = ImagePreprocessor()
+    buffer = preprocessor.allocate()
+    out_dir = tempfile.mkdtemp()
+    try:
+        print(f"{len(uploads)} images from {IMAGE_DIR}, {REPEATS} repeats")
+        print(f"{'path':>16} {'mean (ms)':>10} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+        for name, fn in (
+            ("disk roundtrip", lambda i, data: disk_roundtrip(data, os.path.join(out_dir, f"old_{i}.jpg"))),
+            ("in-memory draft", lambda i, data: (preprocessor.decode(data, buffer), preprocessor.save_async(data, os.path.join(out_dir, f"new_{i}.jpg"))))
+        ):
+            mean, p50, p99 = measure(fn, uploads)
+            print(f"{name:>16} {mean:>10.2f} {p50:>10.2f} {p99:>10.2f}")
+        preprocessor.shutdown()
+        drift = max(float(np.max(np.abs(disk_roundtrip(data, os.path.join(out_dir, "check.jpg")) - preprocessor.decode(data)))) for data in uploads)
+        print(f"max pixel difference vs full-resolution decode: {drift:.4f}")
+    finally:
+        shutil.rmtree(out_dir)
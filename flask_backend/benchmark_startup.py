@@ -0,0 +1,56 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Cold-start timings for app.py: import time, first served request, and time until
+# /health reports every model ready. Each run is a fresh interpreter so nothing is warm.
+RUNS = int(os.getenv("BENCH_RUNS", 3))
+READY_TIMEOUT = float(os.getenv("BENCH_READY_TIMEOUT", 120))
+
+PROBE = """
+import json, time
+started = time.perf_counter()
+import app
+app.model_registry.start()
+imported = time.perf_counter()
+client = app.app.test_client()
+client.get("/health")
+first_request = time.perf_counter()
+ready = None
+while time.perf_counter() - started < %f:
+    if client.get("/health").status_code == 200:
+        ready = time.perf_counter()
+        break
+    time.sleep(0.05)
+print(json.dumps({
+    "import": imported - started,
+    "first_request": first_request - started,
+    "ready": None if ready is None else ready - started,
+    "models": app.model_registry.status()
+}))
+"""
+
+
+def run_once():
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE % READY_TIMEOUT],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else "probe failed")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    print(f"{'run':>4} {'import (s)':>11} {'first req (s)':>14} {'ready (s)':>10}")
+    for i in range(RUNS):
+        wall = time.perf_counter()
+        timings = run_once()
+        ready = "timeout" if timings["ready"] is None else f"{timings['ready']:.2f}"
+        print(f"{i + 1:>4} {timings['import']:>11.2f} {timings['first_request']:>14.2f} {ready:>10}")
+    for name, status in timings["models"].items():
+        print(f"  {name}: {status['status']} ({status['load_seconds']}s)")
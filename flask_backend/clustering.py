@@ -0,0 +1,198 @@
+import logging
+import math
+import os
+
+import numpy as np
+from sklearn.cluster import DBSCAN, MiniBatchKMeans
+from sklearn.metrics import silhouette_score
+
+from geo_index import KM_PER_DEGREE
+
+logger = logging.getLogger(__name__)
+
+SEVERITY = {"scarcity": 0.8, "leakage": 0.6}
+DEFAULT_SEVERITY = 0.2
+
+
+# Reports as an N x 2 matrix of local east/north km around the data's centroid, so k-means and DBSCAN
+# distances mean the same thing in every direction and at every latitude. Severity is deliberately
+# not a feature: any weight large enough to matter splits scarcity and leakage reports at the same
+# spot into separate clusters, so it is summarised per cluster instead.
+class FlowFeatures:
+    def __init__(self, reports):
+        n = len(reports)
+        self.lats = np.empty(n)
+        self.lngs = np.empty(n)
+        self.scarcity = np.zeros(n)
+        self.leakage = np.zeros(n)
+        for i, report in enumerate(reports):
+            self.lats[i] = report["latitude"]
+            self.lngs[i] = report["longitude"]
+            self.scarcity[i] = report["status"] == "scarcity"
+            self.leakage[i] = report["status"] == "leakage"
+        self.severity = np.where(self.scarcity == 1, SEVERITY["scarcity"], np.where(self.leakage == 1, SEVERITY["leakage"], DEFAULT_SEVERITY))
+        self.lat0 = float(self.lats.mean())
+        self.lng0 = float(self.lngs.mean())
+        self.lng_scale = KM_PER_DEGREE * max(math.cos(math.radians(self.lat0)), 1e-6)
+        self.X = np.column_stack((
+            (self.lngs - self.lng0) * self.lng_scale,
+            (self.lats - self.lat0) * KM_PER_DEGREE
+        ))
+
+    def to_features(self, centers):
+        return np.array([
+            [
+                (c["longitude"] - self.lng0) * self.lng_scale,
+                (c["latitude"] - self.lat0) * KM_PER_DEGREE
+            ]
+            for c in centers
+        ])
+
+    def to_coordinates(self, centers):
+        return (
+            centers[:, 1] / KM_PER_DEGREE + self.lat0,
+            centers[:, 0] / self.lng_scale + self.lng0
+        )
+
+
+# Flow-optimization clustering: MiniBatchKMeans with k chosen by silhouette on a sample and
+# warm-started from the previous run's centres, or DBSCAN for density-based hotspots
+class ClusteringEngine:
+    def __init__(self, mode=None, min_clusters=None, max_clusters=None, sample_size=None, batch_size=None,
+                 eps_km=None, min_samples=None, random_state=42):
+        self.mode = mode or os.getenv("FLOW_CLUSTER_MODE", "minibatch")
+        self.min_clusters = min_clusters or int(os.getenv("FLOW_MIN_CLUSTERS", 2))
+        self.max_clusters = max_clusters or int(os.getenv("FLOW_MAX_CLUSTERS", 12))
+        self.sample_size = sample_size or int(os.getenv("FLOW_CLUSTER_SAMPLE_SIZE", 5000))
+        self.batch_size = batch_size or int(os.getenv("FLOW_CLUSTER_BATCH_SIZE", 4096))
+        self.eps_km = eps_km or float(os.getenv("FLOW_DBSCAN_EPS_KM", 1.0))
+        self.min_samples = min_samples or int(os.getenv("FLOW_DBSCAN_MIN_SAMPLES", 5))
+        self.random_state = random_state
+
+    def _candidate_ks(self, n, previous_k):
+        upper = max(self.min_clusters, min(self.max_clusters, n - 1, int(math.sqrt(n / 2)) + 1))
+        ks = list(range(min(self.min_clusters, upper), upper + 1))
+        if previous_k and previous_k not in ks and self.min_clusters <= previous_k < n:
+            ks.append(previous_k)
+        return ks
+
+    def _fit(self, X, k, init):
+        model = MiniBatchKMeans(
+            n_clusters=k,
+            init=init,
+            n_init=1 if not isinstance(init, str) else 3,
+            batch_size=self.batch_size,
+            random_state=self.random_state
+        )
+        return model.fit(X)
+
+    # Score each candidate k on a sample; the previous run's centres seed the k they imply
+    def _choose(self, X, previous):
+        rng = np.random.default_rng(self.random_state)
+        sample = X if len(X) <= self.sample_size else X[rng.choice(len(X), self.sample_size, replace=False)]
+        best = None
+        for k in self._candidate_ks(len(sample), len(previous) if previous is not None else None):
+            init = previous if previous is not None and len(previous) == k else "k-means++"
+            model = self._fit(sample, k, init)
+            if len(np.unique(model.labels_)) < 2:
+                continue
+            score = silhouette_score(sample, model.labels_, sample_size=min(len(sample), 2000), random_state=self.random_state)
+            if best is None or score > best[0]:
+                best = (score, k, model.cluster_centers_)
+        return best
+
+    def _kmeans(self, features, previous_centers):
+        X = features.X
+        previous = features.to_features(previous_centers) if previous_centers else None
+        if len(X) <= self.min_clusters:
+            model = self._fit(X, len(X), "k-means++")
+            return model.labels_, model.cluster_centers_, None
+        best = self._choose(X, previous)
+        if best is None:
+            model = self._fit(X, min(self.min_clusters, len(X)), "k-means++")
+            return model.labels_, model.cluster_centers_, None
+        score, k, sample_centers = best
+        # The sample's centres warm-start the full fit; labels_ covers every report, so nothing is re-predicted
+        model = self._fit(X, k, sample_centers)
+        return model.labels_, model.cluster_centers_, score
+
+    def _dbscan(self, features):
+        labels = DBSCAN(eps=self.eps_km, min_samples=self.min_samples).fit(features.X).labels_
+        clustered = labels >= 0
+        k = int(labels.max()) + 1 if clustered.any() else 0
+        if not k:
+            return labels, np.empty((0, features.X.shape[1])), None
+        counts = np.bincount(labels[clustered], minlength=k)
+        centers = np.column_stack([
+            np.bincount(labels[clustered], weights=features.X[clustered, j], minlength=k) / counts
+            for j in range(features.X.shape[1])
+        ])
+        return labels, centers, None
+
+    # Cluster reports (dicts with latitude, longitude, status) into summaries:
+    # centre, size, per-status counts, mean severity and point bbox, all from one grouped pass over the labels.
+    # with_labels=True also returns each report's cluster label (-1 for DBSCAN noise).
+    def cluster(self, reports, previous_centers=None, with_labels=False):
+        features = FlowFeatures(reports)
+        if self.mode == "dbscan":
+            labels, centers, score = self._dbscan(features)
+        else:
+            labels, centers, score = self._kmeans(features, previous_centers)
+        k = len(centers)
+        if not k:
+            return ([], labels) if with_labels else []
+        clustered = labels >= 0
+        sizes = np.bincount(labels[clustered], minlength=k)
+        scarcity = np.bincount(labels[clustered], weights=features.scarcity[clustered], minlength=k)
+        leakage = np.bincount(labels[clustered], weights=features.leakage[clustered], minlength=k)
+        severities = np.bincount(labels[clustered], weights=features.severity[clustered], minlength=k) / np.maximum(sizes, 1)
+        min_lat, max_lat = np.full(k, np.inf), np.full(k, -np.inf)
+        min_lng, max_lng = np.full(k, np.inf), np.full(k, -np.inf)
+        np.minimum.at(min_lat, labels[clustered], features.lats[clustered])
+        np.maximum.at(max_lat, labels[clustered], features.lats[clustered])
+        np.minimum.at(min_lng, labels[clustered], features.lngs[clustered])
+        np.maximum.at(max_lng, labels[clustered], features.lngs[clustered])
+        lats, lngs = features.to_coordinates(centers)
+        logger.info(f"Clustered {len(reports)} reports into {k} clusters ({self.mode}, silhouette={score if score is None else round(score, 3)})")
+        clusters = [
+            {
+                "cluster_id": cluster_id,
+                "center": {"latitude": float(lats[cluster_id]), "longitude": float(lngs[cluster_id])},
+                "severity": float(severities[cluster_id]),
+                "size": int(sizes[cluster_id]),
+                "scarcity_count": int(scarcity[cluster_id]),
+                "leakage_count": int(leakage[cluster_id]),
+                "bbox": [float(min_lng[cluster_id]), float(min_lat[cluster_id]), float(max_lng[cluster_id]), float(max_lat[cluster_id])]
+            }
+            for cluster_id in range(k)
+            if sizes[cluster_id]
+        ]
+        return (clusters, labels) if with_labels else clusters
+
+
+# Downsample labelled reports for rendering: at most max_points in total, shared between clusters
+# in proportion to their size with at least one point each. One permutation plus a stable sort by
+# label replaces per-cluster sampling loops over the reports.
+def sample_points(reports, labels, max_points, random_state=42):
+    labels = np.asarray(labels)
+    n = len(labels)
+    if not n:
+        return []
+    groups = np.where(labels >= 0, labels, labels.max() + 1)
+    sizes = np.bincount(groups)
+    quotas = np.where(sizes > 0, np.maximum(1, np.round(sizes * min(1.0, max_points / n))), 0).astype(int)
+    perm = np.random.default_rng(random_state).permutation(n)
+    order = perm[np.argsort(groups[perm], kind="stable")]
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    keep = np.concatenate([order[start:start + quota] for start, quota in zip(starts, quotas) if quota])
+    keep.sort()
+    return [
+        {
+            "latitude": reports[i]["latitude"],
+            "longitude": reports[i]["longitude"],
+            "status": reports[i]["status"],
+            "address": reports[i].get("address"),
+            "cluster_id": int(labels[i]) if labels[i] >= 0 else None
+        }
+        for i in keep
+    ]
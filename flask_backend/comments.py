@@ -0,0 +1,85 @@
+import datetime
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+
+# Bounded LRU of report ids already seen to exist. Reports are never deleted, so a positive
+# answer never goes stale; misses are not cached because the report may be created later.
+class KnownReports:
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries or int(os.getenv("KNOWN_REPORTS_CACHE_SIZE", 50000))
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, report_id):
+        with self._lock:
+            if report_id in self._ids:
+                self._ids.move_to_end(report_id)
+                return True
+            return False
+
+    def add(self, report_id):
+        with self._lock:
+            self._ids[report_id] = True
+            self._ids.move_to_end(report_id)
+            while len(self._ids) > self.max_entries:
+                self._ids.popitem(last=False)
+
+
+# Comment threads with a comment_count kept on each report
+class CommentStore:
+    def __init__(self, collection, reports_collection):
+        self.collection = collection
+        self.reports_collection = reports_collection
+        self.known_reports = KnownReports()
+
+    def report_exists(self, report_id):
+        if report_id in self.known_reports:
+            return True
+        if self.reports_collection.find_one({"_id": ObjectId(report_id)}, {"_id": 1}) is None:
+            return False
+        self.known_reports.add(report_id)
+        return True
+
+    # The counter update doubles as the existence check: no matched report, no comment
+    def add(self, report_id, user_phone, user_name, text):
+        result = self.reports_collection.update_one({"_id": ObjectId(report_id)}, {"$inc": {"comment_count": 1}})
+        if not result.matched_count:
+            return None
+        self.known_reports.add(report_id)
+        comment = {
+            "report_id": report_id,
+            "user_phone": user_phone,
+            "user_name": user_name,
+            "comment": text,
+            "created_at": datetime.datetime.utcnow()
+        }
+        try:
+            self.collection.insert_one(comment)
+        except Exception:
+            self.reports_collection.update_one({"_id": ObjectId(report_id)}, {"$inc": {"comment_count": -1}})
+            raise
+        return comment
+
+    # Backfill comment_count on reports written before the counter existed
+    def migrate_counts(self):
+        if not self.reports_collection.find_one({"comment_count": {"$exists": False}}, {"_id": 1}):
+            return
+        updates = []
+        for row in self.collection.aggregate([{"$group": {"_id": "$report_id", "count": {"$sum": 1}}}]):
+            if ObjectId.is_valid(row["_id"]):
+                updates.append(UpdateOne(
+                    {"_id": ObjectId(row["_id"]), "comment_count": {"$exists": False}},
+                    {"$set": {"comment_count": row["count"]}}
+                ))
+        if updates:
+            self.reports_collection.bulk_write(updates, ordered=False)
+        result = self.reports_collection.update_many({"comment_count": {"$exists": False}}, {"$set": {"comment_count": 0}})
+        logger.info(f"Backfilled comment_count on {len(updates) + result.modified_count} reports")
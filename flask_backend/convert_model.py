@@ -0,0 +1,58 @@
+import argparse
+import glob
+import os
+
+import numpy as np
+import tensorflow as tf
+from PIL import Image
+
+from inference import IMAGE_SIZE
+
+# Export the Keras water issue model to TFLite for the tflite inference backend.
+#   python convert_model.py                       # float32
+#   python convert_model.py --quantize float16    # half-size weights, float compute
+#   python convert_model.py --quantize int8       # full integer, calibrated on uploads/
+
+
+def load_image(path):
+    with Image.open(path) as img:
+        img = img.convert("RGB").resize(IMAGE_SIZE, Image.NEAREST)
+        return np.asarray(img, dtype=np.float32) / 255.0
+
+
+def representative_dataset(image_dir, limit):
+    paths = sorted(glob.glob(os.path.join(image_dir, "*.jpg")))[:limit]
+    if not paths:
+        raise SystemExit(f"int8 calibration needs sample images in {image_dir}")
+
+    def generate():
+        for path in paths:
+            yield [load_image(path)[np.newaxis]]
+    return generate
+
+
+def convert(source, output, quantize, image_dir, calibration_images):
+    model = tf.keras.models.load_model(source)
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if quantize == "float16":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantize == "int8":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset(image_dir, calibration_images)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    tflite_model = converter.convert()
+    with open(output, "wb") as f:
+        f.write(tflite_model)
+    print(f"Wrote {output} ({len(tflite_model) / 1e6:.1f} MB, quantize={quantize}) from {source} ({os.path.getsize(source) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert water_cnn_model.h5 to TFLite")
+    parser.add_argument("--source", default="water_cnn_model.h5")
+    parser.add_argument("--output", default="water_cnn_model.tflite")
+    parser.add_argument("--quantize", choices=["none", "float16", "int8"], default="none")
+    parser.add_argument("--image-dir", default="uploads")
+    parser.add_argument("--calibration-images", type=int, default=100)
+    args = parser.parse_args()
+    convert(args.source, args.output, args.quantize, args.image_dir, args.calibration_images)
@@ -0,0 +1,338 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+TERMINAL = (COMPLETED, FAILED)
+ORPHANED_ERROR = "Interrupted: the worker running this job exited"
+
+FLOW_STATUSES = ["scarcity", "leakage"]
+# Fields of a compute() result copied onto the stored optimization document
+RESULT_FIELDS = ("recommendations", "points", "point_count")
+
+
+class FlowJobError(Exception):
+    pass
+
+
+# Cache key for a clustering run: the exact set of input reports and their statuses
+def input_hash(reports):
+    digest = hashlib.sha256()
+    for report in sorted(reports, key=lambda r: str(r["_id"])):
+        digest.update(f"{report['_id']}:{report.get('status')}\n".encode())
+    return digest.hexdigest()
+
+
+def serialize_job(job):
+    if job is None:
+        return None
+    item = {key: value for key, value in job.items() if key != "_id"}
+    for key, value in item.items():
+        if isinstance(value, datetime.datetime):
+            item[key] = value.isoformat()
+    return item
+
+
+# Points of a stored optimization inside a min_lng,min_lat,max_lng,max_lat box
+def points_in_bbox(points, bbox):
+    if not bbox:
+        return points
+    min_lng, min_lat, max_lng, max_lat = bbox
+    return [p for p in points if min_lng <= p["longitude"] <= max_lng and min_lat <= p["latitude"] <= max_lat]
+
+
+# Bounded LRU of rendered dashboard bodies. Keys include the optimization_id, and an optimization
+# with stored points is never modified, so entries cannot go stale; they are only evicted. Legacy
+# optimizations without stored points render from live reports and must not be cached here.
+class DashboardCache:
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries or int(os.getenv("FLOW_DASHBOARD_CACHE_SIZE", 256))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # ETag derived from the cache key, so a revalidation is answered without rendering the body
+    @staticmethod
+    def etag(*key):
+        return hashlib.sha1(json.dumps(key).encode()).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key, body):
+        with self._lock:
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+# Runs flow optimizations on a background pool. Job state lives in Mongo so any worker process
+# can answer a poll; results are reused when the input reports have not changed.
+# Queued and running jobs hold a lease: the owning process refreshes heartbeat_at while it has
+# them, so a job orphaned by a recycled or killed worker is noticed once the lease lapses.
+class FlowJobRunner:
+    def __init__(self, jobs_collection, results_collection, reports_collection, compute, on_complete=None,
+                 workers=None, window_days=None, job_ttl_hours=None, lease_seconds=None, max_waiters=None):
+        self.jobs_collection = jobs_collection
+        self.results_collection = results_collection
+        self.reports_collection = reports_collection
+        self.compute = compute
+        self.on_complete = on_complete
+        self.workers = workers or int(os.getenv("FLOW_JOB_WORKERS", 2))
+        self.window_days = window_days or int(os.getenv("FLOW_WINDOW_DAYS", 30))
+        self.job_ttl_hours = job_ttl_hours or int(os.getenv("FLOW_JOB_TTL_HOURS", 24))
+        self.lease_seconds = lease_seconds or float(os.getenv("FLOW_JOB_LEASE_SECONDS", 60))
+        # Synchronous waits and event streams each pin a request thread while they poll; this caps
+        # them per process so they cannot take every gthread slot (see gunicorn.conf.py)
+        self.max_waiters = max_waiters or int(os.getenv("FLOW_JOB_MAX_WAITERS", 4))
+        self._waiters = threading.BoundedSemaphore(self.max_waiters)
+        self._executor = None
+        self._heartbeat_thread = None
+        self._active = set()
+        self._lock = threading.Lock()
+
+    # pid changes after fork, so the owner is computed when a job is created rather than at import
+    @staticmethod
+    def owner():
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def _stale_filter(self, now=None):
+        cutoff = (now or datetime.datetime.utcnow()) - datetime.timedelta(seconds=self.lease_seconds)
+        return {
+            "status": {"$in": [QUEUED, RUNNING]},
+            "$or": [{"heartbeat_at": {"$lt": cutoff}}, {"heartbeat_at": None}]
+        }
+
+    def _expire(self, query, reason):
+        return self.jobs_collection.update_many(
+            {**query, **self._stale_filter()},
+            {"$set": {"status": FAILED, "error": reason, "finished_at": datetime.datetime.utcnow()}}
+        ).modified_count
+
+    def ensure_indexes(self):
+        self.jobs_collection.create_index([("job_id", 1)], unique=True)
+        self.jobs_collection.create_index([("input_hash", 1), ("officer_email", 1), ("status", 1)])
+        self.jobs_collection.create_index([("created_at", 1)], expireAfterSeconds=self.job_ttl_hours * 3600)
+        self.results_collection.create_index([("input_hash", 1), ("created_at", -1)])
+
+    # Jobs whose lease lapsed belong to a process that exited; they will never finish. Only stale
+    # jobs are touched, so running this while other workers or hosts hold live jobs is safe.
+    def recover(self):
+        expired = self._expire({}, ORPHANED_ERROR)
+        if expired:
+            logger.warning(f"Marked {expired} interrupted flow jobs as failed")
+
+    def load_reports(self):
+        recent_date = datetime.datetime.utcnow() - datetime.timedelta(days=self.window_days)
+        return list(self.reports_collection.find(
+            {"created_at": {"$gte": recent_date}, "status": {"$in": FLOW_STATUSES}},
+            {"latitude": 1, "longitude": 1, "status": 1, "address": 1}
+        ))
+
+    # Queue a run for an officer; returns the job, already completed when the result is cached
+    def submit(self, officer):
+        reports = self.load_reports()
+        if len(reports) < 3:
+            raise FlowJobError("Insufficient reports for optimization (need at least 3)")
+        key = input_hash(reports)
+        now = datetime.datetime.utcnow()
+        cached = self.results_collection.find_one({"input_hash": key}, sort=[("created_at", -1)])
+        if cached:
+            result = {field: cached[field] for field in RESULT_FIELDS if field in cached}
+            optimization_id = self._store_result(officer, key, result, len(reports), cached["optimization_id"])
+            job = self._new_job(officer, key, now, status=COMPLETED, optimization_id=optimization_id, cached=True, finished_at=now)
+            self.jobs_collection.insert_one(job)
+            logger.info(f"Flow optimization served from cache for input {key[:12]}")
+            if self.on_complete:
+                self.on_complete(officer, cached["recommendations"])
+            return serialize_job(job)
+        # A double-submit while the same input is still being clustered joins the running job,
+        # unless its lease lapsed; the orphan is failed and the input is queued again here
+        inflight_query = {"input_hash": key, "officer_email": officer["email"]}
+        if self._expire(inflight_query, ORPHANED_ERROR):
+            logger.warning(f"Requeueing orphaned flow optimization for input {key[:12]}")
+        inflight = self.jobs_collection.find_one({**inflight_query, "status": {"$in": [QUEUED, RUNNING]}})
+        if inflight:
+            return serialize_job(inflight)
+        job = self._new_job(officer, key, now, status=QUEUED, owner=self.owner(), heartbeat_at=now)
+        pool = self._pool()
+        with self._lock:
+            self._active.add(job["job_id"])
+        self.jobs_collection.insert_one(job)
+        pool.submit(self._run, job["job_id"], officer, key, reports)
+        logger.info(f"Queued flow optimization job {job['job_id']}")
+        return serialize_job(job)
+
+    def _new_job(self, officer, key, now, **fields):
+        job = {
+            "job_id": str(uuid.uuid4()),
+            "officer_email": officer["email"],
+            "input_hash": key,
+            "optimization_id": None,
+            "cached": False,
+            "error": None,
+            "created_at": now,
+            "started_at": None,
+            "finished_at": None
+        }
+        job.update(fields)
+        return job
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="flow-job")
+            if self._heartbeat_thread is None or not self._heartbeat_thread.is_alive():
+                self._heartbeat_thread = threading.Thread(target=self._heartbeat, name="flow-job-heartbeat", daemon=True)
+                self._heartbeat_thread.start()
+            return self._executor
+
+    # Refresh the lease on every job this process holds, several times per lease period
+    def _heartbeat(self):
+        while True:
+            time.sleep(self.lease_seconds / 4)
+            with self._lock:
+                job_ids = list(self._active)
+            if not job_ids:
+                continue
+            try:
+                self.jobs_collection.update_many(
+                    {"job_id": {"$in": job_ids}, "status": {"$in": [QUEUED, RUNNING]}},
+                    {"$set": {"heartbeat_at": datetime.datetime.utcnow()}}
+                )
+            except Exception as e:
+                logger.error(f"Failed to refresh flow job leases: {str(e)}")
+
+    # Reuse the officer's latest result if it already covers this input, otherwise write one for them.
+    # result is compute()'s dict: recommendations plus the labelled, downsampled points for the dashboard
+    def _store_result(self, officer, key, result, report_count, source_id=None):
+        latest = self.results_collection.find_one({"officer_email": officer["email"]}, {"input_hash": 1, "optimization_id": 1}, sort=[("created_at", -1)])
+        if latest and latest.get("input_hash") == key:
+            return latest["optimization_id"]
+        optimization_id = str(uuid.uuid4())
+        self.results_collection.insert_one({
+            "optimization_id": optimization_id,
+            "officer_email": officer["email"],
+            **result,
+            "input_hash": key,
+            "report_count": report_count,
+            "cached_from": source_id,
+            "created_at": datetime.datetime.utcnow()
+        })
+        return optimization_id
+
+    def _run(self, job_id, officer, key, reports):
+        try:
+            self._execute(job_id, officer, key, reports)
+        finally:
+            with self._lock:
+                self._active.discard(job_id)
+
+    def _execute(self, job_id, officer, key, reports):
+        now = datetime.datetime.utcnow()
+        self.jobs_collection.update_one({"job_id": job_id}, {"$set": {"status": RUNNING, "started_at": now, "heartbeat_at": now}})
+        try:
+            result = self.compute(reports)
+            optimization_id = self._store_result(officer, key, result, len(reports))
+        except Exception as e:
+            logger.error(f"Flow optimization job {job_id} failed: {str(e)}")
+            self.jobs_collection.update_one(
+                {"job_id": job_id},
+                {"$set": {"status": FAILED, "error": str(e), "finished_at": datetime.datetime.utcnow()}}
+            )
+            return
+        self.jobs_collection.update_one(
+            {"job_id": job_id},
+            {"$set": {"status": COMPLETED, "optimization_id": optimization_id, "finished_at": datetime.datetime.utcnow()}}
+        )
+        logger.info(f"Flow optimization job {job_id} completed: {optimization_id}")
+        if self.on_complete:
+            try:
+                self.on_complete(officer, result["recommendations"])
+            except Exception as e:
+                logger.error(f"Flow job completion hook failed for {job_id}: {str(e)}")
+
+    # A poll of an orphaned job fails it, so pollers and event streams end instead of waiting out the TTL
+    def get(self, job_id, officer_email=None):
+        query = {"job_id": job_id}
+        if officer_email:
+            query["officer_email"] = officer_email
+        job = self.jobs_collection.find_one(query)
+        if job and job["status"] not in TERMINAL and self._expire({"job_id": job_id}, ORPHANED_ERROR):
+            job = self.jobs_collection.find_one(query)
+        return serialize_job(job)
+
+    # Poll until the job finishes or timeout elapses; returns the last state seen.
+    # With every waiter slot taken it returns the current state at once rather than holding a thread
+    def wait(self, job_id, timeout, poll_seconds=0.5):
+        if not self._waiters.acquire(blocking=False):
+            return self.get(job_id)
+        try:
+            deadline = time.monotonic() + timeout
+            job = self.get(job_id)
+            while job and job["status"] not in TERMINAL and time.monotonic() < deadline:
+                time.sleep(poll_seconds)
+                job = self.get(job_id)
+            return job
+        finally:
+            self._waiters.release()
+
+    # Server-sent events: one "status" event per state change, ending on completion or failure.
+    # Streams share the waiter slots; when none is free the client is told to poll status_url or
+    # reconnect after the retry interval. EventSource reconnects on its own after a timeout.
+    def events(self, job_id, timeout=None, poll_seconds=0.5, heartbeat_seconds=15):
+        if not self._waiters.acquire(blocking=False):
+            yield f"retry: 10000\nevent: busy\ndata: {json.dumps({'job_id': job_id})}\n\n"
+            return
+        try:
+            yield from self._events(job_id, timeout, poll_seconds, heartbeat_seconds)
+        finally:
+            self._waiters.release()
+
+    def _events(self, job_id, timeout, poll_seconds, heartbeat_seconds):
+        timeout = timeout or float(os.getenv("FLOW_JOB_EVENTS_TIMEOUT_SECONDS", 60))
+        deadline = time.monotonic() + timeout
+        last_status = None
+        last_sent = time.monotonic()
+        while time.monotonic() < deadline:
+            job = self.get(job_id)
+            if job is None:
+                yield f"event: error\ndata: {json.dumps({'error': 'Job not found'})}\n\n"
+                return
+            if job["status"] != last_status:
+                last_status = job["status"]
+                last_sent = time.monotonic()
+                yield f"event: status\ndata: {json.dumps(job)}\n\n"
+                if last_status in TERMINAL:
+                    return
+            elif time.monotonic() - last_sent >= heartbeat_seconds:
+                last_sent = time.monotonic()
+                yield ": keep-alive\n\n"
+            time.sleep(poll_seconds)
+        yield f"event: timeout\ndata: {json.dumps({'job_id': job_id})}\n\n"
@@ -0,0 +1,60 @@
+import numpy as np
+
+EARTH_RADIUS_KM = 6371
+SENSOR_FIELDS = ["ph", "turbidity", "temperature", "conductivity"]
+
+
+# Great-circle distance in km from one point to arrays of points
+def haversine_many(lat, lng, lats, lngs):
+    lat1 = np.radians(lat)
+    lat2 = np.radians(np.asarray(lats, dtype=float))
+    dlat = lat2 - lat1
+    dlng = np.radians(np.asarray(lngs, dtype=float)) - np.radians(lng)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+# N x M distance matrix in km between two sets of points
+def haversine_matrix(lats1, lngs1, lats2, lngs2):
+    lat1 = np.radians(np.asarray(lats1, dtype=float))[:, None]
+    lng1 = np.radians(np.asarray(lngs1, dtype=float))[:, None]
+    lat2 = np.radians(np.asarray(lats2, dtype=float))[None, :]
+    lng2 = np.radians(np.asarray(lngs2, dtype=float))[None, :]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+# Convert sensor documents into coordinate arrays and an N x 4 sensor matrix
+def sensor_columns(docs, fields=SENSOR_FIELDS):
+    n = len(docs)
+    lats = np.empty(n)
+    lngs = np.empty(n)
+    values = np.empty((n, len(fields)))
+    for i, doc in enumerate(docs):
+        lats[i] = doc.get("latitude", np.nan)
+        lngs[i] = doc.get("longitude", np.nan)
+        values[i] = [doc.get(field, np.nan) for field in fields]
+    return lats, lngs, values
+
+
+# Mean and percentiles of each sensor column over the rows selected by mask
+def masked_stats(values, mask=None, percentiles=(50, 90), fields=SENSOR_FIELDS):
+    selected = values if mask is None else values[mask]
+    count = len(selected)
+    if not count:
+        return {"count": 0}
+    means = np.nanmean(selected, axis=0)
+    pcts = np.nanpercentile(selected, percentiles, axis=0)
+    stats = {"count": count}
+    for j, field in enumerate(fields):
+        stats[field] = {"mean": float(means[j])}
+        for k, p in enumerate(percentiles):
+            stats[field][f"p{p}"] = float(pcts[k, j])
+    return stats
+
+
+# Sensor averages of the documents within radius_km of a point
+def neighbourhood_stats(docs, lat, lng, radius_km=1, percentiles=(50, 90)):
+    lats, lngs, values = sensor_columns(docs)
+    mask = haversine_many(lat, lng, lats, lngs) <= radius_km
+    return masked_stats(values, mask, percentiles)
@@ -0,0 +1,148 @@
+import datetime
+import logging
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+
+from pymongo.errors import OperationFailure
+
+from geo import EARTH_RADIUS_KM, haversine_many
+
+logger = logging.getLogger(__name__)
+
+KM_PER_DEGREE = 111.32
+
+
+# GeoJSON point stored alongside latitude/longitude for 2dsphere queries
+def geo_point(lat, lng):
+    return {"type": "Point", "coordinates": [float(lng), float(lat)]}
+
+
+def ensure_geo_indexes(*collections):
+    for collection in collections:
+        collection.create_index([("location", "2dsphere")])
+        logger.info(f"2dsphere index ensured on {collection.name}")
+
+
+# Backfill GeoJSON locations for documents written before the location field existed
+def migrate_geo_locations(collection):
+    result = collection.update_many(
+        {
+            "location": {"$exists": False},
+            "latitude": {"$type": "number", "$gte": -90, "$lte": 90},
+            "longitude": {"$type": "number", "$gte": -180, "$lte": 180}
+        },
+        [{"$set": {"location": {"type": "Point", "coordinates": ["$longitude", "$latitude"]}}}]
+    )
+    logger.info(f"Added GeoJSON location to {result.modified_count} documents in {collection.name}")
+    return result.modified_count
+
+
+# In-process uniform grid over lat/lng, used when Mongo geo queries are unavailable
+class GeoGridIndex:
+    def __init__(self, cell_degrees=0.01):
+        self.cell_degrees = cell_degrees
+        self._cells = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def _cell(self, lat, lng):
+        return int(math.floor(lat / self.cell_degrees)), int(math.floor(lng / self.cell_degrees))
+
+    def add(self, doc):
+        key = self._cell(doc["latitude"], doc["longitude"])
+        with self._lock:
+            self._cells[key].append(doc)
+
+    def prune(self, before):
+        with self._lock:
+            for key in list(self._cells):
+                kept = [doc for doc in self._cells[key] if doc.get("created_at") and doc["created_at"] >= before]
+                if kept:
+                    self._cells[key] = kept
+                else:
+                    del self._cells[key]
+
+    def query_radius(self, lat, lng, radius_km):
+        lat_span = radius_km / KM_PER_DEGREE
+        lng_span = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+        min_i, min_j = self._cell(lat - lat_span, lng - lng_span)
+        max_i, max_j = self._cell(lat + lat_span, lng + lng_span)
+        with self._lock:
+            candidates = [
+                doc
+                for i in range(min_i, max_i + 1)
+                for j in range(min_j, max_j + 1)
+                for doc in self._cells.get((i, j), ())
+            ]
+        if not candidates:
+            return []
+        distances = haversine_many(lat, lng, [doc["latitude"] for doc in candidates], [doc["longitude"] for doc in candidates])
+        return [doc for doc, distance in zip(candidates, distances) if distance <= radius_km]
+
+
+# Radius lookups over a collection: $geoWithin on the 2dsphere index, grid index as fallback
+class NeighbourhoodSearch:
+    def __init__(self, collection, projection, window_days=30, retry_seconds=None):
+        self.collection = collection
+        self.projection = dict(projection, latitude=1, longitude=1, created_at=1)
+        self.window_days = window_days
+        self.retry_seconds = retry_seconds if retry_seconds is not None else float(os.getenv("GEO_QUERY_RETRY_SECONDS", 60))
+        # A failed geo query may be transient; the 2dsphere path is retried once this passes
+        self._geo_retry_at = None
+        self._fallback = None
+        self._fallback_lock = threading.Lock()
+        self._pruned_at = None
+
+    def find_within(self, lat, lng, radius_km, since=None, match=None, limit=0):
+        if self._geo_retry_at is None or time.monotonic() >= self._geo_retry_at:
+            query = dict(match or {})
+            query["location"] = {"$geoWithin": {"$centerSphere": [[lng, lat], radius_km / EARTH_RADIUS_KM]}}
+            if since:
+                query["created_at"] = {"$gte": since}
+            try:
+                docs = list(self.collection.find(query, self.projection, limit=limit))
+                self._geo_retry_at = None
+                return docs
+            except OperationFailure as e:
+                logger.warning(f"Geo query failed on {self.collection.name}, using in-process grid index for {self.retry_seconds:.0f}s: {str(e)}")
+                self._geo_retry_at = time.monotonic() + self.retry_seconds
+        # Like the 2dsphere path, documents without created_at never match a since filter
+        docs = [
+            doc for doc in self._fallback_index().query_radius(lat, lng, radius_km)
+            if (not since or (doc.get("created_at") is not None and doc["created_at"] >= since))
+            and all(doc.get(field) == value for field, value in (match or {}).items())
+        ]
+        return docs[:limit] if limit else docs
+
+    def exists_within(self, lat, lng, radius_km, since=None, match=None):
+        return bool(self.find_within(lat, lng, radius_km, since=since, match=match, limit=1))
+
+    # Keep the fallback index current with newly inserted documents
+    def add(self, doc):
+        if self._fallback is not None:
+            self._fallback.add({field: doc.get(field) for field in self.projection})
+
+    def _fallback_index(self):
+        with self._fallback_lock:
+            now = datetime.datetime.utcnow()
+            since = now - datetime.timedelta(days=self.window_days)
+            if self._fallback is None:
+                index = GeoGridIndex()
+                for doc in self.collection.find(
+                    {
+                        "created_at": {"$gte": since},
+                        "latitude": {"$exists": True},
+                        "longitude": {"$exists": True}
+                    },
+                    self.projection
+                ):
+                    index.add(doc)
+                self._fallback = index
+                self._pruned_at = now
+                logger.info(f"Built in-process grid index for {self.collection.name}")
+            elif now - self._pruned_at > datetime.timedelta(hours=1):
+                self._fallback.prune(since)
+                self._pruned_at = now
+            return self._fallback
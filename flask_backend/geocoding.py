@@ -0,0 +1,232 @@
+import csv
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import requests
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from geo import haversine_many
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN_ADDRESS = "Unknown address"
+
+
+# Reverse geocoding through the public Nominatim API
+class NominatimBackend:
+    url = "https://nominatim.openstreetmap.org/reverse"
+
+    def __init__(self, timeout=5, user_agent="WaterQualityApp/1.0"):
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = user_agent
+
+    def reverse(self, lat, lng):
+        response = self.session.get(
+            self.url,
+            params={"lat": lat, "lon": lng, "format": "json"},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json().get("display_name", UNKNOWN_ADDRESS)
+
+
+# Nearest named place from a local CSV/JSON gazetteer with name, latitude and longitude columns
+class GazetteerBackend:
+    def __init__(self, path, max_distance_km=5):
+        if path.endswith(".json"):
+            with open(path, encoding="utf-8") as f:
+                rows = json.load(f)
+        else:
+            with open(path, newline="", encoding="utf-8") as f:
+                rows = list(csv.DictReader(f))
+        self.names = [row["name"] for row in rows]
+        self.lats = np.array([float(row["latitude"]) for row in rows])
+        self.lngs = np.array([float(row["longitude"]) for row in rows])
+        self.max_distance_km = max_distance_km
+        logger.info(f"Loaded {len(self.names)} gazetteer entries from {path}")
+
+    def reverse(self, lat, lng):
+        if not self.names:
+            return UNKNOWN_ADDRESS
+        distances = haversine_many(lat, lng, self.lats, self.lngs)
+        nearest = int(np.argmin(distances))
+        return self.names[nearest] if distances[nearest] <= self.max_distance_km else UNKNOWN_ADDRESS
+
+
+# Process-wide minimum spacing between outgoing backend requests
+class RateLimiter:
+    def __init__(self, per_second):
+        self.interval = 1.0 / per_second if per_second else 0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            if slot - now > timeout:
+                return False
+            self._next_slot = slot + self.interval
+        time.sleep(slot - now)
+        return True
+
+
+# The same spacing shared by every process through one MongoDB document, so N gunicorn workers
+# together stay within the upstream limit. Each acquire reserves the next slot atomically.
+class MongoRateLimiter:
+    def __init__(self, collection, key, per_second):
+        self.collection = collection
+        self.key = key
+        self.interval = 1.0 / per_second if per_second else 0
+
+    def acquire(self, timeout):
+        if not self.interval:
+            return True
+        now = time.time()
+        try:
+            # Only a slot within timeout is reserved; when the next free one is later the filter
+            # misses, the upsert collides with the existing document and nothing is claimed
+            previous = self.collection.find_one_and_update(
+                {"_id": self.key, "next_slot": {"$lte": now + timeout}},
+                [{"$set": {"next_slot": {"$add": [{"$max": [{"$ifNull": ["$next_slot", now]}, now]}, self.interval]}}}],
+                upsert=True,
+                return_document=ReturnDocument.BEFORE
+            )
+        except DuplicateKeyError:
+            return False
+        slot = max(now, previous["next_slot"]) if previous else now
+        time.sleep(max(0.0, slot - time.time()))
+        return True
+
+
+class _Lookup:
+    def __init__(self):
+        self.done = threading.Event()
+        self.address = None
+
+
+# Cached, coalesced and rate-limited reverse geocoding keyed on rounded coordinates
+class ReverseGeocoder:
+    def __init__(self, backend, cache_collection=None, precision=3, ttl_seconds=None, max_entries=10000,
+                 rate_per_second=None, timeout=None, rate_limiter=None):
+        self.backend = backend
+        self.cache_collection = cache_collection
+        self.precision = precision
+        self.ttl_seconds = ttl_seconds or int(os.getenv("GEOCODER_CACHE_TTL_SECONDS", 30 * 24 * 3600))
+        self.max_entries = max_entries
+        self.timeout = timeout or float(os.getenv("GEOCODER_TIMEOUT_SECONDS", 5))
+        self.rate_limiter = rate_limiter or RateLimiter(rate_per_second or float(os.getenv("GEOCODER_RATE_PER_SECOND", 1)))
+        self._memory = OrderedDict()
+        self._memory_lock = threading.Lock()
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+
+    def ensure_indexes(self):
+        if self.cache_collection is not None:
+            self.cache_collection.create_index("created_at", expireAfterSeconds=self.ttl_seconds)
+
+    def cell_key(self, lat, lng):
+        return f"{round(float(lat), self.precision):.{self.precision}f},{round(float(lng), self.precision):.{self.precision}f}"
+
+    # Address for a cell already in the memory or Mongo cache; never calls the backend
+    def cached(self, lat, lng):
+        key = self.cell_key(lat, lng)
+        return self._memory_get(key) or self._stored_get(key)
+
+    def reverse(self, lat, lng):
+        key = self.cell_key(lat, lng)
+        address = self._memory_get(key)
+        if address:
+            return address
+        with self._inflight_lock:
+            lookup = self._inflight.get(key)
+            leader = lookup is None
+            if leader:
+                lookup = self._inflight[key] = _Lookup()
+        if not leader:
+            # Another request is already resolving this cell; share its answer
+            lookup.done.wait(self.timeout * 2)
+            return lookup.address or UNKNOWN_ADDRESS
+        try:
+            lookup.address = self._stored_get(key) or self._fetch(key, lat, lng)
+            return lookup.address
+        finally:
+            lookup.done.set()
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+
+    def _memory_get(self, key):
+        with self._memory_lock:
+            entry = self._memory.get(key)
+            if not entry:
+                return None
+            address, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            return address
+
+    def _memory_put(self, key, address):
+        with self._memory_lock:
+            self._memory[key] = (address, time.monotonic() + self.ttl_seconds)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _stored_get(self, key):
+        if self.cache_collection is None:
+            return None
+        try:
+            doc = self.cache_collection.find_one({"_id": key}, {"address": 1, "created_at": 1})
+        except Exception as e:
+            logger.error(f"Failed to read geocode cache: {str(e)}")
+            return None
+        if not doc:
+            return None
+        self._memory_put(key, doc["address"])
+        return doc["address"]
+
+    def _fetch(self, key, lat, lng):
+        if not self.rate_limiter.acquire(self.timeout):
+            logger.warning(f"Geocoding rate limit exceeded for lat={lat}, lng={lng}")
+            return UNKNOWN_ADDRESS
+        try:
+            address = self.backend.reverse(lat, lng)
+        except Exception as e:
+            logger.error(f"Failed to geocode coordinates: {str(e)}")
+            return UNKNOWN_ADDRESS
+        self._memory_put(key, address)
+        if self.cache_collection is not None:
+            try:
+                self.cache_collection.update_one(
+                    {"_id": key},
+                    {"$set": {"address": address, "created_at": datetime.datetime.utcnow()}},
+                    upsert=True
+                )
+            except Exception as e:
+                logger.error(f"Failed to store geocode cache entry: {str(e)}")
+        logger.info(f"Geocoded address: {address} for lat={lat}, lng={lng}")
+        return address
+
+
+# Build the geocoder configured by GEOCODER_BACKEND (nominatim or gazetteer). With a
+# rate_limit_collection the upstream rate limit is shared by every worker process.
+def create_geocoder(cache_collection=None, rate_limit_collection=None):
+    timeout = float(os.getenv("GEOCODER_TIMEOUT_SECONDS", 5))
+    if os.getenv("GEOCODER_BACKEND", "nominatim") == "gazetteer":
+        backend = GazetteerBackend(os.getenv("GEOCODER_GAZETTEER_PATH", "gazetteer.csv"))
+    else:
+        backend = NominatimBackend(timeout=timeout)
+    rate_limiter = None
+    if rate_limit_collection is not None:
+        rate_limiter = MongoRateLimiter(rate_limit_collection, "geocoder", float(os.getenv("GEOCODER_RATE_PER_SECOND", 1)))
+    return ReverseGeocoder(backend, cache_collection=cache_collection, timeout=timeout, rate_limiter=rate_limiter)
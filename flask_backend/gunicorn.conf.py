@@ -0,0 +1,29 @@
+import os
+
+# Worker model: WEB_CONCURRENCY processes, each with GUNICORN_THREADS request threads.
+# Threads let one worker's BatchInferenceEngine batch concurrent uploads and overlap Mongo I/O;
+# processes scale CPU-bound work past the GIL. Each worker holds its own CNN runtime, so size
+# WEB_CONCURRENCY to memory first (INFERENCE_BACKEND=tflite keeps that small).
+# Flow job event streams and the legacy /optimize_flow wait each hold a thread while they poll;
+# FLOW_JOB_MAX_WAITERS caps them per worker, so keep it well below GUNICORN_THREADS.
+wsgi_app = "wsgi:application"
+bind = os.getenv("BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+graceful_timeout = 30
+keepalive = 5
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 0))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 0))
+accesslog = os.getenv("GUNICORN_ACCESS_LOG")
+errorlog = "-"
+
+
+# Threads do not survive fork, so every worker starts its own model loader, retrainer,
+# notification workers, leaderboard reconciler and ingestion flusher
+def post_fork(server, worker):
+    from app import start_background_services
+    start_background_services()
+    server.log.info(f"Worker {worker.pid} started background services")
@@ -0,0 +1,144 @@
+import datetime
+import logging
+import math
+import os
+from collections import defaultdict
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+ZOOM_LEVELS = [int(z) for z in os.getenv("HEATMAP_ZOOM_LEVELS", "4,8,12,16").split(",")]
+MAX_LATITUDE = 85.0511
+
+
+# Web-mercator (slippy map) tile containing a point
+def tile_xy(lat, lng, zoom):
+    lat = max(min(lat, MAX_LATITUDE), -MAX_LATITUDE)
+    n = 2 ** zoom
+    x = int((lng + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def day_bucket(created_at):
+    return datetime.datetime(created_at.year, created_at.month, created_at.day)
+
+
+# Bucket day for a report; undated legacy reports share day=None in both the incremental and rebuild
+# paths, so a reconcile never moves them
+def report_day(report):
+    created_at = report.get("created_at")
+    return day_bucket(created_at) if isinstance(created_at, datetime.datetime) else None
+
+
+# Report counts per (zoom, tile, status, day), kept current as reports are inserted and change status
+class HeatmapStore:
+    def __init__(self, collection, reports_collection, zoom_levels=ZOOM_LEVELS):
+        self.collection = collection
+        self.reports_collection = reports_collection
+        self.zoom_levels = sorted(zoom_levels)
+
+    def ensure_indexes(self):
+        self.collection.create_index([("zoom", 1), ("x", 1), ("y", 1), ("status", 1), ("day", 1)], unique=True)
+
+    def _bucket_updates(self, report, status, delta):
+        lat, lng = float(report["latitude"]), float(report["longitude"])
+        day = report_day(report)
+        updates = []
+        for zoom in self.zoom_levels:
+            x, y = tile_xy(lat, lng, zoom)
+            updates.append(UpdateOne(
+                {"zoom": zoom, "x": x, "y": y, "status": status, "day": day},
+                {"$inc": {"count": delta, "lat_sum": lat * delta, "lng_sum": lng * delta}},
+                upsert=True
+            ))
+        return updates
+
+    def record(self, report, status=None, delta=1):
+        try:
+            self.collection.bulk_write(self._bucket_updates(report, status or report.get("status"), delta), ordered=False)
+        except Exception as e:
+            logger.error(f"Failed to update heatmap tiles: {str(e)}")
+
+    def change_status(self, report, old_status, new_status):
+        if old_status == new_status:
+            return
+        try:
+            self.collection.bulk_write(
+                self._bucket_updates(report, old_status, -1) + self._bucket_updates(report, new_status, 1),
+                ordered=False
+            )
+        except Exception as e:
+            logger.error(f"Failed to move report between heatmap tiles: {str(e)}")
+
+    # Recompute every bucket from WaterReports
+    def rebuild(self):
+        buckets = defaultdict(lambda: [0, 0.0, 0.0])
+        for report in self.reports_collection.find(
+            {"latitude": {"$type": "number"}, "longitude": {"$type": "number"}},
+            {"latitude": 1, "longitude": 1, "status": 1, "created_at": 1}
+        ):
+            lat, lng = report["latitude"], report["longitude"]
+            day = report_day(report)
+            for zoom in self.zoom_levels:
+                bucket = buckets[(zoom, *tile_xy(lat, lng, zoom), report.get("status"), day)]
+                bucket[0] += 1
+                bucket[1] += lat
+                bucket[2] += lng
+        self.collection.delete_many({})
+        docs = [
+            {"zoom": zoom, "x": x, "y": y, "status": status, "day": day, "count": count, "lat_sum": lat_sum, "lng_sum": lng_sum}
+            for (zoom, x, y, status, day), (count, lat_sum, lng_sum) in buckets.items()
+        ]
+        if docs:
+            self.collection.insert_many(docs, ordered=False)
+        logger.info(f"Rebuilt {len(docs)} heatmap buckets")
+
+    def rebuild_if_empty(self):
+        if not self.collection.find_one({}, {"_id": 1}):
+            self.rebuild()
+
+    def zoom_level(self, zoom):
+        eligible = [level for level in self.zoom_levels if level <= zoom]
+        return eligible[-1] if eligible else self.zoom_levels[0]
+
+    # Aggregate precomputed buckets covering bbox (min_lng, min_lat, max_lng, max_lat).
+    # Undated (day=None) buckets count only when no date range is given, as a created_at filter on
+    # the reports themselves would exclude them.
+    def query(self, zoom=None, bbox=None, status=None, start=None, end=None):
+        level = self.zoom_level(zoom) if zoom is not None else self.zoom_levels[-1]
+        match = {"zoom": level, "count": {"$gt": 0}}
+        if bbox:
+            min_lng, min_lat, max_lng, max_lat = bbox
+            min_x, min_y = tile_xy(max_lat, min_lng, level)
+            max_x, max_y = tile_xy(min_lat, max_lng, level)
+            match["x"] = {"$gte": min_x, "$lte": max_x}
+            match["y"] = {"$gte": min_y, "$lte": max_y}
+        if status:
+            match["status"] = status
+        if start and end:
+            match["day"] = {"$gte": day_bucket(start), "$lte": day_bucket(end)}
+        pipeline = [
+            {"$match": match},
+            {
+                "$group": {
+                    "_id": {"x": "$x", "y": "$y", "status": "$status"},
+                    "count": {"$sum": "$count"},
+                    "lat_sum": {"$sum": "$lat_sum"},
+                    "lng_sum": {"$sum": "$lng_sum"}
+                }
+            },
+            {"$match": {"count": {"$gt": 0}}},
+            {
+                "$project": {
+                    "latitude": {"$divide": ["$lat_sum", "$count"]},
+                    "longitude": {"$divide": ["$lng_sum", "$count"]},
+                    "status": "$_id.status",
+                    "count": 1,
+                    "_id": 0
+                }
+            },
+            {"$sort": {"latitude": 1, "longitude": 1, "status": 1}}
+        ]
+        return list(self.collection.aggregate(pipeline))
@@ -0,0 +1,79 @@
+import logging
+
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+
+def _plan_stages(plan):
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(_plan_stages(item))
+    return stages
+
+
+def _plan_index_names(plan):
+    names = []
+    if isinstance(plan, dict):
+        if "indexName" in plan:
+            names.append(plan["indexName"])
+        for value in plan.values():
+            names.extend(_plan_index_names(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            names.extend(_plan_index_names(item))
+    return names
+
+
+# Registry of required indexes and hot query shapes, with an explain()-based plan audit
+class IndexManager:
+    def __init__(self):
+        self._indexes = []
+        self._queries = []
+
+    def index(self, collection, keys, **options):
+        self._indexes.append((collection, keys, options))
+
+    def query(self, name, collection, filter, sort=None, projection=None):
+        self._queries.append((name, collection, filter, sort, projection))
+
+    # create_index is a no-op for indexes that already exist, so this is safe on every boot
+    def ensure_indexes(self):
+        created = 0
+        for collection, keys, options in self._indexes:
+            try:
+                collection.create_index(keys, **options)
+                created += 1
+            except OperationFailure as e:
+                logger.error(f"Failed to create index {keys} on {collection.name}: {str(e)}")
+        logger.info(f"Ensured {created}/{len(self._indexes)} indexes")
+
+    def audit(self):
+        results = []
+        for name, collection, filter, sort, projection in self._queries:
+            try:
+                cursor = collection.find(filter, projection)
+                if sort:
+                    cursor = cursor.sort(sort)
+                winning_plan = cursor.explain().get("queryPlanner", {}).get("winningPlan", {})
+                stages = _plan_stages(winning_plan)
+                results.append({
+                    "query": name,
+                    "collection": collection.name,
+                    "stages": stages,
+                    "indexes": _plan_index_names(winning_plan),
+                    "collection_scan": "COLLSCAN" in stages
+                })
+            except Exception as e:
+                logger.error(f"Failed to explain query {name}: {str(e)}")
+                results.append({"query": name, "collection": collection.name, "error": str(e)})
+        for result in results:
+            if result.get("collection_scan"):
+                logger.warning(f"Query {result['query']} on {result['collection']} uses a collection scan")
+        return results
@@ -0,0 +1,152 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+IMAGE_SIZE = (224, 224)
+
+
+# Wrap a Keras model in a compiled forward pass that accepts any batch size
+def compiled_forward(model, image_size=IMAGE_SIZE):
+    import tensorflow as tf
+
+    @tf.function(input_signature=[tf.TensorSpec(shape=(None, image_size[0], image_size[1], 3), dtype=tf.float32)])
+    def forward(images):
+        return model(images, training=False)
+
+    def run(batch):
+        return forward(tf.convert_to_tensor(batch, dtype=tf.float32)).numpy()
+    return run
+
+
+# Keras backend: full TensorFlow, loads the .h5 model
+def keras_forward(model_path):
+    import tensorflow as tf
+    return compiled_forward(tf.keras.models.load_model(model_path))
+
+
+def _tflite_interpreter(model_path, num_threads):
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        from tensorflow.lite import Interpreter
+        logger.warning("tflite_runtime not installed, falling back to tensorflow.lite")
+    return Interpreter(model_path=model_path, num_threads=num_threads)
+
+
+# TFLite backend: runs the converted model without importing TensorFlow when tflite_runtime is available
+def tflite_forward(model_path, num_threads=None):
+    interpreter = _tflite_interpreter(model_path, num_threads or int(os.getenv("TFLITE_NUM_THREADS", os.cpu_count() or 1)))
+    interpreter.allocate_tensors()
+    input_detail = interpreter.get_input_details()[0]
+    output_detail = interpreter.get_output_details()[0]
+    lock = threading.Lock()
+
+    # int8 models may also quantize their inputs and outputs; float I/O passes through unchanged
+    def quantize(batch):
+        scale, zero_point = input_detail["quantization"]
+        if input_detail["dtype"] == np.float32 or not scale:
+            return batch.astype(input_detail["dtype"], copy=False)
+        info = np.iinfo(input_detail["dtype"])
+        return np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(input_detail["dtype"])
+
+    def dequantize(output):
+        scale, zero_point = output_detail["quantization"]
+        if output_detail["dtype"] == np.float32 or not scale:
+            return output.astype(np.float32, copy=False)
+        return (output.astype(np.float32) - zero_point) * scale
+
+    def run(batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        with lock:
+            # The interpreter is converted for batch 1; resize only when the batch size changes
+            if interpreter.get_input_details()[0]["shape"][0] != len(batch):
+                interpreter.resize_tensor_input(input_detail["index"], [len(batch), *batch.shape[1:]])
+                interpreter.allocate_tensors()
+            interpreter.set_tensor(input_detail["index"], quantize(batch))
+            interpreter.invoke()
+            return dequantize(interpreter.get_tensor(output_detail["index"])).copy()
+    return run
+
+
+INFERENCE_BACKENDS = {
+    "keras": keras_forward,
+    "tflite": tflite_forward
+}
+
+
+# Build the forward function for the backend named by INFERENCE_BACKEND
+def load_forward(backend, model_path):
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend}, expected one of {sorted(INFERENCE_BACKENDS)}")
+    forward = INFERENCE_BACKENDS[backend](model_path)
+    logger.info(f"Loaded {backend} inference backend from {model_path}")
+    return forward
+
+
+# Collects concurrent single-image requests into micro-batches for one forward pass each
+class BatchInferenceEngine:
+    def __init__(self, forward, max_batch_size=None, max_wait_ms=None):
+        self.forward = forward
+        self.max_batch_size = max_batch_size or int(os.getenv("INFERENCE_MAX_BATCH_SIZE", 16))
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else float(os.getenv("INFERENCE_MAX_WAIT_MS", 10))) / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    # Queue one preprocessed image; the future resolves to its row of class probabilities
+    def submit(self, image):
+        self._ensure_started()
+        future = Future()
+        self._queue.put((np.asarray(image, dtype=np.float32), future))
+        return future
+
+    def predict(self, image, timeout=None):
+        return self.submit(image).result(timeout)
+
+    def _ensure_started(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="batch-inference", daemon=True)
+            self._thread.start()
+            logger.info(f"Batch inference engine started (max_batch_size={self.max_batch_size}, max_wait={self.max_wait * 1000:.0f}ms)")
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = [(image, future) for image, future in self._collect_batch() if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            images = [image for image, _ in batch]
+            futures = [future for _, future in batch]
+            try:
+                preds = self.forward(np.stack(images))
+            except Exception as e:
+                logger.error(f"Batch inference failed for {len(futures)} images: {str(e)}")
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            for future, pred in zip(futures, preds):
+                future.set_result(pred)
+            logger.debug(f"Ran inference batch of {len(futures)} images")
@@ -0,0 +1,233 @@
+import datetime
+import logging
+import os
+import threading
+import time
+
+from pymongo.errors import BulkWriteError
+
+from geo import SENSOR_FIELDS
+from geo_index import geo_point
+
+logger = logging.getLogger(__name__)
+
+# Same bounds predict_water_quality enforces
+SENSOR_RANGES = {
+    "ph": (0, 14),
+    "turbidity": (0, 100),
+    "temperature": (0, 100),
+    "conductivity": (0, 2000)
+}
+
+
+class IngestBackpressure(Exception):
+    pass
+
+
+# Validate one sensor reading; returns (lat, lng, values in SENSOR_FIELDS order) or raises ValueError
+def parse_sensor_reading(reading):
+    if not isinstance(reading, dict):
+        raise ValueError("Reading must be an object")
+    if reading.get("latitude") is None or reading.get("longitude") is None:
+        raise ValueError("Latitude and longitude are required")
+    if any(reading.get(name) is None for name in SENSOR_FIELDS):
+        raise ValueError("ph, turbidity, temperature and conductivity are required")
+    try:
+        lat = float(reading["latitude"])
+        lng = float(reading["longitude"])
+        values = [float(reading[name]) for name in SENSOR_FIELDS]
+    except (TypeError, ValueError):
+        raise ValueError("Coordinates and parameters must be numeric")
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError("Latitude must be within -90..90 and longitude within -180..180")
+    for name, value in zip(SENSOR_FIELDS, values):
+        low, high = SENSOR_RANGES[name]
+        if not low <= value <= high:
+            raise ValueError("Parameters out of valid range")
+    return lat, lng, values
+
+
+def _reading_time(reading, now):
+    timestamp = reading.get("timestamp")
+    if timestamp is None:
+        return now
+    try:
+        if isinstance(timestamp, (int, float)):
+            return datetime.datetime.utcfromtimestamp(timestamp)
+        return datetime.datetime.fromisoformat(str(timestamp).replace("Z", "+00:00")).replace(tzinfo=None)
+    except (ValueError, OverflowError, OSError):
+        raise ValueError("timestamp must be epoch seconds or ISO 8601")
+
+
+# Buffers validated readings and flushes them with insert_many on size or age.
+# When Mongo falls behind the buffer fills up and offer() raises IngestBackpressure.
+class SensorIngestor:
+    def __init__(self, collection, score=None, on_flush=None, batch_size=None, flush_seconds=None,
+                 max_pending=None, offer_timeout=None, retry_seconds=None):
+        self.collection = collection
+        self.score = score
+        self.on_flush = on_flush
+        self.batch_size = batch_size or int(os.getenv("INGEST_BATCH_SIZE", 500))
+        self.flush_seconds = flush_seconds or float(os.getenv("INGEST_FLUSH_SECONDS", 1))
+        self.max_pending = max_pending or int(os.getenv("INGEST_MAX_PENDING", 20000))
+        self.offer_timeout = offer_timeout if offer_timeout is not None else float(os.getenv("INGEST_OFFER_TIMEOUT_SECONDS", 2))
+        self.retry_seconds = retry_seconds or float(os.getenv("INGEST_RETRY_SECONDS", 2))
+        self._buffer = []
+        self._oldest = None
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self.accepted = 0
+        self.rejected = 0
+        self.flushed = 0
+        self.failures = 0
+        self.dropped = 0
+        self.last_flush_ms = None
+
+    # Validate a batch of raw readings; returns (documents, errors) where errors is [(index, message)]
+    def build_documents(self, readings, user_phone, device_id=None):
+        now = datetime.datetime.utcnow()
+        documents = []
+        errors = []
+        for i, reading in enumerate(readings):
+            try:
+                lat, lng, values = parse_sensor_reading(reading)
+                created_at = _reading_time(reading, now)
+            except ValueError as e:
+                errors.append((i, str(e)))
+                continue
+            document = {
+                "device_id": reading.get("device_id") or device_id,
+                "user_phone": user_phone,
+                "latitude": lat,
+                "longitude": lng,
+                "location": geo_point(lat, lng),
+                "address": reading.get("address"),
+                "created_at": created_at,
+                "received_at": now,
+                "source": "iot_stream"
+            }
+            document.update(zip(SENSOR_FIELDS, values))
+            documents.append(document)
+        return documents, errors
+
+    # Queue documents for the next flush, waiting up to offer_timeout for room in the buffer
+    def offer(self, documents, rejected=0):
+        if not documents:
+            self.rejected += rejected
+            return
+        self._ensure_started()
+        deadline = time.monotonic() + self.offer_timeout
+        with self._cond:
+            while len(self._buffer) + len(documents) > self.max_pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise IngestBackpressure(f"Ingest buffer full ({len(self._buffer)} pending)")
+                self._cond.wait(remaining)
+            if not self._buffer:
+                self._oldest = time.monotonic()
+            self._buffer.extend(documents)
+            self.accepted += len(documents)
+            self.rejected += rejected
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify_all()
+
+    def _ensure_started(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._cond:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sensor-ingest", daemon=True)
+            self._thread.start()
+            logger.info(f"Sensor ingestor started (batch_size={self.batch_size}, flush_seconds={self.flush_seconds})")
+
+    def start(self):
+        self._ensure_started()
+
+    # Flush whatever is buffered and stop the flusher
+    def stop(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join()
+        self._flush(self._take(len(self._buffer)))
+
+    def _take(self, count):
+        with self._cond:
+            batch = self._buffer[:count]
+            del self._buffer[:count]
+            self._oldest = time.monotonic() if self._buffer else None
+            self._cond.notify_all()
+            return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._cond:
+                while not self._stop.is_set():
+                    if len(self._buffer) >= self.batch_size:
+                        break
+                    if self._buffer and time.monotonic() - self._oldest >= self.flush_seconds:
+                        break
+                    wait = self.flush_seconds if not self._buffer else self.flush_seconds - (time.monotonic() - self._oldest)
+                    self._cond.wait(max(wait, 0.01))
+                if self._stop.is_set():
+                    return
+                batch = self._buffer[:self.batch_size]
+            try:
+                self._flush(batch)
+            except Exception as e:
+                # Keep the batch buffered; producers see backpressure until Mongo catches up
+                self.failures += 1
+                logger.error(f"Failed to flush {len(batch)} sensor readings: {str(e)}")
+                self._stop.wait(self.retry_seconds)
+                continue
+            self._take(len(batch))
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        started = time.perf_counter()
+        if self.score:
+            try:
+                qualities, confidences = self.score([[doc[name] for name in SENSOR_FIELDS] for doc in batch])
+                for doc, quality, confidence in zip(batch, qualities, confidences):
+                    doc["quality"] = quality
+                    doc["confidence"] = round(confidence, 2)
+            except Exception as e:
+                logger.warning(f"Skipping inline scoring for {len(batch)} readings: {str(e)}")
+        stored = batch
+        try:
+            self.collection.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            if e.details.get("writeConcernErrors"):
+                raise
+            # Duplicates are documents a retried batch already stored under the _ids insert_many
+            # assigned. Any other write error is a property of the document (geo keys, validation)
+            # and would fail again, so it is dropped rather than retried, which would wedge the buffer.
+            rejected = {err["index"]: err for err in e.details.get("writeErrors", []) if err.get("code") != 11000}
+            for err in rejected.values():
+                logger.error(f"Dropping sensor reading from device {batch[err['index']].get('device_id')}: {err.get('errmsg')}")
+            self.dropped += len(rejected)
+            stored = [doc for i, doc in enumerate(batch) if i not in rejected]
+        self.flushed += len(stored)
+        self.last_flush_ms = round((time.perf_counter() - started) * 1000, 1)
+        if self.on_flush and stored:
+            self.on_flush(stored)
+        logger.debug(f"Flushed {len(batch)} sensor readings in {self.last_flush_ms}ms")
+
+    def stats(self):
+        with self._cond:
+            pending = len(self._buffer)
+        return {
+            "pending": pending,
+            "max_pending": self.max_pending,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "flushed": self.flushed,
+            "flush_failures": self.failures,
+            "dropped": self.dropped,
+            "last_flush_ms": self.last_flush_ms
+        }
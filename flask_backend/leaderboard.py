@@ -0,0 +1,124 @@
+import datetime
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+LEADERBOARD_SORT = [("total_upvotes", -1), ("report_count", -1), ("user_phone", 1)]
+
+
+# Materialized per-user upvote/report totals, updated incrementally and reconciled periodically
+class Leaderboard:
+    def __init__(self, collection, reports_collection, reconcile_seconds=None):
+        self.collection = collection
+        self.reports_collection = reports_collection
+        self.reconcile_seconds = reconcile_seconds or float(os.getenv("LEADERBOARD_RECONCILE_SECONDS", 3600))
+        self._stop = threading.Event()
+        self._thread = None
+
+    def ensure_indexes(self):
+        self.collection.create_index("user_phone", unique=True)
+        self.collection.create_index(LEADERBOARD_SORT)
+
+    def record_report(self, user_phone, user_name=None):
+        try:
+            update = {
+                "$inc": {"report_count": 1},
+                "$setOnInsert": {"total_upvotes": 0, "reconciled_at": datetime.datetime.utcnow()}
+            }
+            if user_name:
+                update["$set"] = {"user_name": user_name}
+            self.collection.update_one({"user_phone": user_phone}, update, upsert=True)
+        except Exception as e:
+            logger.error(f"Failed to update leaderboard for report by {user_phone}: {str(e)}")
+
+    def record_upvote(self, user_phone, delta=1):
+        try:
+            self.collection.update_one(
+                {"user_phone": user_phone},
+                {
+                    "$inc": {"total_upvotes": delta},
+                    "$setOnInsert": {"report_count": 0, "reconciled_at": datetime.datetime.utcnow()}
+                },
+                upsert=True
+            )
+        except Exception as e:
+            logger.error(f"Failed to update leaderboard upvotes for {user_phone}: {str(e)}")
+
+    def top(self, limit=10, offset=0):
+        entries = list(self.collection.find(
+            {},
+            {"_id": 0, "user_phone": 1, "user_name": 1, "total_upvotes": 1, "report_count": 1}
+        ).sort(LEADERBOARD_SORT).skip(offset).limit(limit))
+        for entry in entries:
+            entry.setdefault("user_name", "Unknown User")
+        return entries
+
+    # Recompute totals from WaterReports and drop users who no longer have reports
+    def reconcile(self):
+        started = datetime.datetime.utcnow()
+        try:
+            self.reports_collection.aggregate([
+                {
+                    "$group": {
+                        "_id": "$user_phone",
+                        "total_upvotes": {"$sum": {"$ifNull": ["$upvotes", 0]}},
+                        "report_count": {"$sum": 1}
+                    }
+                },
+                {"$match": {"_id": {"$ne": None}}},
+                {
+                    "$lookup": {
+                        "from": "Users",
+                        "localField": "_id",
+                        "foreignField": "phone",
+                        "as": "user"
+                    }
+                },
+                {
+                    "$unwind": {
+                        "path": "$user",
+                        "preserveNullAndEmptyArrays": True
+                    }
+                },
+                {
+                    "$project": {
+                        "user_phone": "$_id",
+                        "user_name": {"$ifNull": ["$user.name", "Unknown User"]},
+                        "total_upvotes": 1,
+                        "report_count": 1,
+                        "reconciled_at": {"$literal": started},
+                        "_id": 0
+                    }
+                },
+                {
+                    "$merge": {
+                        "into": self.collection.name,
+                        "on": "user_phone",
+                        "whenMatched": "merge",
+                        "whenNotMatched": "insert"
+                    }
+                }
+            ])
+            self.collection.delete_many({"reconciled_at": {"$lt": started}})
+            logger.info("Community leaderboard reconciled")
+        except Exception as e:
+            logger.error(f"Error reconciling community leaderboard: {str(e)}")
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="leaderboard-reconcile", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.reconcile()
+            self._stop.wait(self.reconcile_seconds)
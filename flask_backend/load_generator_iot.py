@@ -0,0 +1,113 @@
+import datetime
+import json
+import os
+import random
+import statistics
+import threading
+import time
+
+import jwt
+import requests
+
+from sensors import generate_sensor_data
+
+# Simulated probe fleet posting to /iot/ingest. Readings come from the same generator as
+# /simulate_iot_data; POLLUTED_FRACTION of the devices report with its pollution skew.
+#   INGEST_URL, INGEST_PHONE (an existing user), DEVICES, READINGS_PER_POST, POST_INTERVAL_SECONDS,
+#   DURATION_SECONDS, INGEST_MODE=json|ndjson, POLLUTED_FRACTION
+INGEST_URL = os.getenv("INGEST_URL", "http://localhost:5000/iot/ingest")
+SECRET_KEY = os.getenv("SECRET_KEY", "your_secret_key")
+PHONE = os.getenv("INGEST_PHONE", "+10000000000")
+DEVICES = int(os.getenv("DEVICES", 50))
+READINGS_PER_POST = int(os.getenv("READINGS_PER_POST", 20))
+POST_INTERVAL = float(os.getenv("POST_INTERVAL_SECONDS", 2))
+DURATION = float(os.getenv("DURATION_SECONDS", 60))
+MODE = os.getenv("INGEST_MODE", "json")
+POLLUTED_FRACTION = float(os.getenv("POLLUTED_FRACTION", 0.1))
+CENTER = (float(os.getenv("CENTER_LAT", 12.97)), float(os.getenv("CENTER_LNG", 77.59)))
+
+
+class Totals:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.accepted = 0
+        self.rejected = 0
+        self.throttled = 0
+        self.failed = 0
+        self.latencies = []
+
+    def record(self, response, latency):
+        with self.lock:
+            self.latencies.append(latency)
+            if response is None:
+                self.failed += 1
+            elif response.status_code == 429:
+                self.throttled += 1
+            elif response.status_code == 202:
+                body = response.json()
+                self.accepted += body["accepted"]
+                self.rejected += body["rejected"]
+            else:
+                self.failed += 1
+
+
+def readings_for(device_id, lat, lng, count, polluted):
+    now = time.time()
+    readings = []
+    for i in range(count):
+        reading = generate_sensor_data(has_pollution=polluted)
+        reading.update({"device_id": device_id, "latitude": lat, "longitude": lng, "timestamp": now - (count - i) * 0.1})
+        readings.append(reading)
+    return readings
+
+
+def run_device(device_id, token, deadline, totals):
+    lat = CENTER[0] + random.uniform(-0.05, 0.05)
+    lng = CENTER[1] + random.uniform(-0.05, 0.05)
+    polluted = random.random() < POLLUTED_FRACTION
+    session = requests.Session()
+    session.headers["x-access-token"] = token
+    while time.monotonic() < deadline:
+        readings = readings_for(device_id, lat, lng, READINGS_PER_POST, polluted)
+        started = time.perf_counter()
+        try:
+            if MODE == "ndjson":
+                # A generator body makes requests send it with chunked transfer encoding
+                body = (json.dumps(reading).encode() + b"\n" for reading in readings)
+                response = session.post(INGEST_URL, params={"device_id": device_id}, data=body,
+                                        headers={"Content-Type": "application/x-ndjson"}, timeout=30)
+            else:
+                response = session.post(INGEST_URL, json={"device_id": device_id, "readings": readings}, timeout=30)
+        except requests.RequestException:
+            response = None
+        totals.record(response, (time.perf_counter() - started) * 1000)
+        backoff = POST_INTERVAL
+        if response is not None and response.status_code == 429:
+            backoff = float(response.headers.get("Retry-After", POST_INTERVAL))
+        time.sleep(backoff)
+
+
+if __name__ == "__main__":
+    token = jwt.encode(
+        {"phone": PHONE, "exp": datetime.datetime.utcnow() + datetime.timedelta(hours=1)},
+        SECRET_KEY,
+        algorithm="HS256"
+    )
+    totals = Totals()
+    deadline = time.monotonic() + DURATION
+    threads = [
+        threading.Thread(target=run_device, args=(f"probe-{i:04d}", token, deadline, totals), daemon=True)
+        for i in range(DEVICES)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    latencies = sorted(totals.latencies) or [0.0]
+    print(f"{DEVICES} devices x {READINGS_PER_POST} readings every {POST_INTERVAL}s for {elapsed:.0f}s ({MODE})")
+    print(f"accepted {totals.accepted} ({totals.accepted / elapsed:.0f}/s), rejected {totals.rejected}, "
+          f"throttled posts {totals.throttled}, failed posts {totals.failed}")
+    print(f"post latency mean {statistics.mean(latencies):.1f}ms, p50 {latencies[len(latencies) // 2]:.1f}ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)]:.1f}ms")
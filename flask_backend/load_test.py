@@ -0,0 +1,102 @@
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+# Requests/s and p50/p99 latency of the gunicorn deployment at several worker counts.
+# Each count boots a fresh gunicorn with gunicorn.conf.py and drives it from CONCURRENCY client threads.
+#   LOAD_TEST_WORKERS=1,2,4 CONCURRENCY=32 DURATION_SECONDS=30 LOAD_TEST_PATHS=/map_data,/community_leaderboard
+#   LOAD_TEST_TOKEN sets x-access-token for authenticated paths
+WORKER_COUNTS = [int(n) for n in os.getenv("LOAD_TEST_WORKERS", "1,2,4").split(",")]
+THREADS_PER_WORKER = os.getenv("GUNICORN_THREADS", "8")
+CONCURRENCY = int(os.getenv("CONCURRENCY", 32))
+DURATION = float(os.getenv("DURATION_SECONDS", 30))
+PATHS = os.getenv("LOAD_TEST_PATHS", "/map_data,/community_leaderboard,/water_quality/trends?latitude=12.97&longitude=77.59").split(",")
+PORT = int(os.getenv("LOAD_TEST_PORT", 5055))
+TOKEN = os.getenv("LOAD_TEST_TOKEN")
+BOOT_TIMEOUT = float(os.getenv("BOOT_TIMEOUT_SECONDS", 180))
+
+
+def boot(workers):
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), GUNICORN_THREADS=THREADS_PER_WORKER, BIND=f"127.0.0.1:{PORT}")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + BOOT_TIMEOUT
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with code {server.returncode}")
+        try:
+            # /health is 503 until every model is loaded; any answer means workers are accepting
+            if requests.get(f"http://127.0.0.1:{PORT}/health", timeout=2).status_code == 200:
+                return server, True
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    return server, False
+
+
+def drive():
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + DURATION
+
+    def client(offset):
+        session = requests.Session()
+        if TOKEN:
+            session.headers["x-access-token"] = TOKEN
+        local = []
+        failed = 0
+        i = offset
+        while time.monotonic() < deadline:
+            path = PATHS[i % len(PATHS)]
+            i += 1
+            started = time.perf_counter()
+            try:
+                ok = session.get(f"http://127.0.0.1:{PORT}{path}", timeout=30).status_code < 500
+            except requests.RequestException:
+                ok = False
+            local.append((time.perf_counter() - started) * 1000)
+            failed += 0 if ok else 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(CONCURRENCY)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0], time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    print(f"{CONCURRENCY} clients for {DURATION:.0f}s over {PATHS}")
+    print(f"{'workers':>8} {'threads':>8} {'req/s':>8} {'p50 (ms)':>9} {'p99 (ms)':>9} {'errors':>7} {'models':>8}")
+    for workers in WORKER_COUNTS:
+        server, ready = boot(workers)
+        try:
+            latencies, errors, elapsed = drive()
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait()
+        latencies.sort()
+        if not latencies:
+            print(f"{workers:>8} no requests completed")
+            continue
+        print(
+            f"{workers:>8} {THREADS_PER_WORKER:>8} {len(latencies) / elapsed:>8.1f} "
+            f"{statistics.median(latencies):>9.1f} {latencies[int(len(latencies) * 0.99)]:>9.1f} "
+            f"{errors:>7} {'ready' if ready else 'partial':>8}"
+        )
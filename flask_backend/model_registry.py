@@ -0,0 +1,82 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+logger = logging.getLogger(__name__)
+
+
+class ModelNotReady(Exception):
+    pass
+
+
+# Loads registered models in parallel on background threads and reports per-model readiness
+class ModelRegistry:
+    def __init__(self, max_workers=None, wait_seconds=None):
+        self.max_workers = max_workers or int(os.getenv("MODEL_LOAD_WORKERS", 3))
+        self.wait_seconds = wait_seconds if wait_seconds is not None else float(os.getenv("MODEL_WAIT_SECONDS", 10))
+        self._loaders = {}
+        self._futures = {}
+        self._status = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    # fork_safe=False marks models whose runtime owns threads (TensorFlow, TFLite delegates) and so
+    # must be loaded in each worker after fork rather than in a preloading parent
+    def register(self, name, loader, fork_safe=True):
+        self._loaders[name] = (loader, fork_safe)
+        self._status[name] = {"status": "registered", "load_seconds": None, "error": None}
+
+    def start(self, names=None):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="model-loader")
+            for name, (loader, _) in self._loaders.items():
+                if name not in self._futures and (names is None or name in names):
+                    self._futures[name] = self._executor.submit(self._load, name, loader)
+
+    # Load the fork-safe models in this process and drop the loader threads, so a pre-fork server
+    # can share their pages copy-on-write; the rest load in each worker on the next start()
+    def preload(self):
+        self.start([name for name, (_, fork_safe) in self._loaders.items() if fork_safe])
+        for future in list(self._futures.values()):
+            try:
+                future.result()
+            except Exception:
+                pass
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+        logger.info(f"Preloaded models: {', '.join(name for name in self._futures if self.is_ready(name))}")
+
+    def _load(self, name, loader):
+        self._status[name] = {"status": "loading", "load_seconds": None, "error": None}
+        started = time.perf_counter()
+        try:
+            model = loader()
+        except Exception as e:
+            logger.error(f"Failed to load model {name}: {str(e)}")
+            self._status[name] = {"status": "failed", "load_seconds": round(time.perf_counter() - started, 3), "error": str(e)}
+            raise
+        self._status[name] = {"status": "ready", "load_seconds": round(time.perf_counter() - started, 3), "error": None}
+        logger.info(f"Model {name} loaded in {self._status[name]['load_seconds']}s")
+        return model
+
+    # Return a loaded model, waiting up to timeout seconds for one that is still loading
+    def get(self, name, timeout=None):
+        if name not in self._futures:
+            self.start()
+        try:
+            return self._futures[name].result(self.wait_seconds if timeout is None else timeout)
+        except TimeoutError:
+            raise ModelNotReady(f"Model {name} is still loading")
+        except Exception as e:
+            raise ModelNotReady(f"Model {name} failed to load: {str(e)}")
+
+    def is_ready(self, name):
+        return self._status.get(name, {}).get("status") == "ready"
+
+    def status(self):
+        return {name: dict(status) for name, status in self._status.items()}
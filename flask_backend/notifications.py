@@ -0,0 +1,221 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import smtplib
+import threading
+from email.mime.text import MIMEText
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+
+# Keeps one SMTP connection open per worker and reconnects when the server drops it
+class SmtpSender:
+    def __init__(self, host=None, port=None, username=None, password=None, sender=None, use_tls=None, timeout=30):
+        self.host = host or os.getenv("SMTP_HOST", "smtp.gmail.com")
+        self.port = int(port or os.getenv("SMTP_PORT", 587))
+        self.username = username if username is not None else os.getenv("SMTP_EMAIL")
+        self.password = password if password is not None else os.getenv("SMTP_PASSWORD")
+        self.sender = sender or os.getenv("SMTP_EMAIL", "no-reply@watermonitoring.com")
+        self.use_tls = use_tls if use_tls is not None else os.getenv("SMTP_STARTTLS", "true").lower() == "true"
+        self.timeout = timeout
+        self._server = None
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.use_tls:
+            server.starttls()
+        if self.username and self.password:
+            server.login(self.username, self.password)
+        logger.info(f"SMTP connection opened to {self.host}:{self.port}")
+        return server
+
+    def send(self, to, subject, body):
+        msg = MIMEText(body)
+        msg["Subject"] = subject
+        msg["From"] = self.sender
+        msg["To"] = to
+        if self._server is None:
+            self._server = self._connect()
+        try:
+            self._server.send_message(msg)
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            # Idle connections get dropped by the server; reconnect once and retry
+            self.close()
+            self._server = self._connect()
+            self._server.send_message(msg)
+
+    def close(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except Exception:
+                pass
+            self._server = None
+
+
+# Persistent outbox for SMS and email, drained by a pool of background workers
+class NotificationOutbox:
+    def __init__(self, collection, twilio_client, twilio_phone, smtp_factory=SmtpSender, workers=None,
+                 max_attempts=None, backoff_seconds=None, dedupe_seconds=None, poll_seconds=None):
+        self.collection = collection
+        self.twilio_client = twilio_client
+        self.twilio_phone = twilio_phone
+        self.smtp_factory = smtp_factory
+        self.workers = workers or int(os.getenv("NOTIFICATION_WORKERS", 2))
+        self.max_attempts = max_attempts or int(os.getenv("NOTIFICATION_MAX_ATTEMPTS", 5))
+        self.backoff_seconds = backoff_seconds or float(os.getenv("NOTIFICATION_BACKOFF_SECONDS", 5))
+        self.dedupe_seconds = dedupe_seconds if dedupe_seconds is not None else float(os.getenv("NOTIFICATION_DEDUPE_SECONDS", 300))
+        self.poll_seconds = poll_seconds or float(os.getenv("NOTIFICATION_POLL_SECONDS", 2))
+        self.lease_seconds = 60
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def ensure_indexes(self):
+        self.collection.create_index([("status", 1), ("next_attempt_at", 1)])
+        # At most one queued copy of any message at a time
+        self.collection.create_index("dedupe_key", unique=True, partialFilterExpression={"active": True})
+        self.collection.create_index([("dedupe_key", 1), ("sent_at", -1)])
+
+    # dedupe_key names the event a message is about (e.g. a report and status); without one,
+    # identical text to the same recipient is treated as the same message
+    def enqueue_sms(self, to, body, dedupe_key=None):
+        return self._enqueue("sms", to, {"body": body[:1600]}, dedupe_key)
+
+    def enqueue_email(self, to, subject, body, dedupe_key=None):
+        return self._enqueue("email", to, {"subject": subject, "body": body}, dedupe_key)
+
+    def _enqueue(self, channel, to, payload, dedupe_key=None):
+        if not to:
+            logger.warning(f"No recipient for {channel} notification, skipping")
+            return None
+        identity = dedupe_key if dedupe_key is not None else json.dumps(payload, sort_keys=True)
+        dedupe_key = hashlib.sha256(f"{channel}|{to}|{identity}".encode()).hexdigest()
+        now = datetime.datetime.utcnow()
+        if self.dedupe_seconds and self.collection.find_one(
+            {"dedupe_key": dedupe_key, "sent_at": {"$gte": now - datetime.timedelta(seconds=self.dedupe_seconds)}},
+            {"_id": 1}
+        ):
+            logger.info(f"Duplicate {channel} to {to} already sent recently, skipping")
+            return None
+        try:
+            result = self.collection.update_one(
+                {"dedupe_key": dedupe_key, "active": True},
+                {"$setOnInsert": {
+                    "channel": channel,
+                    "to": to,
+                    "payload": payload,
+                    "status": "pending",
+                    "attempts": 0,
+                    "next_attempt_at": now,
+                    "created_at": now
+                }},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            result = None
+        if result is None or result.upserted_id is None:
+            logger.info(f"Duplicate {channel} to {to} already queued, skipping")
+            return None
+        self._wake.set()
+        logger.info(f"Queued {channel} notification {result.upserted_id} to {to}")
+        return result.upserted_id
+
+    def start(self):
+        if any(thread.is_alive() for thread in self._threads):
+            return
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._run, name=f"notification-worker-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Notification outbox started with {self.workers} workers")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join()
+
+    def _run(self):
+        smtp = self.smtp_factory()
+        try:
+            while not self._stop.is_set():
+                try:
+                    message = self._claim()
+                except Exception as e:
+                    logger.error(f"Failed to claim notification: {str(e)}")
+                    message = None
+                if message is None:
+                    if self._wake.wait(self.poll_seconds):
+                        self._wake.clear()
+                    continue
+                self._deliver(message, smtp)
+        finally:
+            smtp.close()
+
+    # Lease the oldest due message; leases held by crashed workers expire and are reclaimed
+    def _claim(self):
+        now = datetime.datetime.utcnow()
+        return self.collection.find_one_and_update(
+            {"$or": [
+                {"status": "pending", "next_attempt_at": {"$lte": now}},
+                {"status": "sending", "locked_until": {"$lte": now}}
+            ]},
+            {
+                "$set": {"status": "sending", "locked_until": now + datetime.timedelta(seconds=self.lease_seconds)},
+                "$inc": {"attempts": 1}
+            },
+            sort=[("next_attempt_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _deliver(self, message, smtp):
+        payload = message["payload"]
+        try:
+            provider_id = None
+            if message["channel"] == "sms":
+                result = self.twilio_client.messages.create(body=payload["body"], from_=self.twilio_phone, to=message["to"])
+                provider_id = getattr(result, "sid", None)
+            else:
+                smtp.send(message["to"], payload["subject"], payload["body"])
+            self.collection.update_one(
+                {"_id": message["_id"]},
+                {
+                    "$set": {"status": "sent", "sent_at": datetime.datetime.utcnow(), "provider_id": provider_id},
+                    "$unset": {"active": "", "locked_until": ""}
+                }
+            )
+            logger.info(f"{message['channel'].upper()} sent to {message['to']} ({message['_id']})")
+        except Exception as e:
+            attempts = message["attempts"]
+            if attempts >= self.max_attempts:
+                self.collection.update_one(
+                    {"_id": message["_id"]},
+                    {
+                        "$set": {"status": "failed", "last_error": str(e), "failed_at": datetime.datetime.utcnow()},
+                        "$unset": {"active": "", "locked_until": ""}
+                    }
+                )
+                logger.error(f"Giving up on {message['channel']} to {message['to']} after {attempts} attempts: {str(e)}")
+                return
+            delay = min(self.backoff_seconds * 2 ** (attempts - 1), 3600)
+            self.collection.update_one(
+                {"_id": message["_id"]},
+                {
+                    "$set": {
+                        "status": "pending",
+                        "last_error": str(e),
+                        "next_attempt_at": datetime.datetime.utcnow() + datetime.timedelta(seconds=delay)
+                    },
+                    "$unset": {"locked_until": ""}
+                }
+            )
+            logger.warning(f"Failed to send {message['channel']} to {message['to']} (attempt {attempts}), retrying in {delay:.0f}s: {str(e)}")
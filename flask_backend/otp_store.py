@@ -0,0 +1,188 @@
+import datetime
+import hashlib
+import hmac
+import logging
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+OTP_VALID = "valid"
+OTP_INVALID = "invalid"
+OTP_EXPIRED = "expired"
+OTP_LOCKED = "locked"
+
+
+class OtpRateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Too many OTP requests, retry in {int(retry_after)}s")
+        self.retry_after = retry_after
+
+
+def _digest(phone, otp):
+    return hashlib.sha256(f"{phone}:{otp}".encode()).hexdigest()
+
+
+def _generate():
+    return str(random.SystemRandom().randint(100000, 999999))
+
+
+class _Limits:
+    def __init__(self, ttl_seconds=None, resend_seconds=None, max_sends=None, send_window_seconds=None, max_attempts=None):
+        self.ttl_seconds = ttl_seconds or int(os.getenv("OTP_TTL_SECONDS", 600))
+        self.resend_seconds = resend_seconds if resend_seconds is not None else int(os.getenv("OTP_RESEND_SECONDS", 60))
+        self.max_sends = max_sends or int(os.getenv("OTP_MAX_SENDS", 5))
+        self.send_window_seconds = send_window_seconds or int(os.getenv("OTP_SEND_WINDOW_SECONDS", 3600))
+        self.max_attempts = max_attempts or int(os.getenv("OTP_MAX_ATTEMPTS", 5))
+
+    # Seconds until another send is allowed, or 0
+    def send_wait(self, now, sends, window_start, last_sent_at):
+        if last_sent_at is not None and now - last_sent_at < self.resend_seconds:
+            return self.resend_seconds - (now - last_sent_at)
+        if window_start is not None and now - window_start < self.send_window_seconds and sends >= self.max_sends:
+            return self.send_window_seconds - (now - window_start)
+        return 0
+
+
+# Single-process store. The TTL is the same for every entry, so insertion order is expiry order and
+# expired entries are popped from the front of an OrderedDict in amortised O(1) per operation.
+class MemoryOtpStore(_Limits):
+    def __init__(self, **limits):
+        super().__init__(**limits)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def ensure_indexes(self):
+        pass
+
+    def _expire(self, now):
+        while self._entries:
+            phone, entry = next(iter(self._entries.items()))
+            if entry["expires_at"] > now:
+                break
+            del self._entries[phone]
+
+    def issue(self, phone):
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(phone)
+            if entry:
+                if now - entry["window_start"] >= self.send_window_seconds:
+                    entry["window_start"], entry["sends"] = now, 0
+                wait = self.send_wait(now, entry["sends"], entry["window_start"], entry["last_sent_at"])
+                if wait:
+                    raise OtpRateLimited(wait)
+            else:
+                entry = {"window_start": now, "sends": 0}
+            otp = _generate()
+            entry.update({
+                "digest": _digest(phone, otp),
+                "otp_expires_at": now + self.ttl_seconds,
+                "attempts": 0,
+                "sends": entry["sends"] + 1,
+                "last_sent_at": now,
+                # Kept until the send window closes so the rate limit outlives the code itself
+                "expires_at": now + max(self.ttl_seconds, self.send_window_seconds)
+            })
+            self._entries[phone] = entry
+            self._entries.move_to_end(phone)
+            return otp
+
+    def verify(self, phone, otp):
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(phone)
+            if not entry or entry.get("digest") is None or entry["otp_expires_at"] <= now:
+                return OTP_EXPIRED
+            if entry["attempts"] >= self.max_attempts:
+                return OTP_LOCKED
+            entry["attempts"] += 1
+            return OTP_VALID if hmac.compare_digest(entry["digest"], _digest(phone, otp)) else OTP_INVALID
+
+    def consume(self, phone):
+        with self._lock:
+            self._entries.pop(phone, None)
+
+
+# Shared store for multi-worker deployments. A TTL index on expires_at lets MongoDB drop each
+# document when its send window closes; codes themselves are checked against otp_expires_at.
+class MongoOtpStore(_Limits):
+    def __init__(self, collection, **limits):
+        super().__init__(**limits)
+        self.collection = collection
+
+    def ensure_indexes(self):
+        self.collection.create_index([("phone", 1)], unique=True)
+        self.collection.create_index([("expires_at", 1)], expireAfterSeconds=0)
+
+    def issue(self, phone):
+        now = datetime.datetime.utcnow()
+        entry = self.collection.find_one({"phone": phone})
+        sends, window_start = 0, now
+        if entry:
+            if entry.get("window_start") and (now - entry["window_start"]).total_seconds() < self.send_window_seconds:
+                sends, window_start = entry.get("sends", 0), entry["window_start"]
+            wait = self.send_wait(
+                now.timestamp(),
+                sends,
+                window_start.timestamp(),
+                entry["last_sent_at"].timestamp() if entry.get("last_sent_at") else None
+            )
+            if wait:
+                raise OtpRateLimited(wait)
+        otp = _generate()
+        document = {
+            "digest": _digest(phone, otp),
+            "otp_expires_at": now + datetime.timedelta(seconds=self.ttl_seconds),
+            "attempts": 0,
+            "sends": sends + 1,
+            "window_start": window_start,
+            "last_sent_at": now,
+            "expires_at": now + datetime.timedelta(seconds=max(self.ttl_seconds, self.send_window_seconds))
+        }
+        # Compare-and-set on the state we read, so two workers cannot both pass the limit
+        if entry:
+            result = self.collection.update_one(
+                {"_id": entry["_id"], "last_sent_at": entry.get("last_sent_at"), "sends": entry.get("sends")},
+                {"$set": document}
+            )
+            if not result.matched_count:
+                raise OtpRateLimited(self.resend_seconds)
+        else:
+            try:
+                self.collection.insert_one({"phone": phone, **document})
+            except DuplicateKeyError:
+                raise OtpRateLimited(self.resend_seconds)
+        return otp
+
+    def verify(self, phone, otp):
+        now = datetime.datetime.utcnow()
+        entry = self.collection.find_one_and_update(
+            {"phone": phone, "digest": {"$ne": None}, "otp_expires_at": {"$gt": now}, "attempts": {"$lt": self.max_attempts}},
+            {"$inc": {"attempts": 1}},
+            return_document=ReturnDocument.AFTER
+        )
+        if entry is None:
+            locked = self.collection.find_one(
+                {"phone": phone, "otp_expires_at": {"$gt": now}, "attempts": {"$gte": self.max_attempts}},
+                {"_id": 1}
+            )
+            return OTP_LOCKED if locked else OTP_EXPIRED
+        return OTP_VALID if hmac.compare_digest(entry["digest"], _digest(phone, otp)) else OTP_INVALID
+
+    def consume(self, phone):
+        self.collection.delete_one({"phone": phone})
+
+
+def create_otp_store(collection=None):
+    if os.getenv("OTP_STORE", "mongo") == "memory" or collection is None:
+        return MemoryOtpStore()
+    return MongoOtpStore(collection)
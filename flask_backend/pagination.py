@@ -0,0 +1,147 @@
+import base64
+import datetime
+import json
+import logging
+import os
+
+from bson import ObjectId
+from flask import Response, current_app, jsonify
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", 100))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", 1000))
+ORDERS = ("_id", "created_at", "created_at_asc")
+
+
+def encode_cursor(doc, order):
+    payload = {"i": str(doc["_id"])}
+    if order != "_id":
+        created_at = doc.get("created_at")
+        payload["c"] = created_at.isoformat() if isinstance(created_at, datetime.datetime) else None
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        created_at = payload.get("c")
+        return ObjectId(payload["i"]), datetime.datetime.fromisoformat(created_at) if created_at else None
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+# Parsed ?limit=&after=&fields=&order=&format= arguments of a list endpoint
+class ListArgs:
+    def __init__(self, args, allowed_fields, default_fields, default_order="_id"):
+        self.paginated = "limit" in args or "after" in args
+        try:
+            self.limit = min(int(args.get("limit", DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+        except ValueError:
+            raise ValueError("limit must be an integer")
+        if self.limit <= 0:
+            raise ValueError("limit must be positive")
+        self.order = args.get("order", default_order)
+        if self.order not in ORDERS:
+            raise ValueError(f"order must be one of {', '.join(ORDERS)}")
+        self.after = decode_cursor(args["after"]) if args.get("after") else None
+        self.stream = args.get("format") == "ndjson"
+        requested = [field.strip() for field in args.get("fields", "").split(",") if field.strip()]
+        unknown = [field for field in requested if field not in allowed_fields]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        self.fields = requested or list(default_fields)
+
+    def projection(self):
+        projection = {field: 1 for field in self.fields}
+        projection["_id"] = 1
+        if self.order != "_id":
+            projection["created_at"] = 1
+        return projection
+
+    # Legacy documents without created_at sort before every date in MongoDB, so the keyset treats
+    # a missing created_at as the lowest value rather than comparing dates against None
+    def query(self, base_query):
+        if not self.after:
+            return base_query
+        after_id, after_created_at = self.after
+        if self.order == "_id":
+            keyset = {"_id": {"$gt": after_id}}
+        elif self.order == "created_at_asc":
+            if after_created_at is None:
+                keyset = {"$or": [
+                    {"created_at": None, "_id": {"$gt": after_id}},
+                    {"created_at": {"$ne": None}}
+                ]}
+            else:
+                keyset = {"$or": [
+                    {"created_at": {"$gt": after_created_at}},
+                    {"created_at": after_created_at, "_id": {"$gt": after_id}}
+                ]}
+        elif after_created_at is None:
+            keyset = {"created_at": None, "_id": {"$lt": after_id}}
+        else:
+            keyset = {"$or": [
+                {"created_at": {"$lt": after_created_at}},
+                {"created_at": after_created_at, "_id": {"$lt": after_id}},
+                {"created_at": None}
+            ]}
+        return {"$and": [base_query, keyset]} if base_query else keyset
+
+    def sort(self):
+        if self.order == "_id":
+            return [("_id", 1)]
+        if self.order == "created_at_asc":
+            return [("created_at", 1), ("_id", 1)]
+        return [("created_at", -1), ("_id", -1)]
+
+
+def serialize_document(doc, fields):
+    item = {}
+    for field in fields:
+        if field not in doc:
+            continue
+        value = doc[field]
+        if isinstance(value, ObjectId):
+            value = str(value)
+        elif isinstance(value, datetime.datetime):
+            value = value.isoformat()
+        item[field] = value
+    return item
+
+
+# Serve a list endpoint as a streamed JSON array, a keyset page, or NDJSON
+def list_response(collection, base_query, list_args):
+    cursor = collection.find(list_args.query(base_query), list_args.projection()).sort(list_args.sort())
+    dumps = current_app.json.dumps
+    fields = list_args.fields
+
+    if list_args.paginated and not list_args.stream:
+        # Fetch one extra document to know whether another page exists
+        docs = list(cursor.limit(list_args.limit + 1))
+        has_more = len(docs) > list_args.limit
+        docs = docs[:list_args.limit]
+        next_cursor = encode_cursor(docs[-1], list_args.order) if has_more and docs else None
+        return jsonify({"items": [serialize_document(doc, fields) for doc in docs], "next_cursor": next_cursor})
+
+    if list_args.stream:
+        # A paginated stream ends with a {"next_cursor": ...} line when another page exists
+        if list_args.paginated:
+            cursor = cursor.limit(list_args.limit + 1)
+
+        def generate():
+            last = None
+            for i, doc in enumerate(cursor):
+                if list_args.paginated and i == list_args.limit:
+                    yield dumps({"next_cursor": encode_cursor(last, list_args.order)}) + "\n"
+                    return
+                last = doc
+                yield dumps(serialize_document(doc, fields)) + "\n"
+        return Response(generate(), mimetype="application/x-ndjson")
+
+    def generate_array():
+        yield "["
+        for i, doc in enumerate(cursor):
+            yield ("," if i else "") + dumps(serialize_document(doc, fields))
+        yield "]"
+    return Response(generate_array(), mimetype="application/json")
@@ -0,0 +1,51 @@
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from inference import IMAGE_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+# Decodes uploads straight from memory at reduced JPEG scale and persists originals off the request thread
+class ImagePreprocessor:
+    def __init__(self, image_size=IMAGE_SIZE, max_writers=None):
+        self.image_size = image_size
+        self._writer = ThreadPoolExecutor(
+            max_workers=max_writers or int(os.getenv("UPLOAD_WRITER_THREADS", 4)),
+            thread_name_prefix="upload-writer"
+        )
+
+    def allocate(self, count=None):
+        shape = (self.image_size[1], self.image_size[0], 3)
+        return np.empty(shape if count is None else (count, *shape), dtype=np.float32)
+
+    # draft() lets libjpeg decode at 1/2, 1/4 or 1/8 scale, never below the target size
+    def decode(self, data, out=None):
+        if out is None:
+            out = self.allocate()
+        with Image.open(io.BytesIO(data)) as img:
+            img.draft("RGB", self.image_size)
+            img = img.convert("RGB").resize(self.image_size, Image.NEAREST)
+            np.divide(np.asarray(img), np.float32(255.0), out=out)
+        return out
+
+    # The write overlaps decoding and inference; wait on the returned future before storing anything
+    # that references file_path, since a failed write surfaces there as OSError
+    def save_async(self, data, file_path):
+        return self._writer.submit(self._write, data, file_path)
+
+    def _write(self, data, file_path):
+        try:
+            with open(file_path, "wb") as f:
+                f.write(data)
+        except OSError as e:
+            logger.error(f"Failed to write upload {file_path}: {str(e)}")
+            raise
+
+    def shutdown(self):
+        self._writer.shutdown(wait=True)
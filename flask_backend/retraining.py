@@ -0,0 +1,166 @@
+import copy
+import datetime
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+from sklearn.linear_model import SGDClassifier
+from sklearn.preprocessing import StandardScaler
+
+logger = logging.getLogger(__name__)
+
+RISK_STATUSES = ["leakage", "pollution", "scarcity"]
+CLASSES = np.array([0, 1])
+
+
+# Build the feature matrix and labels used by the predictive maintenance model
+def report_features(reports):
+    X = np.array([[r["latitude"], r["longitude"]] for r in reports], dtype=float)
+    y = np.array([1 if r.get("status") in RISK_STATUSES else 0 for r in reports])
+    return X, y
+
+
+# Whether moving a report from one status to another flips its training label
+def label_changed(old_status, new_status):
+    return (old_status in RISK_STATUSES) != (new_status in RISK_STATUSES)
+
+
+# Incrementally trains the predictive maintenance model on new reports in the background
+class PredictiveRetrainer:
+    def __init__(self, collection, on_update, batch_size=None, debounce_seconds=None, interval_seconds=None):
+        self.collection = collection
+        self.on_update = on_update
+        self.batch_size = batch_size or int(os.getenv("PREDICTIVE_RETRAIN_BATCH_SIZE", 1000))
+        self.debounce_seconds = debounce_seconds if debounce_seconds is not None else float(os.getenv("PREDICTIVE_RETRAIN_DEBOUNCE_SECONDS", 30))
+        self.interval_seconds = interval_seconds if interval_seconds is not None else float(os.getenv("PREDICTIVE_RETRAIN_INTERVAL_SECONDS", 300))
+        self._model = None
+        self._scaler = None
+        self._last_id = None
+        self._fitted_at = None
+        self._class_counts = np.zeros(2, dtype=int)
+        self._version = 0
+        self._trained_at = None
+        self._train_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # A report whose status changed since the last fit carries a label the model learned differently;
+    # partial_fit cannot unlearn it, so any such change triggers a full refit. Status updates that flip
+    # the label stamp label_updated_at, which makes relabels from every worker process visible here.
+    def _relabelled_since(self, since):
+        return since is None or self.collection.find_one({"label_updated_at": {"$gt": since}}, {"_id": 1}) is not None
+
+    # Fit the current model on every report inserted since the last run and publish the result;
+    # refit from scratch when an existing report was relabelled
+    def train_once(self):
+        with self._train_lock:
+            try:
+                started = datetime.datetime.utcnow()
+                full = self._model is None or self._relabelled_since(self._fitted_at)
+                query = {"latitude": {"$exists": True}, "longitude": {"$exists": True}}
+                if not full and self._last_id is not None:
+                    query["_id"] = {"$gt": self._last_id}
+                cursor = self.collection.find(
+                    query, {"latitude": 1, "longitude": 1, "status": 1}
+                ).sort("_id", 1).batch_size(self.batch_size)
+
+                # Train on copies so readers never see a half-updated model
+                if full:
+                    model = SGDClassifier(loss="log_loss", random_state=42)
+                    scaler = StandardScaler()
+                    class_counts = np.zeros(2, dtype=int)
+                    last_id = None
+                else:
+                    model = copy.deepcopy(self._model)
+                    scaler = copy.deepcopy(self._scaler)
+                    class_counts = self._class_counts.copy()
+                    last_id = self._last_id
+                new_rows = 0
+                batch = []
+                for report in cursor:
+                    batch.append(report)
+                    if len(batch) >= self.batch_size:
+                        self._fit_batch(model, scaler, batch, class_counts)
+                        new_rows += len(batch)
+                        last_id = batch[-1]["_id"]
+                        batch = []
+                if batch:
+                    self._fit_batch(model, scaler, batch, class_counts)
+                    new_rows += len(batch)
+                    last_id = batch[-1]["_id"]
+
+                if not new_rows:
+                    logger.debug("No new reports since last predictive model update")
+                    self._fitted_at = started
+                    return False
+                self._model, self._scaler = model, scaler
+                self._class_counts = class_counts
+                self._last_id = last_id
+                self._fitted_at = started
+                if class_counts.sum() < 2:
+                    logger.warning("Insufficient reports for model training")
+                    return False
+                if (class_counts == 0).any():
+                    logger.warning("Data contains only one class, cannot train model")
+                    return False
+                self._version += 1
+                self._trained_at = datetime.datetime.utcnow()
+                self.on_update(model, scaler)
+                logger.info(f"Predictive model v{self._version} trained on {new_rows} {'reports (full refit)' if full else 'new reports'}")
+                return True
+            except Exception as e:
+                logger.error(f"Error training predictive model: {str(e)}")
+                return False
+
+    def _fit_batch(self, model, scaler, batch, class_counts):
+        X, y = report_features(batch)
+        scaler.partial_fit(X)
+        model.partial_fit(scaler.transform(X), y, classes=CLASSES)
+        class_counts += np.bincount(y, minlength=2)
+
+    # Request a retrain; bursts of calls within the debounce window collapse into one run
+    def notify(self):
+        self._wake.set()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="predictive-retrainer", daemon=True)
+        self._thread.start()
+        logger.info("Predictive model retraining scheduler started")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            notified = self._wake.wait(self.interval_seconds)
+            # Wait for the report stream to go quiet, but never longer than one interval
+            deadline = time.monotonic() + self.interval_seconds
+            while notified and not self._stop.is_set():
+                self._wake.clear()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                notified = self._wake.wait(min(self.debounce_seconds, remaining))
+            if self._stop.is_set():
+                break
+            self.train_once()
+
+    def info(self):
+        return {
+            "available": self._version > 0,
+            "version": self._version,
+            "trained_at": self._trained_at.isoformat() if self._trained_at else None,
+            "samples_seen": int(self._class_counts.sum()),
+            "positive_samples": int(self._class_counts[1]),
+            "debounce_seconds": self.debounce_seconds,
+            "interval_seconds": self.interval_seconds
+        }
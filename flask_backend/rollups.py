@@ -0,0 +1,185 @@
+import datetime
+import logging
+import math
+import os
+from collections import defaultdict
+
+from pymongo import UpdateOne
+
+from geo import SENSOR_FIELDS
+from geo_index import KM_PER_DEGREE
+
+logger = logging.getLogger(__name__)
+
+CELL_DEGREES = float(os.getenv("ROLLUP_CELL_DEGREES", 0.01))
+RESOLUTIONS = ("hour", "day")
+
+
+def truncate(created_at, resolution):
+    if resolution == "hour":
+        return datetime.datetime(created_at.year, created_at.month, created_at.day, created_at.hour)
+    return datetime.datetime(created_at.year, created_at.month, created_at.day)
+
+
+def _summarize(bucket, fields=SENSOR_FIELDS):
+    count = bucket["count"]
+    stats = {"count": count}
+    for field in fields:
+        mean = bucket[f"{field}_sum"] / count
+        variance = max(bucket[f"{field}_sq"] / count - mean * mean, 0.0)
+        stats[field] = {
+            "mean": mean,
+            "min": bucket[f"{field}_min"],
+            "max": bucket[f"{field}_max"],
+            "std": math.sqrt(variance)
+        }
+    return stats
+
+
+# Per-geocell hourly and daily count/sum/min/max/sum-of-squares of each sensor field,
+# updated as readings are inserted so averages and trends never scan raw readings
+class QualityRollups:
+    def __init__(self, collection, readings_collection, cell_degrees=CELL_DEGREES,
+                 hourly_retention_days=None, raw_retention_days=None):
+        self.collection = collection
+        self.readings_collection = readings_collection
+        self.cell_degrees = cell_degrees
+        self.hourly_retention_days = hourly_retention_days or int(os.getenv("ROLLUP_HOURLY_RETENTION_DAYS", 90))
+        self.raw_retention_days = raw_retention_days or int(os.getenv("RAW_READING_RETENTION_DAYS", 30))
+
+    # Hourly rollups expire after hourly_retention_days, leaving the daily ones as the downsampled history.
+    # Streamed readings (the only ones with received_at) expire after raw_retention_days; predictions and
+    # simulations are looked up by id, so they are kept.
+    def ensure_indexes(self):
+        self.collection.create_index([("resolution", 1), ("cx", 1), ("cy", 1), ("bucket", 1)], unique=True)
+        self.collection.create_index([("resolution", 1), ("bucket", 1)])
+        self.collection.create_index(
+            [("bucket", 1)],
+            name="hourly_rollup_ttl",
+            expireAfterSeconds=self.hourly_retention_days * 86400,
+            partialFilterExpression={"resolution": "hour"}
+        )
+        self.readings_collection.create_index([("received_at", 1)], expireAfterSeconds=self.raw_retention_days * 86400)
+
+    def _cell(self, lat, lng):
+        return int(math.floor(lat / self.cell_degrees)), int(math.floor(lng / self.cell_degrees))
+
+    def _accumulate(self, buckets, reading):
+        try:
+            lat, lng = float(reading["latitude"]), float(reading["longitude"])
+            values = [float(reading[field]) for field in SENSOR_FIELDS]
+        except (KeyError, TypeError, ValueError):
+            return
+        created_at = reading.get("created_at") or datetime.datetime.utcnow()
+        cx, cy = self._cell(lat, lng)
+        for resolution in RESOLUTIONS:
+            bucket = buckets[(resolution, cx, cy, truncate(created_at, resolution))]
+            bucket["count"] += 1
+            for field, value in zip(SENSOR_FIELDS, values):
+                bucket[f"{field}_sum"] += value
+                bucket[f"{field}_sq"] += value * value
+                bucket[f"{field}_min"] = min(bucket.get(f"{field}_min", value), value)
+                bucket[f"{field}_max"] = max(bucket.get(f"{field}_max", value), value)
+
+    # Fold readings into their buckets; a batch touching one cell-hour becomes a single upsert
+    def record(self, readings):
+        buckets = defaultdict(lambda: defaultdict(float))
+        for reading in readings:
+            self._accumulate(buckets, reading)
+        if not buckets:
+            return
+        updates = []
+        for (resolution, cx, cy, start), bucket in buckets.items():
+            inc = {"count": int(bucket["count"])}
+            mins = {}
+            maxs = {}
+            for field in SENSOR_FIELDS:
+                inc[f"{field}_sum"] = bucket[f"{field}_sum"]
+                inc[f"{field}_sq"] = bucket[f"{field}_sq"]
+                mins[f"{field}_min"] = bucket[f"{field}_min"]
+                maxs[f"{field}_max"] = bucket[f"{field}_max"]
+            updates.append(UpdateOne(
+                {"resolution": resolution, "cx": cx, "cy": cy, "bucket": start},
+                {"$inc": inc, "$min": mins, "$max": maxs},
+                upsert=True
+            ))
+        try:
+            self.collection.bulk_write(updates, ordered=False)
+        except Exception as e:
+            logger.error(f"Failed to update quality rollups: {str(e)}")
+
+    # Recompute every bucket from the raw readings still on disk
+    def rebuild(self):
+        buckets = defaultdict(lambda: defaultdict(float))
+        projection = {"latitude": 1, "longitude": 1, "created_at": 1, **{field: 1 for field in SENSOR_FIELDS}}
+        for reading in self.readings_collection.find({"latitude": {"$type": "number"}}, projection):
+            self._accumulate(buckets, reading)
+        self.collection.delete_many({})
+        docs = []
+        for (resolution, cx, cy, start), bucket in buckets.items():
+            doc = {"resolution": resolution, "cx": cx, "cy": cy, "bucket": start}
+            doc.update(bucket)
+            doc["count"] = int(bucket["count"])
+            docs.append(doc)
+        if docs:
+            self.collection.insert_many(docs, ordered=False)
+        logger.info(f"Rebuilt {len(docs)} quality rollup buckets")
+
+    # Only on an empty collection: once raw readings have expired a rebuild would lose history
+    def rebuild_if_empty(self):
+        if not self.collection.find_one({}, {"_id": 1}):
+            self.rebuild()
+
+    def _match(self, lat, lng, radius_km, resolution, start, end):
+        lat_span = radius_km / KM_PER_DEGREE
+        lng_span = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+        min_cx, min_cy = self._cell(lat - lat_span, lng - lng_span)
+        max_cx, max_cy = self._cell(lat + lat_span, lng + lng_span)
+        match = {
+            "resolution": resolution,
+            "cx": {"$gte": min_cx, "$lte": max_cx},
+            "cy": {"$gte": min_cy, "$lte": max_cy}
+        }
+        bucket = {}
+        if start:
+            bucket["$gte"] = truncate(start, resolution)
+        if end:
+            bucket["$lte"] = end
+        if bucket:
+            match["bucket"] = bucket
+        return match
+
+    def _group(self, key):
+        group = {"_id": key, "count": {"$sum": "$count"}}
+        for field in SENSOR_FIELDS:
+            group[f"{field}_sum"] = {"$sum": f"${field}_sum"}
+            group[f"{field}_sq"] = {"$sum": f"${field}_sq"}
+            group[f"{field}_min"] = {"$min": f"${field}_min"}
+            group[f"{field}_max"] = {"$max": f"${field}_max"}
+        return group
+
+    # Sensor mean/min/max/std over the cells covering radius_km around a point, from the daily rollups.
+    # Returns None when there are no readings, like an empty neighbourhood search.
+    def neighbourhood_stats(self, lat, lng, radius_km=1, since=None):
+        rows = list(self.collection.aggregate([
+            {"$match": self._match(lat, lng, radius_km, "day", since, None)},
+            {"$group": self._group(None)}
+        ]))
+        if not rows or not rows[0]["count"]:
+            return None
+        return _summarize(rows[0])
+
+    # Per-bucket stats between start and end at hour or day resolution
+    def trend(self, lat, lng, radius_km=1, resolution="day", start=None, end=None):
+        rows = self.collection.aggregate([
+            {"$match": self._match(lat, lng, radius_km, resolution, start, end)},
+            {"$group": self._group("$bucket")},
+            {"$sort": {"_id": 1}}
+        ])
+        series = []
+        for row in rows:
+            if row["count"]:
+                stats = _summarize(row)
+                stats["bucket"] = row["_id"].isoformat()
+                series.append(stats)
+        return series
@@ -0,0 +1,33 @@
+import random
+
+
+# Random sensor reading, centred on a neighbourhood's recent means when stats (QualityRollups
+# neighbourhood_stats output) are given and skewed towards contamination when has_pollution
+def generate_sensor_data(stats=None, has_pollution=False):
+    ph = random.uniform(6.5, 8.5)
+    turbidity = random.uniform(0, 10)
+    temperature = random.uniform(15, 30)
+    conductivity = random.uniform(100, 1000)
+    if stats:
+        avg_ph = stats["ph"]["mean"]
+        avg_turbidity = stats["turbidity"]["mean"]
+        avg_temperature = stats["temperature"]["mean"]
+        avg_conductivity = stats["conductivity"]["mean"]
+        ph = random.uniform(max(0, avg_ph - 0.5), min(14, avg_ph + 0.5))
+        turbidity = random.uniform(max(0, avg_turbidity - 2), avg_turbidity + 2)
+        temperature = random.uniform(max(0, avg_temperature - 5), avg_temperature + 5)
+        conductivity = random.uniform(max(0, avg_conductivity - 100), avg_conductivity + 100)
+    if has_pollution:
+        ph = random.uniform(5.5, 7.0)
+        turbidity = random.uniform(10, 50)
+        conductivity = random.uniform(500, 1500)
+    ph = max(0, min(14, ph))
+    turbidity = max(0, min(100, turbidity))
+    temperature = max(0, min(100, temperature))
+    conductivity = max(0, min(2000, conductivity))
+    return {
+        "ph": round(ph, 2),
+        "turbidity": round(turbidity, 2),
+        "temperature": round(temperature, 2),
+        "conductivity": round(conductivity, 2)
+    }
@@ -0,0 +1,79 @@
+import os
+import statistics
+import threading
+import time
+from collections import Counter
+
+from pymongo import MongoClient
+
+from assignment import OfficerScheduler
+
+# Parallel report submissions against the old find_one + update_one assignment and
+# OfficerScheduler, on a throwaway database. An even split is max - min <= 1.
+OFFICERS = int(os.getenv("STRESS_OFFICERS", 10))
+THREADS = int(os.getenv("STRESS_THREADS", 32))
+ASSIGNMENTS_PER_THREAD = int(os.getenv("STRESS_ASSIGNMENTS_PER_THREAD", 50))
+
+
+def legacy_assign(officers):
+    officer = officers.find_one({}, sort=[("assigned_reports", 1)])
+    if officer:
+        officers.update_one({"_id": officer["_id"]}, {"$inc": {"assigned_reports": 1}})
+    return officer
+
+
+def reset(officers):
+    officers.delete_many({})
+    officers.insert_many([
+        {"name": f"Officer {i}", "email": f"officer{i}@example.com", "assigned_reports": 0, "open_reports": 0}
+        for i in range(OFFICERS)
+    ])
+
+
+def hammer(assign):
+    picks = Counter()
+    lock = threading.Lock()
+    barrier = threading.Barrier(THREADS)
+
+    def worker():
+        local = Counter()
+        barrier.wait()
+        for _ in range(ASSIGNMENTS_PER_THREAD):
+            officer = assign()
+            local[officer["name"]] += 1
+        with lock:
+            picks.update(local)
+
+    threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return picks, time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    client = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017/"), serverSelectionTimeoutMS=5000, maxPoolSize=THREADS)
+    db = client["WaterIssuesStress"]
+    officers = db["Officers"]
+    scheduler = OfficerScheduler(officers, db["WaterReports"])
+    scheduler.ensure_indexes()
+    officers.create_index([("assigned_reports", 1)])
+    total = THREADS * ASSIGNMENTS_PER_THREAD
+    try:
+        print(f"{THREADS} threads x {ASSIGNMENTS_PER_THREAD} assignments over {OFFICERS} officers ({total / OFFICERS:.0f} each if even)")
+        print(f"{'mode':>10} {'secs':>6} {'stored total':>13} {'min':>5} {'max':>5} {'stdev':>7}")
+        for mode, assign, field in (
+            ("legacy", lambda: legacy_assign(officers), "assigned_reports"),
+            ("atomic", lambda: scheduler.assign(), "open_reports")
+        ):
+            reset(officers)
+            picks, elapsed = hammer(assign)
+            # Lost updates show up as a stored total below the number of assignments made
+            stored = {doc["name"]: doc[field] for doc in officers.find({}, {"name": 1, field: 1})}
+            counts = list(stored.values())
+            print(f"{mode:>10} {elapsed:>6.2f} {sum(counts):>13} {min(counts):>5} {max(counts):>5} {statistics.pstdev(counts):>7.2f}")
+            print(f"{'':>10} returned by assign: {sorted(picks.values())}")
+    finally:
+        client.drop_database("WaterIssuesStress")
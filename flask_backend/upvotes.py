@@ -0,0 +1,72 @@
+import datetime
+import logging
+
+from pymongo import InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+UPVOTED = "upvoted"
+ALREADY_UPVOTED = "already_upvoted"
+REPORT_NOT_FOUND = "report_not_found"
+
+
+# One document per (report, user) upvote; the report keeps only the denormalized upvotes counter
+class UpvoteStore:
+    def __init__(self, collection, reports_collection):
+        self.collection = collection
+        self.reports_collection = reports_collection
+
+    def ensure_indexes(self):
+        self.collection.create_index([("report_id", 1), ("user_phone", 1)], unique=True)
+
+    # The unique insert is the idempotency gate: a concurrent double-click loses on the index,
+    # so only the winning insert increments the counter. Returns (status, report owner phone).
+    def upvote(self, report_id, user_phone):
+        try:
+            self.collection.insert_one({"report_id": report_id, "user_phone": user_phone, "created_at": datetime.datetime.utcnow()})
+        except DuplicateKeyError:
+            return ALREADY_UPVOTED, None
+        report = self.reports_collection.find_one_and_update(
+            {"_id": report_id},
+            {"$inc": {"upvotes": 1}},
+            projection={"user_phone": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if report is None:
+            self.collection.delete_one({"report_id": report_id, "user_phone": user_phone})
+            return REPORT_NOT_FOUND, None
+        return UPVOTED, report.get("user_phone")
+
+    # Move embedded upvoted_by arrays into the upvotes collection and drop them from the reports
+    def migrate(self, batch_size=500):
+        migrated = 0
+        cursor = self.reports_collection.find({"upvoted_by": {"$exists": True}}, {"upvoted_by": 1}, batch_size=batch_size)
+        inserts = []
+        report_updates = []
+        for report in cursor:
+            phones = list(dict.fromkeys(phone for phone in report.get("upvoted_by") or [] if phone))
+            now = datetime.datetime.utcnow()
+            inserts.extend(InsertOne({"report_id": report["_id"], "user_phone": phone, "created_at": now}) for phone in phones)
+            report_updates.append(UpdateOne(
+                {"_id": report["_id"]},
+                {"$set": {"upvotes": len(phones)}, "$unset": {"upvoted_by": ""}}
+            ))
+            if len(report_updates) >= batch_size:
+                migrated += self._apply(inserts, report_updates)
+                inserts, report_updates = [], []
+        migrated += self._apply(inserts, report_updates)
+        if migrated:
+            logger.info(f"Migrated upvotes out of {migrated} reports")
+
+    # Upvotes first, so a crash part-way leaves the arrays in place for the next run
+    def _apply(self, inserts, report_updates):
+        if inserts:
+            try:
+                self.collection.bulk_write(inserts, ordered=False)
+            except BulkWriteError as e:
+                if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                    raise
+        if report_updates:
+            self.reports_collection.bulk_write(report_updates, ordered=False)
+        return len(report_updates)
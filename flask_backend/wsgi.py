@@ -0,0 +1,18 @@
+import logging
+
+from app import app, client, model_registry, prepare_database
+
+logger = logging.getLogger(__name__)
+
+# Production entry point: gunicorn -c gunicorn.conf.py
+# With preload_app this module is imported once in the gunicorn master. Database preparation and
+# the fork-safe models (the quality forest, the predictive model) happen here, so every worker
+# shares them copy-on-write. The CNN and the background threads start per worker in post_fork.
+prepare_database()
+model_registry.preload()
+# MongoClient is not fork-safe: drop the master's pool and monitor threads so each worker
+# reopens its own connections on first use instead of inheriting them
+client.close()
+logger.info("Application preloaded for pre-fork serving")
+
+application = app